@@ -0,0 +1,304 @@
+"""
+Serviço HTTP assíncrono do Agente de Estudos: várias sessões e usuários sobre os mesmos recursos do processo
+
+Cada sessão pertence a um usuário (a memória é separada por usuário) e tem o seu próprio corpus de documentos.
+As perguntas passam por um controle de admissão: no máximo SERVICE_MAX_CONCURRENT em execução e
+SERVICE_MAX_QUEUE esperando; acima disso, ou após SERVICE_QUEUE_TIMEOUT na fila, a resposta é 503 com
+Retry-After, em vez de a requisição ficar pendurada até estourar o timeout do cliente.
+
+Uso (a partir da raiz do repositório):
+    uvicorn api_service:app --host 0.0.0.0 --port 8000
+    python api_service.py [--host 127.0.0.1] [--porta 8000]
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, File, HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+from config import (
+    SERVICE_MAX_CONCURRENT, SERVICE_MAX_QUEUE, SERVICE_QUEUE_TIMEOUT, SERVICE_MAX_UPLOADS, SERVICE_MAX_UPLOAD_MB,
+    SERVICE_SESSION_TTL
+)
+from corpus_index import CorpusIndex
+from pdf_source import PdfTooLarge, ScratchFull
+from resource_registry import ResourceRegistry, registry
+from telemetry import telemetry
+
+
+class Overloaded(Exception):
+    """Sem vaga nem lugar na fila: a requisição é recusada com 503"""
+
+
+class AdmissionController:
+    """Limita as requisições em execução e o tamanho da fila de espera"""
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        telemetry.count("servico_rejeitadas", fila=self.name, motivo=reason)
+        raise Overloaded(f"Serviço sobrecarregado ({self.name}: {reason})")
+
+    def check(self):
+        """Recusa na hora (sem reservar nada) quando não há vaga nem lugar na fila"""
+        if self._slots.locked() and self.waiting >= self.max_queue:
+            self._reject("fila_cheia")
+
+    @asynccontextmanager
+    async def slot(self):
+        self.check()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._reject("espera_esgotada")
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self._slots.release()
+
+    def stats(self) -> Dict:
+        return {"executando": self.running, "na_fila": self.waiting, "admitidas": self.admitted,
+                "rejeitadas": self.rejected, "limite": self.max_concurrent, "limite_fila": self.max_queue}
+
+
+@dataclass
+class Session:
+    session_id: str
+    user_id: str
+    corpus: CorpusIndex
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class NewSession(BaseModel):
+    usuario: str
+
+
+class Question(BaseModel):
+    pergunta: str
+    documentos: Optional[List[str]] = None
+
+
+class StudyService:
+    """Sessões, admissão e os handlers do serviço; os recursos pesados vêm do registro do processo"""
+
+    def __init__(self, resources: ResourceRegistry = registry):
+        self.resources = resources
+        self.sessions: Dict[str, Session] = {}
+        self.questions = AdmissionController("perguntas", SERVICE_MAX_CONCURRENT, SERVICE_MAX_QUEUE,
+                                             SERVICE_QUEUE_TIMEOUT)
+        self.uploads = AdmissionController("uploads", SERVICE_MAX_UPLOADS, SERVICE_MAX_UPLOADS, SERVICE_QUEUE_TIMEOUT)
+
+    @asynccontextmanager
+    async def lifespan(self, app: FastAPI):
+        # Carrega modelos, clientes e o grafo antes da primeira requisição
+        await asyncio.to_thread(self.resources.workflow)
+        expiry = asyncio.create_task(self._expire_sessions())
+        try:
+            yield
+        finally:
+            expiry.cancel()
+            memory_manager = self.resources.memory_manager()
+            if memory_manager.persistence is not None:
+                await asyncio.to_thread(memory_manager.persistence.flush, 10)
+
+    async def _expire_sessions(self):
+        while True:
+            await asyncio.sleep(min(60, SERVICE_SESSION_TTL))
+            limit = time.monotonic() - SERVICE_SESSION_TTL
+            for session_id in [s.session_id for s in self.sessions.values() if s.last_used < limit]:
+                self.close_session(session_id)
+
+    def session(self, session_id: str) -> Session:
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise HTTPException(404, "Sessão não encontrada")
+        session.last_used = time.monotonic()
+        return session
+
+    def create_session(self, user_id: str) -> Session:
+        corpus = CorpusIndex(self.resources.embedding_model())
+        session = Session(uuid.uuid4().hex, user_id, corpus)
+        self.sessions[session.session_id] = session
+        return session
+
+    def close_session(self, session_id: str):
+        session = self.sessions.pop(session_id, None)
+        if session is not None:
+            session.corpus.close()
+
+    async def add_document(self, session: Session, upload: UploadFile) -> Dict:
+        name = upload.filename or "upload.pdf"
+        async with self.uploads.slot():
+            # Lido do stream do upload: fica em memória, ou na área temporária gerenciada se for grande
+            processor = self.resources.document_processor()
+            try:
+                source = await asyncio.to_thread(processor.pdf_source, upload.file, name, SERVICE_MAX_UPLOAD_MB)
+            except PdfTooLarge as e:
+                raise HTTPException(413, str(e))
+            except ScratchFull as e:
+                raise Overloaded(str(e))
+            pdf_hash = source.sha256
+            if pdf_hash in session.corpus:
+                source.close()
+                return self._document_info(session.corpus.get(pdf_hash))
+            size = source.size
+            # Sessões que enviam o mesmo PDF compartilham o índice e a ingestão
+            lease = await asyncio.to_thread(self.resources.retriever_pool().acquire, pdf_hash, source)
+        document = session.corpus.add_document(pdf_hash, name, lease=lease, metadata={"tamanho_bytes": size})
+        return self._document_info(document)
+
+    @staticmethod
+    def _document_info(document) -> Dict:
+        job = document.job
+        status = "pronto" if job is None or job.done else "processando"
+        if job is not None and job.error is not None:
+            status = "erro"
+        return {"doc_id": document.doc_id, "nome": document.name, "status": status,
+                "progresso": 1.0 if job is None else job.progress, "chunks": document.chunk_count}
+
+    def _state(self, session: Session, question: Question) -> Dict:
+        if not len(session.corpus):
+            raise HTTPException(409, "A sessão ainda não tem documentos")
+        return {"pergunta": question.pergunta, "retriever": session.corpus.as_retriever(), "memoria": [],
+                "documentos": question.documentos, "resposta": "", "usuario": session.user_id}
+
+    async def answer(self, session: Session, question: Question) -> Dict:
+        state = self._state(session, question)
+        async with self.questions.slot():
+            run = await self.resources.workflow().arun(state, modo="http")
+        return {"resposta": run["resultado"].get("resposta", ""), "rota": run["rota"],
+                "cache_hit": bool(run["resultado"].get("cache_hit")), "ms_total": run["ms_total"],
+                "ms_por_no": run["ms_por_no"], "trace_id": run["trace_id"]}
+
+    async def stream_answer(self, session: Session, question: Question) -> StreamingResponse:
+        state = self._state(session, question)
+        # Verificada antes de responder, para o 503 sair como status e não no meio do stream. A vaga só é
+        # reservada dentro do gerador: se o cliente cair antes de o corpo começar, nada fica preso
+        self.questions.check()
+
+        async def events():
+            try:
+                async with self.questions.slot():
+                    answer_stream = self.resources.workflow().astream_answer(state)
+                    async for token in answer_stream:
+                        yield f"data: {json.dumps({'token': token}, ensure_ascii=False)}\n\n"
+                    done = {"fim": True, "cache_hit": bool(answer_stream.result.get("cache_hit")),
+                            "primeiro_token_ms": answer_stream.ttft_ms, "ms_total": answer_stream.total_ms,
+                            "trace_id": answer_stream.trace_id}
+                    yield f"data: {json.dumps(done)}\n\n"
+            except Overloaded as e:
+                # A fila encheu entre a verificação e o início do corpo
+                yield f"data: {json.dumps({'erro': str(e)}, ensure_ascii=False)}\n\n"
+            except Exception as e:
+                # Os cabeçalhos já saíram: a falha vira o último evento do stream em vez de cortar a conexão
+                print(f"[ERRO] Falha no stream da resposta: {e}")
+                yield f"data: {json.dumps({'erro': 'Falha ao gerar a resposta'}, ensure_ascii=False)}\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    def health(self) -> Dict:
+        return {
+            "sessoes": len(self.sessions),
+            "perguntas": self.questions.stats(),
+            "uploads": self.uploads.stats(),
+            "indices": self.resources.retriever_pool().stats(),
+            "area_temporaria": self.resources.document_processor().scratch.stats(),
+            "llm": self.resources.llm_service().stats(),
+            "persistencia": self.resources.memory_manager().persistence_stats(),
+            "recursos": self.resources.stats(),
+        }
+
+
+def create_app(resources: ResourceRegistry = registry) -> FastAPI:
+    service = StudyService(resources)
+    app = FastAPI(title="Agente de Estudos", lifespan=service.lifespan)
+    app.state.service = service
+
+    @app.exception_handler(Overloaded)
+    async def overloaded(request: Request, exc: Overloaded):
+        return JSONResponse({"erro": str(exc)}, status_code=503, headers={"Retry-After": "1"})
+
+    @app.post("/sessoes", status_code=201)
+    async def create_session(body: NewSession):
+        session = service.create_session(body.usuario)
+        return {"sessao": session.session_id, "usuario": session.user_id}
+
+    @app.delete("/sessoes/{session_id}", status_code=204)
+    async def close_session(session_id: str):
+        service.close_session(service.session(session_id).session_id)
+
+    @app.post("/sessoes/{session_id}/documentos", status_code=202)
+    async def upload_document(session_id: str, arquivo: UploadFile = File(...)):
+        return await service.add_document(service.session(session_id), arquivo)
+
+    @app.get("/sessoes/{session_id}/documentos")
+    async def list_documents(session_id: str):
+        return [service._document_info(d) for d in service.session(session_id).corpus.documents()]
+
+    @app.delete("/sessoes/{session_id}/documentos/{doc_id}", status_code=204)
+    async def remove_document(session_id: str, doc_id: str):
+        if not service.session(session_id).corpus.remove_document(doc_id):
+            raise HTTPException(404, "Documento não encontrado")
+
+    @app.post("/sessoes/{session_id}/perguntas")
+    async def ask(session_id: str, body: Question):
+        return await service.answer(service.session(session_id), body)
+
+    @app.post("/sessoes/{session_id}/perguntas/stream")
+    async def ask_stream(session_id: str, body: Question):
+        return await service.stream_answer(service.session(session_id), body)
+
+    @app.get("/sessoes/{session_id}/memorias")
+    async def memories(session_id: str, cursor: Optional[str] = None, limite: int = 20):
+        # Só o histórico do dono da sessão: o id do usuário nunca vem da URL
+        user_id = service.session(session_id).user_id
+        page = await asyncio.to_thread(resources.memory_manager().list_memories, cursor, limite, user_id=user_id)
+        return {"itens": page.items, "proximo_cursor": page.next_cursor}
+
+    @app.get("/saude")
+    async def health():
+        return service.health()
+
+    @app.get("/metricas", response_class=PlainTextResponse)
+    async def metrics():
+        return telemetry.prometheus_text()
+
+    return app
+
+
+app = create_app()
+
+
+def main():
+    import uvicorn
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8000)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.porta)
+
+
+if __name__ == "__main__":
+    main()
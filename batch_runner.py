@@ -0,0 +1,205 @@
+"""
+Modo em lote (sem interface): responde um arquivo JSONL de perguntas sobre PDFs com concorrência limitada
+
+Cada linha de entrada é {"id": ..., "pergunta": "...", "documentos": [...] (opcional)}; sem "id", vale o número
+da linha. As respostas vão para o JSONL de saída assim que ficam prontas, então uma execução interrompida
+pode ser retomada: os ids já respondidos com sucesso no arquivo de saída são pulados. As conversas do lote
+ficam na memória de um usuário próprio (--usuario, padrão lote-<data e hora>), e não na do usuário padrão.
+
+Uso (a partir da raiz do repositório):
+    python batch_runner.py --pdf apostila.pdf [--pdf outro.pdf] --perguntas faq.jsonl --saida respostas.jsonl
+                           [--concorrencia 4] [--sobrescrever] [--usuario lote-faq]
+    python batch_runner.py --indice <hash do PDF> --perguntas faq.jsonl --saida respostas.jsonl
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from corpus_index import CorpusIndex
+from index_cache import hash_pdf
+from resource_registry import ResourceRegistry, registry
+
+
+def read_questions(path: str) -> Iterator[Tuple[str, Dict]]:
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"pergunta": item}
+            yield str(item.get("id", line_number)), item
+
+
+def answered_ids(path: str) -> Set[str]:
+    """Ids já respondidos sem erro numa execução anterior (linha final truncada por queda é ignorada)"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    # Em binário: a linha truncada por uma queda pode terminar no meio de um caractere multibyte
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                record = json.loads(line.decode("utf-8"))
+            except ValueError:
+                continue
+            if "erro" not in record:
+                done.add(str(record["id"]))
+    return done
+
+
+def load_corpus(resources: ResourceRegistry, pdf_paths: List[str], index_keys: List[str]) -> CorpusIndex:
+    processor = resources.document_processor()
+    corpus = CorpusIndex(processor.embedding_model)
+    for path in pdf_paths:
+        pdf_hash = hash_pdf(path)
+        vectorstore, job = processor.start_ingestion(path, pdf_hash)
+        if job is not None:
+            job.wait()
+            if job.error is not None:
+                raise RuntimeError(f"Falha ao processar {path}: {job.error}")
+            vectorstore = job.vectorstore
+        corpus.add_document(pdf_hash, os.path.basename(path), vectorstore=vectorstore)
+    for key in index_keys:
+        # Aceita o hash do PDF (com as configurações atuais) ou a chave da entrada do cache
+        vectorstore = processor.index_cache.load(processor.index_cache.key_for(key), processor.embedding_model)
+        if vectorstore is None:
+            vectorstore = processor.index_cache.load(key, processor.embedding_model)
+        if vectorstore is None:
+            raise ValueError(f"Índice não encontrado no cache: {key}")
+        corpus.add_document(key, key[:12], vectorstore=vectorstore)
+    return corpus
+
+
+def default_user_id() -> str:
+    """Usuário de um lote: as perguntas e respostas não se misturam à memória do usuário padrão nem de outros lotes"""
+    return "lote-" + datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+
+
+class BatchRunner:
+    """Executa o grafo do WorkflowEngine sobre muitas perguntas, no máximo `concurrency` ao mesmo tempo"""
+
+    def __init__(self, engine, corpus: CorpusIndex, output_path: str, concurrency: int = 4,
+                 user_id: Optional[str] = None):
+        self.engine = engine
+        self.user_id = user_id or default_user_id()
+        self.corpus = corpus
+        self.output_path = output_path
+        self.concurrency = concurrency
+        self.latencies: List[float] = []
+        self.errors = 0
+        self._output = None
+
+    async def _answer(self, item_id: str, item: Dict) -> Dict:
+        state = {"pergunta": item["pergunta"], "retriever": self.corpus.as_retriever(), "memoria": [],
+                 "documentos": item.get("documentos"), "resposta": "", "usuario": self.user_id}
+        run = await self.engine.arun(state, modo="lote")
+        return {
+            "id": item_id,
+            "pergunta": item["pergunta"],
+            "resposta": run["resultado"].get("resposta", ""),
+            "rota": run["rota"],
+            "ms_total": run["ms_total"],
+            "ms_por_no": run["ms_por_no"],
+            "trace_id": run["trace_id"],
+            "concluido_em": datetime.now(timezone.utc).isoformat(),
+        }
+
+    def _write(self, record: Dict):
+        self._output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._output.flush()  # Cada resposta fica no disco antes da próxima: uma queda perde no máximo as em curso
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            entry = await queue.get()
+            if entry is None:
+                return
+            item_id, item = entry
+            try:
+                record = await self._answer(item_id, item)
+                self.latencies.append(record["ms_total"])
+            except Exception as e:
+                print(f"[ERRO] Pergunta {item_id}: {e}")
+                self.errors += 1
+                record = {"id": item_id, "pergunta": item.get("pergunta"), "erro": repr(e)}
+            self._write(record)
+
+    async def run(self, questions: Iterator[Tuple[str, Dict]], skip: Set[str]) -> Dict:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=2 * self.concurrency)
+        skipped = 0
+        start = time.perf_counter()
+        with open(self.output_path, "ab+") as raw:
+            if raw.tell():
+                raw.seek(-1, os.SEEK_END)
+                if raw.read(1) != b"\n":
+                    raw.write(b"\n")  # Linha truncada por uma queda: a próxima resposta começa numa nova
+        with open(self.output_path, "a", encoding="utf-8") as self._output:
+            workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.concurrency)]
+            for item_id, item in questions:
+                if item_id in skip:
+                    skipped += 1
+                    continue
+                await queue.put((item_id, item))
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        return self.report(time.perf_counter() - start, skipped)
+
+    def report(self, elapsed: float, skipped: int) -> Dict:
+        answered = len(self.latencies)
+        report = {
+            "respondidas": answered,
+            "erros": self.errors,
+            "puladas": skipped,
+            "concorrencia": self.concurrency,
+            "segundos": round(elapsed, 2),
+            "perguntas_por_minuto": round(answered / elapsed * 60, 2) if elapsed else 0.0,
+        }
+        if self.latencies:
+            ordered = sorted(self.latencies)
+            report.update({
+                "latencia_p50_ms": round(statistics.median(ordered), 1),
+                "latencia_p95_ms": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 1),
+            })
+        return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", action="append", default=[], help="PDF a consultar (pode repetir)")
+    parser.add_argument("--indice", action="append", default=[], help="Hash de PDF já indexado no cache")
+    parser.add_argument("--perguntas", required=True, help="JSONL de entrada")
+    parser.add_argument("--saida", required=True, help="JSONL de saída (anexado; ids já respondidos são pulados)")
+    parser.add_argument("--concorrencia", type=int, default=4)
+    parser.add_argument("--sobrescrever", action="store_true", help="Descarta a saída anterior em vez de retomar")
+    parser.add_argument("--usuario", default=None, help="Usuário dono da memória do lote (padrão: lote-<data e hora>)")
+    args = parser.parse_args(argv)
+    if not args.pdf and not args.indice:
+        parser.error("informe ao menos um --pdf ou --indice")
+
+    if args.sobrescrever and os.path.exists(args.saida):
+        os.remove(args.saida)
+    skip = answered_ids(args.saida)
+    if skip:
+        print(f"[DEBUG] Retomando: {len(skip)} perguntas já respondidas em {args.saida}")
+
+    corpus = load_corpus(registry, args.pdf, args.indice)
+    runner = BatchRunner(registry.workflow(), corpus, args.saida, args.concorrencia, args.usuario)
+    print(f"[DEBUG] Memória do lote no usuário {runner.user_id}")
+    report = asyncio.run(runner.run(read_questions(args.perguntas), skip))
+    memory_manager = registry.memory_manager()
+    if memory_manager.persistence is not None:
+        memory_manager.persistence.flush(30)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 1 if runner.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""
+Benchmark offline da aplicação: ingestão, latência por nó do grafo e latência ponta a ponta sob concorrência
+
+Roda sem rede: o LLM é o servidor falso compatível com OpenAI, o Mem0 é um cliente em processo, os embeddings
+são determinísticos por hashing e os PDFs são gerados na hora. Os caches vão para um diretório temporário.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_app [--paginas 5,25,100] [--sessoes 1,4,16] [--perguntas-por-sessao 5]
+                                   [--latencia-llm 0.3] [--tokens-por-s 40] [--latencia-mem0 0.05]
+                                   [--saida benchmarks/results/app.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+from benchmarks.fake_llm_server import FakeChatServer
+from benchmarks.fakes import WORDS, FakeMemoryClient, HashEmbeddings, generate_pdf
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _latency_summary(values):
+    return {
+        "n": len(values),
+        "p50_ms": round(_percentile(values, 50), 2),
+        "p95_ms": round(_percentile(values, 95), 2),
+        "p99_ms": round(_percentile(values, 99), 2),
+        "media_ms": round(statistics.mean(values), 2),
+    }
+
+
+def _questions(count, seed=0):
+    import random
+    rng = random.Random(seed)
+    templates = ["Explique o que é {} e {}", "Qual a relação entre {} e {}?", "Gere uma pergunta sobre {} e {}"]
+    return [rng.choice(templates).format(*rng.sample(WORDS, 2)) for _ in range(count)]
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def bench_ingestion(processor, workdir, page_counts):
+    results = []
+    for pages in page_counts:
+        path = generate_pdf(os.path.join(workdir, f"doc_{pages}p.pdf"), pages, seed=pages)
+        start = time.perf_counter()
+        vectorstore, job = processor.start_ingestion(path)
+        job.wait_first_batch()
+        first_batch_s = time.perf_counter() - start
+        job.wait()
+        if job.error is not None:
+            raise job.error
+        results.append({**job.stats(), "primeiro_lote_s": round(first_batch_s, 3)})
+    return results, job
+
+
+def bench_nodes(engine, retriever, questions):
+    """Tempo de cada nó: intervalo entre os eventos de atualização emitidos pelo grafo"""
+    per_node = {}
+    for question in questions:
+        state = {"pergunta": question, "retriever": retriever, "documentos": None, "memoria": [], "resposta": ""}
+        last = time.perf_counter()
+        for update in engine.graph.stream(state, stream_mode="updates"):
+            now = time.perf_counter()
+            for node in update:
+                per_node.setdefault(node, []).append((now - last) * 1000)
+            last = now
+    return {node: _latency_summary(values) for node, values in per_node.items()}
+
+
+def bench_concurrency(engine, retriever, sessions, questions_per_session):
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def session(index):
+        for question in _questions(questions_per_session, seed=1000 + index):
+            state = {"pergunta": question, "retriever": retriever, "documentos": None, "memoria": [], "resposta": ""}
+            start = time.perf_counter()
+            try:
+                engine.graph.invoke(state)
+            except Exception as e:
+                with lock:
+                    errors.append(repr(e))
+                continue
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    report = {"sessoes": sessions, "erros": len(errors), "perguntas_por_s": round(len(latencies) / elapsed, 2)}
+    if latencies:
+        report["latencia"] = _latency_summary(latencies)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paginas", default="5,25,100", help="Tamanhos dos PDFs gerados, em páginas")
+    parser.add_argument("--sessoes", default="1,4,16", help="Níveis de concorrência (sessões simultâneas)")
+    parser.add_argument("--perguntas-por-sessao", type=int, default=5)
+    parser.add_argument("--perguntas-por-no", type=int, default=10, help="Perguntas usadas na latência por nó")
+    parser.add_argument("--latencia-llm", type=float, default=0.3, help="Segundos até o primeiro token")
+    parser.add_argument("--tokens-por-s", type=float, default=40.0)
+    parser.add_argument("--tokens", type=int, default=120, help="Tokens por resposta do LLM falso")
+    parser.add_argument("--latencia-mem0", type=float, default=0.05, help="Segundos por chamada ao Mem0 falso")
+    parser.add_argument("--latencia-embedding", type=float, default=0.0, help="Segundos por texto embedado")
+    parser.add_argument("--saida", default=None, help="Arquivo JSON de resultados")
+    args = parser.parse_args()
+
+    server = FakeChatServer(latency=args.latencia_llm, tokens_per_s=args.tokens_por_s, tokens=args.tokens).start()
+    workdir = tempfile.mkdtemp(prefix="bench_app_")
+    # O config lê essas variáveis na importação: precisam estar definidas antes dos módulos do projeto
+    os.environ["LLM_ENDPOINT_URL"] = server.url
+    os.environ["INDEX_CACHE_DIR"] = os.path.join(workdir, "indices")
+    os.environ["EMBEDDING_STORE_PATH"] = os.path.join(workdir, "embeddings.sqlite")
+    os.environ["WRITE_BEHIND_JOURNAL"] = os.path.join(workdir, "memoria_pendente.jsonl")
+    os.environ["PDF_SCRATCH_DIR"] = os.path.join(workdir, "scratch")
+
+    from corpus_index import CorpusIndex
+    from document_processor import DocumentProcessor
+    from intent_router import IntentRouter
+    from llm_service import LLMService
+    from memory_backends import Mem0Backend
+    from memory_manager import MemoryManager
+    from workflow_engine import WorkflowEngine
+
+    processor = DocumentProcessor(HashEmbeddings(latency_per_text=args.latencia_embedding))
+    ingestion, job = bench_ingestion(processor, workdir, [int(p) for p in args.paginas.split(",")])
+
+    corpus = CorpusIndex(processor.embedding_model)
+    corpus.add_document("bench", "bench.pdf", job=job)
+    retriever = corpus.as_retriever()
+    mem0 = FakeMemoryClient(latency=args.latencia_mem0)
+    memory_manager = MemoryManager(backend=Mem0Backend(client=mem0))
+    llm_service = LLMService()
+    # Sem cache de respostas: cada pergunta percorre o fluxo inteiro
+    engine = WorkflowEngine(memory_manager, llm_service, IntentRouter(processor.embedding_model, llm_service))
+    engine.graph.invoke({"pergunta": "aquecimento", "retriever": retriever, "documentos": None,
+                         "memoria": [], "resposta": ""})
+
+    report = {
+        "commit": _commit(),
+        "data": datetime.now(timezone.utc).isoformat(),
+        "parametros": vars(args),
+        "ingestao": ingestion,
+        "latencia_por_no": bench_nodes(engine, retriever, _questions(args.perguntas_por_no)),
+        "concorrencia": [
+            bench_concurrency(engine, retriever, int(n), args.perguntas_por_sessao) for n in args.sessoes.split(",")
+        ],
+        "llm_requisicoes": server.requests,
+        "mem0_chamadas": mem0.calls,
+    }
+    if memory_manager.persistence is not None:
+        memory_manager.persistence.flush(10)
+        report["persistencia"] = memory_manager.persistence_stats()
+    server.stop()
+
+    output = args.saida or os.path.join(
+        RESULTS_DIR, f"bench_app_{report['commit'] or 'local'}_{datetime.now():%Y%m%d_%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"Resultados gravados em {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark do chunking: SemanticChunker do langchain_experimental contra o chunker vetorizado embutido
+
+Mede o tempo de chunking de um PDF gerado (ou de --pdf) em cada modo e confere se o chunker vetorizado, sem
+limites de tamanho, produz os mesmos cortes que o SemanticChunker. Sai com código 1 se a concordância ficar
+abaixo de --tolerancia. Os embeddings são os determinísticos por hashing, com custo por chamada e por texto
+configuráveis (o ganho do chunker vetorizado vem de fazer uma chamada por lote em vez de uma por página).
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_chunker [--paginas 200] [--pdf arquivo.pdf] [--latencia-chamada 0.02]
+                                       [--latencia-texto 0.0005] [--tolerancia 0.99]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from langchain_community.document_loaders import PyMuPDFLoader
+from langchain_experimental.text_splitter import SemanticChunker
+
+from benchmarks.bench_app import RESULTS_DIR, _commit
+from benchmarks.fakes import HashEmbeddings, generate_pdf
+from config import CHUNK_PERCENTILE
+from fast_chunker import FastSemanticChunker
+
+
+def _boundaries(chunks):
+    """Cortes como (página, texto acumulado até o corte), comparáveis entre chunkers"""
+    cuts, page, acc = set(), None, ""
+    for chunk in chunks:
+        if chunk.metadata.get("page") != page:
+            page, acc = chunk.metadata.get("page"), ""
+        acc += chunk.page_content
+        cuts.add((page, len(acc.split())))
+    return cuts
+
+
+def _run(name, chunker, pages, embeddings):
+    calls = embeddings.calls
+    start = time.perf_counter()
+    chunks = chunker.split_documents(pages)
+    elapsed = time.perf_counter() - start
+    return chunks, {
+        "modo": name,
+        "segundos": round(elapsed, 3),
+        "chunks": len(chunks),
+        "chamadas_embedding": embeddings.calls - calls,
+        "tamanho_medio": round(sum(len(c.page_content) for c in chunks) / max(len(chunks), 1), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paginas", type=int, default=200)
+    parser.add_argument("--pdf", default=None, help="PDF real em vez do gerado")
+    parser.add_argument("--latencia-chamada", type=float, default=0.02, help="Segundos fixos por chamada ao modelo")
+    parser.add_argument("--latencia-texto", type=float, default=0.0005, help="Segundos por texto embedado")
+    parser.add_argument("--tolerancia", type=float, default=0.99, help="Fração mínima de cortes iguais")
+    parser.add_argument("--saida", default=None, help="Arquivo JSON de resultados")
+    args = parser.parse_args()
+
+    pdf_path = args.pdf or generate_pdf(os.path.join(tempfile.mkdtemp(prefix="bench_chunker_"), "doc.pdf"),
+                                        args.paginas, seed=7)
+    pages = PyMuPDFLoader(pdf_path).load()
+    embeddings = HashEmbeddings(latency_per_text=args.latencia_texto, latency_per_call=args.latencia_chamada)
+
+    reference, baseline = _run("langchain", SemanticChunker(
+        embeddings, breakpoint_threshold_type="percentile", breakpoint_threshold_amount=CHUNK_PERCENTILE
+    ), pages, embeddings)
+    unbounded, fast = _run("semantico_sem_limites", FastSemanticChunker(
+        embeddings, min_chars=0, max_chars=0
+    ), pages, embeddings)
+    _, bounded = _run("semantico", FastSemanticChunker(embeddings), pages, embeddings)
+    _, window = _run("janela", FastSemanticChunker(mode="janela"), pages, embeddings)
+
+    expected, found = _boundaries(reference), _boundaries(unbounded)
+    agreement = len(expected & found) / max(len(expected | found), 1)
+    identical = [c.page_content for c in reference] == [c.page_content for c in unbounded]
+    results = [baseline, fast, bounded, window]
+    for result in results:
+        result["aceleracao"] = round(baseline["segundos"] / max(result["segundos"], 1e-9), 1)
+        print(f"{result['modo']:>22}: {result['segundos']:.3f} s · {result['chunks']} chunks · "
+              f"{result['chamadas_embedding']} chamadas · {result['aceleracao']}x")
+    print(f"Concordância dos cortes com o SemanticChunker: {agreement:.4f} (idênticos: {identical})")
+
+    report = {
+        "commit": _commit(),
+        "data": datetime.now(timezone.utc).isoformat(),
+        "parametros": {**vars(args), "paginas_lidas": len(pages)},
+        "resultados": results,
+        "concordancia_cortes": round(agreement, 4),
+        "chunks_identicos": identical,
+    }
+    output = args.saida or os.path.join(
+        RESULTS_DIR, f"bench_chunker_{report['commit'] or 'local'}_{datetime.now():%Y%m%d_%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Resultados gravados em {output}")
+    if agreement < args.tolerancia:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
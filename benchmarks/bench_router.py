@@ -0,0 +1,85 @@
+"""
+Benchmark do roteador de intenção local contra o classificador via LLM
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_router [--sem-llm] [--arquivo benchmarks/data/router_questions.jsonl]
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+from document_processor import DocumentProcessor
+from intent_router import IntentRouter
+
+DEFAULT_DATASET = os.path.join(os.path.dirname(__file__), "data", "router_questions.jsonl")
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _latency_summary(values):
+    return {
+        "p50_ms": round(_percentile(values, 50), 3),
+        "p95_ms": round(_percentile(values, 95), 3),
+        "media_ms": round(statistics.mean(values), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--arquivo", default=DEFAULT_DATASET, help="JSONL com campos 'pergunta' e 'rota'")
+    parser.add_argument("--sem-llm", action="store_true", help="Não chama o LLM (só compara com os rótulos)")
+    args = parser.parse_args()
+
+    with open(args.arquivo, encoding="utf-8") as f:
+        dataset = [json.loads(line) for line in f if line.strip()]
+
+    llm_service = None
+    if not args.sem_llm:
+        from llm_service import LLMService
+        llm_service = LLMService()
+
+    processor = DocumentProcessor()
+    router = IntentRouter(processor.embedding_model, llm_service)
+    router.route("aquecimento")  # Calcula os vetores dos protótipos fora da medição
+
+    local_latencies, llm_latencies = [], []
+    correct_local = agree_llm = correct_llm = 0
+    methods = {}
+    for item in dataset:
+        decision = router.route(item["pergunta"])
+        local_latencies.append(decision.latency_ms)
+        methods[decision.method] = methods.get(decision.method, 0) + 1
+        correct_local += decision.route == item["rota"]
+        if llm_service is not None:
+            start = time.perf_counter()
+            llm_route = llm_service.classify(item["pergunta"])
+            llm_latencies.append((time.perf_counter() - start) * 1000)
+            agree_llm += decision.route == llm_route
+            correct_llm += llm_route == item["rota"]
+
+    total = len(dataset)
+    report = {
+        "perguntas": total,
+        "roteador_local": {
+            "acuracia": round(correct_local / total, 3),
+            "metodos": methods,
+            "latencia": _latency_summary(local_latencies),
+        },
+    }
+    if llm_latencies:
+        report["classificador_llm"] = {
+            "acuracia": round(correct_llm / total, 3),
+            "latencia": _latency_summary(llm_latencies),
+        }
+        report["concordancia_local_llm"] = round(agree_llm / total, 3)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
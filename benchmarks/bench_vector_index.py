@@ -0,0 +1,109 @@
+"""
+Benchmark dos modos de índice vetorial: recall@k contra o flat exato, latência por busca, memória e tempo de construção
+
+Os vetores são sintéticos (clusters gaussianos normalizados, como embeddings de sentenças), então o teste roda
+sem modelo e em qualquer escala. Com --vetores arquivo.npy usa embeddings reais (matriz float32 n x d).
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_vector_index [--n 200000] [--dim 384] [--consultas 500] [--k 4]
+                                            [--modos flat,ivf,hnsw,pq,int8] [--saida benchmarks/results/indice.json]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import faiss
+import numpy as np
+
+from benchmarks.bench_app import RESULTS_DIR, _commit, _latency_summary
+from vector_index import INDEX_MODES, build_index, configure_search, index_bytes
+
+
+def synthetic_vectors(n: int, dim: int, clusters: int = 256, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _recall(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(row) & set(expected)) for row, expected in zip(found, truth))
+    return hits / truth.size
+
+
+def bench_mode(mode: str, vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int, workdir: str):
+    start = time.perf_counter()
+    index = build_index(vectors, mode)
+    build_s = time.perf_counter() - start
+    memory_mb = index_bytes(index) / 2**20
+
+    # Mesma leitura do cache de índices: arquivo em disco com memory-map
+    path = os.path.join(workdir, f"{mode}.faiss")
+    faiss.write_index(index, path)
+    index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    configure_search(index)
+
+    latencies, found = [], []
+    for query in queries:
+        t = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - t) * 1000)
+        found.append(ids[0])
+    return {
+        "modo": mode,
+        "recall_at_k": round(_recall(np.asarray(found), truth), 4),
+        "latencia": _latency_summary(latencies),
+        "memoria_mb": round(memory_mb, 2),
+        "arquivo_mb": round(os.path.getsize(path) / 2**20, 2),
+        "construcao_s": round(build_s, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=200000, help="Vetores no índice")
+    parser.add_argument("--dim", type=int, default=384, help="Dimensão (384 = all-MiniLM-L6-v2)")
+    parser.add_argument("--vetores", default=None, help="Arquivo .npy com embeddings reais (substitui --n/--dim)")
+    parser.add_argument("--consultas", type=int, default=500)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--modos", default=",".join(INDEX_MODES))
+    parser.add_argument("--saida", default=None, help="Arquivo JSON de resultados")
+    args = parser.parse_args()
+
+    vectors = np.load(args.vetores).astype(np.float32) if args.vetores else synthetic_vectors(args.n, args.dim)
+    rng = np.random.default_rng(1)
+    # Consultas próximas de vetores do índice, como perguntas sobre o conteúdo do documento
+    queries = vectors[rng.choice(len(vectors), args.consultas, replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+
+    workdir = tempfile.mkdtemp(prefix="bench_indice_")
+    results = []
+    for mode in args.modos.split(","):
+        result = bench_mode(mode, vectors, queries, truth, args.k, workdir)
+        results.append(result)
+        print(f"{mode:>5}: recall@{args.k} {result['recall_at_k']:.3f} · p50 {result['latencia']['p50_ms']:.3f} ms · "
+              f"p99 {result['latencia']['p99_ms']:.3f} ms · {result['memoria_mb']} MB · {result['construcao_s']} s")
+
+    report = {
+        "commit": _commit(),
+        "data": datetime.now(timezone.utc).isoformat(),
+        "parametros": {**vars(args), "n": len(vectors), "dim": int(vectors.shape[1])},
+        "resultados": results,
+    }
+    output = args.saida or os.path.join(
+        RESULTS_DIR, f"bench_indice_{report['commit'] or 'local'}_{datetime.now():%Y%m%d_%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Resultados gravados em {output}")
+
+
+if __name__ == "__main__":
+    main()
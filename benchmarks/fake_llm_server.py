@@ -0,0 +1,125 @@
+"""
+Servidor de chat falso compatível com OpenAI (/v1/chat/completions), com latência e taxa de tokens configuráveis
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.fake_llm_server [--porta 8001] [--latencia 0.3] [--tokens-por-s 40] [--tokens 120]
+    LLM_ENDPOINT_URL=http://127.0.0.1:8001/v1 streamlit run ...
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.fakes import WORDS
+
+
+class FakeChatServer:
+    """Responde chat completions com texto sintético; roda numa thread para os benchmarks"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.3,
+                 tokens_per_s: float = 40.0, tokens: int = 120):
+        self.latency = latency
+        self.tokens_per_s = tokens_per_s
+        self.tokens = tokens
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                server.requests += 1
+                server._respond(self, body)
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _answer_tokens(self, body):
+        limit = min(self.tokens, body.get("max_tokens") or self.tokens)
+        rng = random.Random(json.dumps(body.get("messages", []), sort_keys=True))
+        return [rng.choice(WORDS) + " " for _ in range(limit)]
+
+    def _respond(self, handler, body):
+        tokens = self._answer_tokens(body)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = body.get("model", "fake")
+        time.sleep(self.latency)
+        if not body.get("stream"):
+            time.sleep(len(tokens) / self.tokens_per_s)
+            payload = json.dumps({
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+            }).encode("utf-8")
+            handler.send_response(200)
+            handler.send_header("Content-Type", "application/json")
+            handler.send_header("Content-Length", str(len(payload)))
+            handler.end_headers()
+            handler.wfile.write(payload)
+            return
+
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+
+        def event(delta, finish_reason=None):
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            handler.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            handler.wfile.flush()
+
+        event({"role": "assistant", "content": ""})
+        for token in tokens:
+            time.sleep(1 / self.tokens_per_s)
+            event({"content": token})
+        event({}, "stop")
+        handler.wfile.write(b"data: [DONE]\n\n")
+        handler.wfile.flush()
+        handler.close_connection = True
+
+    def start(self) -> "FakeChatServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--porta", type=int, default=8001)
+    parser.add_argument("--latencia", type=float, default=0.3, help="Segundos até o primeiro token")
+    parser.add_argument("--tokens-por-s", type=float, default=40.0)
+    parser.add_argument("--tokens", type=int, default=120, help="Tokens por resposta")
+    args = parser.parse_args()
+    server = FakeChatServer(port=args.porta, latency=args.latencia, tokens_per_s=args.tokens_por_s, tokens=args.tokens)
+    print(f"Servidor falso em {server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Dublês locais para os benchmarks: memória Mem0 em processo, embeddings determinísticos e PDFs gerados
+"""
+import hashlib
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List
+
+import numpy as np
+import pymupdf
+from langchain_core.embeddings import Embeddings
+
+WORDS = (
+    "algoritmo dados memória processo sistema função variável energia célula molécula história economia "
+    "mercado teoria modelo análise método resultado hipótese experimento conceito estrutura rede grafo "
+    "vetor matriz probabilidade estatística física química biologia fotossíntese evolução revolução "
+    "império governo sociedade cultura linguagem gramática literatura filosofia ética lógica conjunto"
+).split()
+
+
+class HashEmbeddings(Embeddings):
+    """Embeddings por hashing de palavras: determinísticos, sem download e com alguma noção de similaridade"""
+
+    def __init__(self, size: int = 384, latency_per_text: float = 0.0, latency_per_call: float = 0.0):
+        self.size = size
+        self.latency_per_text = latency_per_text
+        self.latency_per_call = latency_per_call
+        self.calls = 0
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.size
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = float(np.linalg.norm(vector))
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        if self.latency_per_text or self.latency_per_call:
+            time.sleep(self.latency_per_call + self.latency_per_text * len(texts))
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class FakeMemoryClient:
+    """Substituto em processo do MemoryClient do Mem0, com latência configurável por chamada"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._memories: List[Dict] = []
+        self.calls: Dict[str, int] = {}
+
+    def _call(self, name: str):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def create(self, **kwargs):
+        self._call("create")
+
+    def add(self, messages, user_id, memory_id=None, **kwargs):
+        self._call("add")
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            for message in messages:
+                self._memories.append({
+                    "id": uuid.uuid4().hex, "user_id": user_id, "memory": message["content"],
+                    "role": message["role"], "created_at": now,
+                })
+
+    def search(self, query, user_id, memory_id=None, limit: int = 10, **kwargs):
+        self._call("search")
+        terms = set(re.findall(r"\w+", query.lower()))
+        with self._lock:
+            candidates = [m for m in self._memories if m["user_id"] == user_id]
+        scored = [(len(terms & set(re.findall(r"\w+", m["memory"].lower()))), m) for m in candidates]
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [m for _, m in scored[:limit]]
+
+    def get_all(self, filters=None, page: int = 1, page_size: int = 100, **kwargs):
+        self._call("get_all")
+        user_id = next((f["user_id"] for f in (filters or {}).get("AND", []) if "user_id" in f), None)
+        with self._lock:
+            items = [m for m in reversed(self._memories) if user_id is None or m["user_id"] == user_id]
+        start = (page - 1) * page_size
+        return {"results": items[start:start + page_size], "next": start + page_size < len(items) or None}
+
+
+def generate_pdf(path: str, pages: int, seed: int = 0, paragraphs_per_page: int = 6) -> str:
+    """Gera um PDF com texto sintético em português (frases curtas, vários parágrafos por página)"""
+    rng = random.Random(seed)
+    document = pymupdf.open()
+    for number in range(pages):
+        paragraphs = []
+        for _ in range(paragraphs_per_page):
+            sentences = []
+            for _ in range(rng.randint(2, 4)):
+                words = rng.sample(WORDS, rng.randint(6, 12))
+                sentences.append(" ".join(words).capitalize() + rng.choice([".", ".", ".", "?"]))
+            paragraphs.append(" ".join(sentences))
+        page = document.new_page()
+        page.insert_textbox(pymupdf.Rect(50, 50, 545, 800), f"Capítulo {number + 1}\n\n" + "\n\n".join(paragraphs),
+                            fontsize=10)
+    document.save(path)
+    document.close()
+    return path
@@ -0,0 +1,199 @@
+"""
+Teste de carga do serviço HTTP (api_service.py): vazão sustentada, latência p50/p95/p99 e rejeições (503)
+
+Sem --url, sobe o serviço no próprio processo sobre dublês offline (LLM falso compatível com OpenAI, Mem0 em
+processo e embeddings por hashing, como no bench_app). Cada cliente abre uma sessão própria (usuários
+distintos), envia um PDF gerado, espera a ingestão e faz perguntas em sequência até acabar a duração.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.load_test [--clientes 8,32,128] [--duracao 20] [--paginas 10] [--stream]
+                                   [--latencia-llm 0.3] [--tokens-por-s 40]
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --clientes 16
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from benchmarks.bench_app import RESULTS_DIR, _commit, _latency_summary, _questions
+from benchmarks.fake_llm_server import FakeChatServer
+from benchmarks.fakes import FakeMemoryClient, HashEmbeddings, generate_pdf
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_local_service(args, workdir):
+    """Serviço em thread própria com os dublês registrados antes da primeira requisição; devolve (url, parar)"""
+    server = FakeChatServer(latency=args.latencia_llm, tokens_per_s=args.tokens_por_s, tokens=args.tokens).start()
+    # O config lê essas variáveis na importação: precisam estar definidas antes dos módulos do projeto
+    os.environ["LLM_ENDPOINT_URL"] = server.url
+    os.environ["INDEX_CACHE_DIR"] = os.path.join(workdir, "indices")
+    os.environ["EMBEDDING_STORE_PATH"] = os.path.join(workdir, "embeddings.sqlite")
+    os.environ["WRITE_BEHIND_JOURNAL"] = os.path.join(workdir, "memoria_pendente.jsonl")
+    os.environ["PDF_SCRATCH_DIR"] = os.path.join(workdir, "scratch")
+
+    import uvicorn
+    from api_service import create_app
+    from document_processor import DocumentProcessor
+    from memory_backends import Mem0Backend
+    from memory_manager import MemoryManager
+    from resource_registry import ResourceRegistry
+
+    resources = ResourceRegistry()
+    resources.provide("document_processor", DocumentProcessor(HashEmbeddings()))
+    resources.provide("memory_manager", MemoryManager(
+        backend=Mem0Backend(client=FakeMemoryClient(latency=args.latencia_mem0))
+    ))
+    port = _free_port()
+    service = uvicorn.Server(uvicorn.Config(create_app(resources), host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=service.run, daemon=True)
+    thread.start()
+    while not service.started:
+        if not thread.is_alive():
+            raise RuntimeError("O serviço não subiu")
+        time.sleep(0.05)
+
+    def stop():
+        service.should_exit = True
+        thread.join(30)
+        server.stop()
+    return f"http://127.0.0.1:{port}", stop
+
+
+async def _open_session(client: httpx.AsyncClient, user: str, pdf_bytes: bytes) -> str:
+    response = await client.post("/sessoes", json={"usuario": user})
+    response.raise_for_status()
+    session_id = response.json()["sessao"]
+    while True:
+        response = await client.post(f"/sessoes/{session_id}/documentos",
+                                     files={"arquivo": ("carga.pdf", pdf_bytes, "application/pdf")})
+        if response.status_code != 503:
+            break
+        await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+    response.raise_for_status()
+    while True:
+        documents = (await client.get(f"/sessoes/{session_id}/documentos")).json()
+        if all(d["status"] != "processando" for d in documents):
+            return session_id
+        await asyncio.sleep(0.2)
+
+
+async def _ask(client: httpx.AsyncClient, session_id: str, question: str, stream: bool) -> int:
+    body = {"pergunta": question}
+    if not stream:
+        return (await client.post(f"/sessoes/{session_id}/perguntas", json=body)).status_code
+    async with client.stream("POST", f"/sessoes/{session_id}/perguntas/stream", json=body) as response:
+        async for _ in response.aiter_lines():
+            pass
+        return response.status_code
+
+
+async def run_level(url: str, clients: int, duration: float, pdf_bytes: bytes, stream: bool) -> dict:
+    latencies, rejected, errors = [], 0, []
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=url, timeout=120, limits=limits) as client:
+        sessions = await asyncio.gather(*(
+            _open_session(client, f"carga-{clients}-{i}", pdf_bytes) for i in range(clients)
+        ))
+        deadline = time.perf_counter() + duration
+
+        async def user(index: int, session_id: str):
+            nonlocal rejected
+            for question in itertools.cycle(_questions(50, seed=index)):
+                if time.perf_counter() >= deadline:
+                    return
+                start = time.perf_counter()
+                try:
+                    status = await _ask(client, session_id, question, stream)
+                except httpx.HTTPError as e:
+                    errors.append(repr(e))
+                    continue
+                if status == 503:
+                    rejected += 1
+                    await asyncio.sleep(0.1)
+                elif status == 200:
+                    latencies.append((time.perf_counter() - start) * 1000)
+                else:
+                    errors.append(f"HTTP {status}")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user(i, s) for i, s in enumerate(sessions)))
+        elapsed = time.perf_counter() - start
+        health = (await client.get("/saude")).json()
+        for session_id in sessions:
+            await client.delete(f"/sessoes/{session_id}")
+    report = {
+        "clientes": clients,
+        "segundos": round(elapsed, 2),
+        "respondidas": len(latencies),
+        "requisicoes_por_s": round(len(latencies) / elapsed, 2),
+        "rejeitadas_503": rejected,
+        "erros": len(errors),
+        "exemplos_de_erro": sorted(set(errors))[:5],
+        "admissao": health.get("perguntas"),
+    }
+    if latencies:
+        report["latencia"] = _latency_summary(latencies)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="Serviço já em execução (sem isso, sobe um local com dublês)")
+    parser.add_argument("--clientes", default="8,32,128", help="Níveis de clientes simultâneos")
+    parser.add_argument("--duracao", type=float, default=20.0, help="Segundos de carga por nível")
+    parser.add_argument("--paginas", type=int, default=10, help="Páginas do PDF enviado por cada sessão")
+    parser.add_argument("--stream", action="store_true", help="Usa o endpoint de streaming (SSE)")
+    parser.add_argument("--latencia-llm", type=float, default=0.3, help="Segundos até o primeiro token")
+    parser.add_argument("--tokens-por-s", type=float, default=40.0)
+    parser.add_argument("--tokens", type=int, default=120, help="Tokens por resposta do LLM falso")
+    parser.add_argument("--latencia-mem0", type=float, default=0.05, help="Segundos por chamada ao Mem0 falso")
+    parser.add_argument("--saida", default=None, help="Arquivo JSON de resultados")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    url, stop = (args.url, None) if args.url else start_local_service(args, workdir)
+    with open(generate_pdf(os.path.join(workdir, "carga.pdf"), args.paginas, seed=3), "rb") as f:
+        pdf_bytes = f.read()
+    try:
+        levels = []
+        for clients in (int(c) for c in args.clientes.split(",")):
+            level = asyncio.run(run_level(url, clients, args.duracao, pdf_bytes, args.stream))
+            levels.append(level)
+            latency = level.get("latencia", {})
+            print(f"{clients:>4} clientes: {level['requisicoes_por_s']} req/s · p50 {latency.get('p50_ms')} ms · "
+                  f"p95 {latency.get('p95_ms')} ms · p99 {latency.get('p99_ms')} ms · "
+                  f"{level['rejeitadas_503']} rejeitadas · {level['erros']} erros")
+    finally:
+        if stop is not None:
+            stop()
+
+    report = {
+        "commit": _commit(),
+        "data": datetime.now(timezone.utc).isoformat(),
+        "parametros": vars(args),
+        "niveis": levels,
+    }
+    output = args.saida or os.path.join(
+        RESULTS_DIR, f"load_test_{report['commit'] or 'local'}_{datetime.now():%Y%m%d_%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Resultados gravados em {output}")
+
+
+if __name__ == "__main__":
+    main()
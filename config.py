@@ -22,12 +22,145 @@ LLM_REPO_ID = "google/gemma-3-12b-it"
 
 # Chunking
 CHUNK_PERCENTILE = 90
+# "semantico": chunker vetorizado embutido; "langchain": SemanticChunker do langchain_experimental;
+# "janela": janelas fixas de sentenças, sem embeddings no chunking (mais barato para documentos enormes)
+CHUNKER_MODE = "semantico"
+CHUNK_MIN_CHARS = 100  # Chunks menores são juntados ao vizinho da mesma página (0 = sem mínimo)
+CHUNK_MAX_CHARS = 3000  # Chunks maiores são repartidos em fim de sentença (0 = sem máximo)
+CHUNK_WINDOW_CHARS = 1000  # Tamanho das janelas no modo "janela"
 SEARCH_K = 4
+# "derivar": vetor do chunk = média dos vetores das sentenças já calculados no chunking
+# "embedar": embeda o texto de cada chunk novamente
+CHUNK_VECTOR_MODE = "derivar"
+
+# Ingestão
+INGEST_BATCH_PAGES = 16  # Páginas lidas, fatiadas e indexadas por lote
+# "streaming": leitura sequencial das páginas; "paralelo": extração e divisão em sentenças num pool de processos
+INGEST_MODE = "streaming"
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", os.cpu_count() or 1))
+EMBED_BATCH_SIZE = 32 * INGEST_WORKERS  # Textos por chamada ao modelo de embeddings
+# PDFs enviados são lidos direto da memória; os maiores que PDF_MEMORY_MAX_MB vão para a área temporária
+PDF_MEMORY_MAX_MB = 64
+PDF_SCRATCH_DIR = os.getenv("PDF_SCRATCH_DIR", "./cache/scratch")
+PDF_SCRATCH_MAX_MB = 4096  # Espaço total da área temporária; uploads grandes além disso são recusados
+PDF_SCRATCH_STALE_HOURS = 24  # Diretórios deixados por processos encerrados são removidos após esse tempo
+
+# Cache de índices
+INDEX_CACHE_DIR = os.getenv("INDEX_CACHE_DIR", "./cache/indices")
+INDEX_CACHE_MAX_MB = 2048
+EMBEDDING_STORE_PATH = os.getenv("EMBEDDING_STORE_PATH", "./cache/embeddings.sqlite")
+# Índices em memória compartilhados entre sessões (um por PDF); acima do orçamento, os menos usados
+# recentemente saem da RAM e são recarregados do cache em disco no próximo uso
+RETRIEVER_POOL_MAX_MB = float(os.getenv("RETRIEVER_POOL_MAX_MB", 1024))
+
+# Índice vetorial de cada documento
+# "flat": busca exata; "ivf": listas invertidas; "hnsw": grafo navegável; "pq": IVF com quantização de produto;
+# "int8": quantização escalar de 8 bits (busca exaustiva com 1/4 da memória)
+VECTOR_INDEX_MODE = os.getenv("VECTOR_INDEX_MODE", "flat")
+VECTOR_INDEX_MIN_VECTORS = 10000  # Shards menores ficam exatos: treinar e aproximar não compensa
+VECTOR_INDEX_TRAIN_SAMPLE = 50000  # Vetores sorteados para treinar IVF/PQ/int8
+VECTOR_INDEX_NLIST = 0  # Listas do IVF; 0 = 4 * sqrt(nº de vetores)
+VECTOR_INDEX_NPROBE = 16  # Listas visitadas por busca no IVF
+VECTOR_INDEX_HNSW_M = 32
+VECTOR_INDEX_HNSW_EF_SEARCH = 64
+VECTOR_INDEX_PQ_M = 48  # Bytes por vetor no PQ: subvetores do PQ (ajustado para um divisor da dimensão)
+
+# Busca híbrida: BM25 sobre os chunks + vetores, fundidos por reciprocal rank fusion (RRF)
+HYBRID_SEARCH_ENABLED = True
+HYBRID_LEXICAL_WEIGHT = 0.5  # Peso do ranking BM25 na fusão (0 = só vetores, 1 = só BM25)
+HYBRID_RRF_K = 60
+HYBRID_CANDIDATES = 5  # Cada ranking contribui com k * HYBRID_CANDIDATES candidatos para a fusão
+HYBRID_PREFILTER_MIN_CHUNKS = 200000  # Em shards maiores, a busca vetorial só olha os candidatos do BM25
+HYBRID_PREFILTER_CANDIDATES = 5000
+BM25_K1 = 1.2
+BM25_B = 0.75
 
 # LLM
 LLM_MAX_TOKENS = 1024
 LLM_DO_SAMPLE = False
-LLM_REPETITION_PENALTY = 1.03
+LLM_ENDPOINT_URL = os.getenv("LLM_ENDPOINT_URL")  # Endpoint compatível com OpenAI (ex.: http://127.0.0.1:8001/v1); None = HuggingFace
+# "huggingface" (Inference Providers), "openai" (servidor em LLM_ENDPOINT_URL: vLLM, servidor falso dos benchmarks...)
+# ou "ollama" (OLLAMA_URL). Prazo, tentativas, modelo reserva e resposta simples vêm de Config
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai" if LLM_ENDPOINT_URL else "huggingface")
+LLM_FALLBACK_BACKEND = os.getenv("LLM_FALLBACK_BACKEND", LLM_BACKEND)  # Onde roda Config.FALLBACK_MODEL_REPO_ID
+HF_CHAT_URL = "https://router.huggingface.co/v1"  # API de chat compatível com OpenAI do HuggingFace
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3")
+LLM_POOL_CONNECTIONS = 64  # Conexões keep-alive mantidas com cada backend
+LLM_CONNECT_TIMEOUT = 5  # Segundos para abrir a conexão (o resto do prazo fica para a resposta)
+LLM_RETRY_BACKOFF = 0.5  # Base (s) do backoff exponencial com jitter entre tentativas
+LLM_RETRY_BACKOFF_MAX = 8.0
+LLM_HEDGE_PERCENTILE = 0  # Ex.: 95 = sem resposta após o p95 recente do backend, dispara uma cópia da chamada (0 = desligado)
+LLM_HEDGE_MIN_SAMPLES = 20  # Latências observadas antes de o hedging começar a valer
+LLM_LATENCY_WINDOW = 200  # Latências recentes guardadas por backend
+
+# Roteamento
+ROUTER_MODE = "local"  # "local": regras + protótipos com embeddings; "llm": sempre classifica com o LLM
+ROUTER_MIN_SIMILARITY = 0.35  # Abaixo disso (ou da margem) o roteador local consulta o LLM
+ROUTER_MIN_MARGIN = 0.05
+
+# Coleta de contexto (chunks, histórico e idioma buscados em paralelo)
+CONTEXT_WORKERS = 8
+RETRIEVAL_TIMEOUT = 10.0  # segundos
+MEMORY_TIMEOUT = 3.0  # Mem0 lento vira "sem histórico"
+LANGDETECT_TIMEOUT = 1.0
+
+# Cache de respostas
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_ROUTES = ("explicar",)  # Rotas cujas respostas podem ser reaproveitadas
+RESPONSE_CACHE_MAX_ENTRIES = 1000
+RESPONSE_CACHE_TTL = 24 * 3600  # segundos
+RESPONSE_CACHE_SIMILARITY = 0.92  # Similaridade de cosseno mínima para o hit semântico
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "./cache/respostas.sqlite")  # None = só memória
+
+# Memória
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "mem0")  # "mem0" (hospedado) ou "local" (SQLite + vetores, offline)
+MEMORY_DB_PATH = os.getenv("MEMORY_DB_PATH", "./cache/memoria.sqlite")
+MEMORY_SEARCH_K = 10  # Memórias recentes mais parecidas devolvidas pelo backend local
+MEMORY_INDEX_MAX_USERS = 500  # Usuários com os vetores de memória mantidos em RAM pelo backend local (LRU)
+MEMORY_PAGE_SIZE = 20  # Itens por página na listagem de memórias
+
+# Persistência das conversas em segundo plano (write-behind)
+WRITE_BEHIND_ENABLED = True
+WRITE_BEHIND_BATCH_SIZE = 16  # Conversas gravadas por lote
+WRITE_BEHIND_FLUSH_INTERVAL = 0.5  # segundos de espera para juntar um lote
+WRITE_BEHIND_MAX_RETRIES = 3
+WRITE_BEHIND_BACKOFF = 0.5  # segundos; dobra a cada nova tentativa
+WRITE_BEHIND_JOURNAL = os.getenv("WRITE_BEHIND_JOURNAL", "./cache/memoria_pendente.jsonl")  # Base dos nomes dos journals
+WRITE_BEHIND_REPLAY_LOCK_STALE = 600  # segundos; um lock de reenvio mais antigo é de um processo que caiu
+
+# Empacotamento do contexto (chunks + histórico) no prompt
+CONTEXT_PACKING_ENABLED = True
+CONTEXT_TOKEN_BUDGET = 2048  # Tokens de contexto por prompt, sem contar o template
+CONTEXT_HISTORY_SHARE = 0.25  # Fração do orçamento reservada ao histórico
+CONTEXT_MMR_LAMBDA = 0.7  # 1.0 = só relevância; valores menores favorecem diversidade
+CONTEXT_REDUNDANCY_THRESHOLD = 0.8  # Similaridade lexical acima da qual o trecho é considerado repetido
+# Tokenizer do HuggingFace usado na contagem: por padrão o do modelo principal, baixado na inicialização dos
+# recursos. Se não carregar (offline, modelo restrito sem acesso pelo HF_TOKEN) ou com CONTEXT_TOKENIZER="",
+# a contagem é estimada por palavras e pontuação
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", LLM_REPO_ID) or None
+
+# Geração de perguntas
+QUESTION_MODE = "fanout"  # "fanout": N perguntas em chamadas paralelas sobre grupos de chunks; "unica": uma chamada
+QUESTION_MAX = 50  # Limite de perguntas por pedido
+QUESTION_FANOUT_PER_CALL = 3  # Perguntas pedidas em cada chamada ao LLM
+QUESTION_FANOUT_GROUP_SIZE = 3  # Chunks consecutivos em cada grupo amostrado
+QUESTION_FANOUT_WORKERS = 4  # Chamadas simultâneas ao LLM
+QUESTION_BANK_ENABLED = False  # Gera um banco de perguntas por documento ao fim da ingestão (consome cota do LLM)
+QUESTION_BANK_SIZE = 20
+QUESTION_BANK_DIR = os.getenv("QUESTION_BANK_DIR", "./cache/perguntas")
+
+# Serviço HTTP (api_service.py)
+SERVICE_MAX_CONCURRENT = 32  # Perguntas executando ao mesmo tempo
+SERVICE_MAX_QUEUE = 128  # Perguntas esperando vaga; acima disso o serviço responde 503
+SERVICE_QUEUE_TIMEOUT = 10.0  # Segundos máximos de espera na fila antes do 503
+SERVICE_MAX_UPLOADS = 4  # Ingestões iniciadas ao mesmo tempo
+SERVICE_MAX_UPLOAD_MB = 100
+SERVICE_SESSION_TTL = 3600  # Sessões sem uso por mais que isso (segundos) são descartadas
+
+# Telemetria
+TELEMETRY_ENABLED = True
+TELEMETRY_TRACE_PATH = os.getenv("TELEMETRY_TRACE_PATH")  # JSONL com um span por linha; None = só o último trace em memória
 
 # Outras configs
 MEMORY_DAYS_BACK = 7
@@ -45,8 +178,11 @@ class Config:
     MODEL_MAX_TOKENS = 128
     MODEL_REPETITION_PENALTY = 1.1
 
-    # Modelo de fallback (ainda menor)
-    FALLBACK_MODEL_REPO_ID = "gpt2"  # Tentar novamente
+    # Modelo reserva para o failover, servido pelo LLM_FALLBACK_BACKEND: precisa ser um modelo de chat. Fora do
+    # HuggingFace não há padrão (o servidor pode não ter o modelo); vazio desliga o failover
+    FALLBACK_MODEL_REPO_ID = os.getenv(
+        "LLM_FALLBACK_MODEL", "Qwen/Qwen2.5-7B-Instruct" if LLM_FALLBACK_BACKEND == "huggingface" else ""
+    )
     FALLBACK_MAX_TOKENS = 64
 
     # Configuração para API alternativa
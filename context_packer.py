@@ -0,0 +1,195 @@
+"""
+Empacotamento do contexto do prompt dentro de um orçamento de tokens
+"""
+import re
+import threading
+from dataclasses import dataclass
+from typing import List, Optional
+
+from langchain_core.documents import Document
+from config import (
+    CONTEXT_TOKEN_BUDGET, CONTEXT_HISTORY_SHARE, CONTEXT_MMR_LAMBDA, CONTEXT_REDUNDANCY_THRESHOLD,
+    CONTEXT_TOKENIZER, HF_TOKEN
+)
+from sentences import split_sentences
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+# Linhas de histórico mais curtas que isso nunca são tratadas como repetição (ex.: a pergunta do aluno)
+MIN_TERMS_FOR_DEDUP = 5
+
+
+class TokenCounter:
+    """Conta tokens com o tokenizer do modelo; sem ele (offline, modelo restrito), estima por palavras e pontuação"""
+
+    def __init__(self, model: Optional[str] = CONTEXT_TOKENIZER):
+        self.model = model
+        self._tokenizer = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            if self.model:
+                try:
+                    from transformers import AutoTokenizer
+                    self._tokenizer = AutoTokenizer.from_pretrained(self.model, token=HF_TOKEN)
+                except Exception as e:
+                    print(f"[DEBUG] Tokenizer de {self.model} indisponível ({e}); usando estimativa")
+            self._loaded = True
+
+    @property
+    def exact(self) -> bool:
+        self._load()
+        return self._tokenizer is not None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if not self._loaded:
+            self._load()
+        if self._tokenizer is not None:
+            return len(self._tokenizer.encode(text, add_special_tokens=False))
+        return len(_TOKEN_RE.findall(text))
+
+
+@dataclass
+class PackedContext:
+    docs: List[Document]
+    history: str
+    tokens_before: int
+    tokens_after: int
+    dropped_chunks: int = 0
+    truncated_chunks: int = 0
+    dropped_history_lines: int = 0
+
+
+def _terms(text: str) -> frozenset:
+    return frozenset(w.lower() for w in _WORD_RE.findall(text))
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _containment(part: frozenset, whole: frozenset) -> float:
+    """Fração dos termos de `part` que aparecem em `whole`"""
+    return len(part & whole) / len(part) if part else 1.0
+
+
+class ContextPacker:
+    """Escolhe chunks por MMR, remove histórico repetido e corta em fim de sentença para caber no orçamento
+
+    A similaridade é lexical (conjuntos de termos): não exige novas chamadas de embedding por pergunta.
+    """
+
+    def __init__(self, budget: int = CONTEXT_TOKEN_BUDGET, history_share: float = CONTEXT_HISTORY_SHARE,
+                 mmr_lambda: float = CONTEXT_MMR_LAMBDA, redundancy_threshold: float = CONTEXT_REDUNDANCY_THRESHOLD,
+                 counter: Optional[TokenCounter] = None):
+        self.budget = budget
+        self.history_share = history_share
+        self.mmr_lambda = mmr_lambda
+        self.redundancy_threshold = redundancy_threshold
+        self.counter = counter or TokenCounter()
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Maior prefixo de sentenças inteiras que cabe em max_tokens ("" se nem a primeira couber)"""
+        if self.counter.count(text) <= max_tokens:
+            return text
+        kept, used = [], 0
+        for sentence in split_sentences(text):
+            tokens = self.counter.count(sentence)
+            if used + tokens > max_tokens:
+                break
+            kept.append(sentence)
+            used += tokens
+        return " ".join(kept)
+
+    def _select_chunks(self, docs: List[Document], budget: int):
+        """MMR guloso: relevância pela ordem do retriever, penalidade pela semelhança com os já escolhidos"""
+        candidates = [(i, doc, _terms(doc.page_content)) for i, doc in enumerate(docs)]
+        relevance = {i: 1.0 - i / max(len(docs), 1) for i in range(len(docs))}
+        selected, selected_terms, used = [], [], 0
+        dropped = truncated = 0
+        while candidates and used < budget:
+            scored = []
+            for i, doc, terms in candidates:
+                redundancy = max((_jaccard(terms, other) for other in selected_terms), default=0.0)
+                score = self.mmr_lambda * relevance[i] - (1 - self.mmr_lambda) * redundancy
+                scored.append((score, redundancy, i, doc, terms))
+            score, redundancy, i, doc, terms = max(scored, key=lambda item: item[0])
+            candidates = [c for c in candidates if c[0] != i]
+            if redundancy >= self.redundancy_threshold:
+                dropped += 1
+                continue
+            tokens = self.counter.count(doc.page_content)
+            if used + tokens > budget:
+                content = self.truncate(doc.page_content, budget - used)
+                if not content:
+                    dropped += 1
+                    continue
+                doc = Document(page_content=content, metadata={**doc.metadata, "truncado": True})
+                tokens = self.counter.count(content)
+                truncated += 1
+            selected.append((i, doc))
+            selected_terms.append(terms)
+            used += tokens
+        dropped += len(candidates)
+        # Mantém a ordem de relevância original no prompt
+        selected.sort(key=lambda item: item[0])
+        return [doc for _, doc in selected], used, dropped, truncated
+
+    def _history_lines(self, history: str) -> List[str]:
+        lines, seen = [], []
+        for line in (l.strip() for l in history.splitlines()):
+            terms = _terms(line)
+            repeated = len(terms) >= MIN_TERMS_FOR_DEDUP and any(
+                _jaccard(terms, other) >= self.redundancy_threshold for other in seen
+            )
+            if not line or repeated:
+                continue
+            lines.append(line)
+            seen.append(terms)
+        return lines
+
+    def pack(self, docs: List[Document], history: str) -> PackedContext:
+        tokens_before = sum(self.counter.count(d.page_content) for d in docs) + self.counter.count(history)
+        history = history or ""
+        raw_lines = [l for l in history.splitlines() if l.strip()]
+        lines = self._history_lines(history)
+        history_tokens = sum(self.counter.count(l) for l in lines)
+        reserve = min(history_tokens, int(self.budget * self.history_share))
+
+        chosen, chunk_tokens, dropped, truncated = self._select_chunks(docs, self.budget - reserve)
+
+        # Histórico que só repete o conteúdo dos chunks escolhidos não acrescenta nada ao prompt
+        chunk_terms = frozenset().union(*(_terms(d.page_content) for d in chosen)) if chosen else frozenset()
+        kept, used = [], 0
+        history_budget = self.budget - chunk_tokens
+        for line in lines:
+            terms = _terms(line)
+            if len(terms) >= MIN_TERMS_FOR_DEDUP and _containment(terms, chunk_terms) >= self.redundancy_threshold:
+                continue
+            tokens = self.counter.count(line)
+            if used + tokens > history_budget:
+                line = self.truncate(line, history_budget - used)
+                if line:
+                    kept.append(line)
+                    used += self.counter.count(line)
+                break
+            kept.append(line)
+            used += tokens
+
+        return PackedContext(
+            docs=chosen,
+            history="\n".join(kept),
+            tokens_before=tokens_before,
+            tokens_after=chunk_tokens + used,
+            dropped_chunks=dropped,
+            truncated_chunks=truncated,
+            dropped_history_lines=len(raw_lines) - len(kept),
+        )
@@ -0,0 +1,246 @@
+"""
+Índice de corpus com vários documentos para o Agente de Estudos
+"""
+import hashlib
+import threading
+import time
+import weakref
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from config import (
+    SEARCH_K, HYBRID_SEARCH_ENABLED, HYBRID_LEXICAL_WEIGHT, HYBRID_RRF_K, HYBRID_CANDIDATES,
+    HYBRID_PREFILTER_MIN_CHUNKS, HYBRID_PREFILTER_CANDIDATES
+)
+from lexical_index import lexical_index_of, tokenize
+from vector_index import restricted_search_params
+
+
+@dataclass
+class CorpusDocument:
+    """Um documento do corpus e o seu shard FAISS (pronto, ainda em ingestão ou emprestado do RetrieverPool)"""
+    doc_id: str
+    name: str
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    vectorstore: Any = None
+    job: Any = None
+    added_at: float = field(default_factory=time.time)
+    lease: Any = None
+
+    def search(self, vector: List[float], k: int):
+        with self.job.lock if self.job is not None else nullcontext():
+            vectorstore = self._current_vectorstore()
+            if vectorstore is None:
+                return []
+            return vectorstore.similarity_search_with_score_by_vector(vector, k=k)
+
+    def _current_vectorstore(self):
+        if self.lease is not None:
+            return self.lease.vectorstore()
+        return self.job.vectorstore if self.job is not None else self.vectorstore
+
+    def hybrid_candidates(self, vector: List[float], terms: List[str], k: int):
+        """(ranking vetorial, ranking BM25) do shard, como listas de (posição, score, chunk)
+
+        Os chunks são resolvidos ainda sob o lock: depois dele o shard pode sair da RAM ou ser trocado. Em shards
+        com mais de HYBRID_PREFILTER_MIN_CHUNKS chunks, a busca vetorial fica restrita aos candidatos do BM25
+        (quando há candidatos suficientes).
+        """
+        with self.job.lock if self.job is not None else nullcontext():
+            vectorstore = self._current_vectorstore()
+            if vectorstore is None:
+                return [], []
+            lexical_index = lexical_index_of(vectorstore)
+            lexical = lexical_index.search(terms, k) if lexical_index is not None else []
+            allowed = None
+            if lexical_index is not None and vectorstore.index.ntotal > HYBRID_PREFILTER_MIN_CHUNKS:
+                prefilter = lexical_index.search(terms, HYBRID_PREFILTER_CANDIDATES)
+                if len(prefilter) >= k:
+                    allowed = np.fromiter((position for position, _ in prefilter), dtype=np.int64)
+            params = restricted_search_params(vectorstore.index, allowed) if allowed is not None else None
+            distances, ids = vectorstore.index.search(np.asarray([vector], dtype=np.float32), k, params=params)
+            dense = [(int(i), float(d)) for i, d in zip(ids[0], distances[0]) if i >= 0]
+            return self._with_chunks(vectorstore, dense), self._with_chunks(vectorstore, lexical)
+
+    @staticmethod
+    def _with_chunks(vectorstore, ranking):
+        return [(position, score, vectorstore.docstore.search(vectorstore.index_to_docstore_id[position]))
+                for position, score in ranking]
+
+    def chunks(self) -> List[Document]:
+        """Todos os chunks do shard, na ordem de indexação (ordem do documento)"""
+        with self.job.lock if self.job is not None else nullcontext():
+            vectorstore = self._current_vectorstore()
+            return self._chunks_of(vectorstore) if vectorstore is not None else []
+
+    @staticmethod
+    def _chunks_of(vectorstore) -> List[Document]:
+        return [vectorstore.docstore.search(vectorstore.index_to_docstore_id[i]) for i in range(vectorstore.index.ntotal)]
+
+    @property
+    def chunk_count(self) -> int:
+        if self.job is not None:
+            return self.job.chunks_done
+        if self.lease is not None:
+            return self.lease.chunk_count
+        return self.vectorstore.index.ntotal
+
+
+class CorpusIndex:
+    """Mantém um shard por documento: adicionar embeda só o novo documento e remover não exige reconstrução"""
+
+    def __init__(self, embedding_model):
+        self.embedding_model = embedding_model
+        self._lock = threading.Lock()
+        self._documents: Dict[str, CorpusDocument] = {}
+        # Sessões do Streamlit não avisam quando terminam: ao coletar o corpus, os índices voltam ao pool
+        weakref.finalize(self, CorpusIndex._release_leases, self._documents)
+
+    @staticmethod
+    def _release_leases(documents: Dict[str, CorpusDocument]):
+        for document in list(documents.values()):
+            if document.lease is not None:
+                document.lease.release()
+
+    def add_document(self, doc_id: str, name: str, vectorstore=None, job=None, metadata: Optional[Dict] = None,
+                     lease=None):
+        if sum(source is not None for source in (vectorstore, job, lease)) != 1:
+            raise ValueError("Informe exatamente um entre vectorstore, job e lease")
+        if lease is not None:
+            job = lease.job  # Só para acompanhar a ingestão; o índice vem sempre do pool
+        document = CorpusDocument(doc_id, name, metadata or {}, vectorstore=vectorstore, job=job, lease=lease)
+        with self._lock:
+            replaced = self._documents.get(doc_id)
+            self._documents[doc_id] = document
+        if replaced is not None and replaced.lease is not None:
+            replaced.lease.release()
+        return document
+
+    def remove_document(self, doc_id: str) -> bool:
+        with self._lock:
+            document = self._documents.pop(doc_id, None)
+        if document is not None and document.lease is not None:
+            document.lease.release()
+        return document is not None
+
+    def close(self):
+        """Remove todos os documentos, devolvendo ao pool os índices emprestados"""
+        with self._lock:
+            documents = dict(self._documents)
+            self._documents.clear()  # Em vez de trocar o dicionário: é o mesmo que o finalizador observa
+        self._release_leases(documents)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._documents
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def documents(self) -> List[CorpusDocument]:
+        with self._lock:
+            return sorted(self._documents.values(), key=lambda d: d.added_at)
+
+    def scope_key(self, doc_ids: Optional[List[str]] = None) -> Optional[str]:
+        """Identifica o conjunto de documentos consultado; None enquanto algum ainda está em ingestão"""
+        targets = self._targets(doc_ids)
+        if not targets or any(d.job is not None and not d.job.done for d in targets):
+            return None
+        return hashlib.sha256("|".join(sorted(d.doc_id for d in targets)).encode("utf-8")).hexdigest()
+
+    def _targets(self, doc_ids: Optional[List[str]]) -> List[CorpusDocument]:
+        with self._lock:
+            return sorted(
+                (d for d in self._documents.values() if doc_ids is None or d.doc_id in doc_ids),
+                key=lambda d: d.added_at
+            )
+
+    def get(self, doc_id: str) -> Optional[CorpusDocument]:
+        return self._documents.get(doc_id)
+
+    def chunks(self, doc_ids: Optional[List[str]] = None) -> List[Document]:
+        """Chunks de todos os documentos escolhidos, documento a documento"""
+        chunks = []
+        for document in self._targets(doc_ids):
+            chunks.extend(self._with_source(document, doc) for doc in document.chunks())
+        return chunks
+
+    def search(self, query: str, k: int = SEARCH_K, doc_ids: Optional[List[str]] = None) -> List[Document]:
+        """Busca nos documentos escolhidos (todos quando doc_ids é None) e mescla por distância"""
+        targets = self._targets(doc_ids)
+        if not targets:
+            return []
+        vector = self.embedding_model.embed_query(query)
+        if HYBRID_SEARCH_ENABLED:
+            return self._hybrid_search(targets, query, vector, k)
+        scored = []
+        for document in targets:
+            for doc, score in document.search(vector, k):
+                scored.append((float(score), self._with_source(document, doc)))
+        # Todos os shards usam distância L2 sobre o mesmo modelo, então os scores são comparáveis
+        scored.sort(key=lambda item: item[0])
+        return [doc for _, doc in scored[:k]]
+
+    @staticmethod
+    def _with_source(document: CorpusDocument, doc: Document) -> Document:
+        metadata = {**doc.metadata, "doc_id": document.doc_id, "documento": document.name}
+        return Document(page_content=doc.page_content, metadata=metadata)
+
+    def _hybrid_search(self, targets: List[CorpusDocument], query: str, vector: List[float], k: int,
+                       lexical_weight: float = HYBRID_LEXICAL_WEIGHT) -> List[Document]:
+        """Funde o ranking vetorial e o BM25 de todos os shards com reciprocal rank fusion ponderada"""
+        terms = tokenize(query)
+        n_candidates = k * HYBRID_CANDIDATES
+        dense: List[Tuple[float, CorpusDocument, int, Document]] = []
+        lexical: List[Tuple[CorpusDocument, int, int, Document]] = []
+        for document in targets:
+            shard_dense, shard_lexical = document.hybrid_candidates(vector, terms, n_candidates)
+            dense.extend((distance, document, position, chunk) for position, distance, chunk in shard_dense)
+            # Scores BM25 dependem do IDF de cada shard e não se comparam entre shards: entra a posição no shard
+            lexical.extend((document, rank, position, chunk)
+                           for rank, (position, _, chunk) in enumerate(shard_lexical[:n_candidates]))
+        dense.sort(key=lambda item: item[0])
+        fused: Dict[Tuple[str, int], float] = {}
+        chunks: Dict[Tuple[str, int], Document] = {}
+        owners: Dict[Tuple[str, int], CorpusDocument] = {}
+        ranked = [(1 - lexical_weight, rank, document, position, chunk)
+                  for rank, (_, document, position, chunk) in enumerate(dense[:n_candidates])]
+        ranked += [(lexical_weight, rank, document, position, chunk) for document, rank, position, chunk in lexical]
+        for weight, rank, document, position, chunk in ranked:
+            key = (document.doc_id, position)
+            fused[key] = fused.get(key, 0.0) + weight / (HYBRID_RRF_K + rank + 1)
+            chunks[key], owners[key] = chunk, document
+        best = sorted(fused, key=fused.get, reverse=True)[:k]
+        return [self._with_source(owners[key], chunks[key]) for key in best]
+
+    def as_retriever(self, doc_ids: Optional[List[str]] = None, k: int = SEARCH_K) -> "CorpusRetriever":
+        return CorpusRetriever(self, doc_ids, k)
+
+
+class CorpusRetriever:
+    """Retriever sobre o corpus inteiro ou sobre um subconjunto de documentos"""
+
+    def __init__(self, corpus: CorpusIndex, doc_ids: Optional[List[str]] = None, k: int = SEARCH_K):
+        self.corpus = corpus
+        self.doc_ids = doc_ids
+        self.k = k
+
+    def with_documents(self, doc_ids: Optional[List[str]]) -> "CorpusRetriever":
+        return CorpusRetriever(self.corpus, doc_ids, self.k)
+
+    def scope_key(self) -> Optional[str]:
+        return self.corpus.scope_key(self.doc_ids)
+
+    def document_ids(self) -> List[str]:
+        return [d.doc_id for d in self.corpus.documents() if self.doc_ids is None or d.doc_id in self.doc_ids]
+
+    def all_chunks(self) -> List[Document]:
+        return self.corpus.chunks(self.doc_ids)
+
+    def get_relevant_documents(self, query: str) -> List[Document]:
+        return self.corpus.search(query, k=self.k, doc_ids=self.doc_ids)
+
+    def invoke(self, query: str, **kwargs) -> List[Document]:
+        return self.get_relevant_documents(query)
@@ -1,39 +1,195 @@
+import numpy as np
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
-from langchain_community.document_loaders import PyMuPDFLoader
 from langchain_experimental.text_splitter import SemanticChunker
-from config import EMBEDDING_MODEL, CHUNK_PERCENTILE, SEARCH_K
+from langchain_core.documents import Document
+from config import (
+    EMBEDDING_MODEL, CHUNK_PERCENTILE, CHUNKER_MODE, SEARCH_K, CHUNK_VECTOR_MODE,
+    INGEST_BATCH_PAGES, INGEST_MODE, INGEST_WORKERS, EMBED_BATCH_SIZE
+)
+from embedding_store import CachedEmbeddings
+from index_cache import IndexCache
+from vector_index import compress_vectorstore
+from lexical_index import BM25Index, lexical_index_of
+from fast_chunker import FastSemanticChunker
+from sentences import split_sentences, combine_sentences
+from ingestion import IngestionJob
+from parallel_ingestion import iter_page_batches, extract_page_range, count_pages
+from pdf_source import PdfInput, PdfSource, ScratchArea, open_pdf_source
+from telemetry import telemetry
 
 class DocumentProcessor:
     """Processa PDF, faz chunking e cria retriever"""
-    def __init__(self):
-        print("[DEBUG] Inicializando HuggingFaceEmbeddings...")
-        try:
-            self.embedding_model = HuggingFaceEmbeddings(
-                model_name=EMBEDDING_MODEL,
-                model_kwargs={"trust_remote_code": True}
-            )
-            print("[DEBUG] Modelo de embeddings carregado com sucesso!")
-        except Exception as e:
-            print(f"[ERRO] Falha ao carregar HuggingFaceEmbeddings: {e}")
-            raise
-
-    def load_and_chunk(self, pdf_path: str):
-        print(f"[DEBUG] Carregando PDF: {pdf_path}")
-        loader = PyMuPDFLoader(pdf_path)
-        documents = loader.load()
-        print(f"[DEBUG] {len(documents)} documentos carregados.")
-        splitter = SemanticChunker(
+    def __init__(self, base_embedding_model=None):
+        if base_embedding_model is not None:
+            self.base_embedding_model = base_embedding_model
+        else:
+            print("[DEBUG] Inicializando HuggingFaceEmbeddings...")
+            try:
+                self.base_embedding_model = HuggingFaceEmbeddings(
+                    model_name=EMBEDDING_MODEL,
+                    model_kwargs={"trust_remote_code": True},
+                    encode_kwargs={"batch_size": EMBED_BATCH_SIZE}
+                )
+                print("[DEBUG] Modelo de embeddings carregado com sucesso!")
+            except Exception as e:
+                print(f"[ERRO] Falha ao carregar HuggingFaceEmbeddings: {e}")
+                raise
+        # Chunking e indexação compartilham o mesmo armazenamento de embeddings
+        self.embedding_model = CachedEmbeddings(self.base_embedding_model, EMBEDDING_MODEL)
+        self.index_cache = IndexCache()
+        self.scratch = ScratchArea()
+
+    def pdf_source(self, source: PdfInput, name: str = None, max_mb: float = None) -> PdfSource:
+        """PDF em memória (ou na área temporária, se for grande) a partir de caminho, bytes ou stream"""
+        return open_pdf_source(source, name, self.scratch, max_mb)
+
+    def _splitter(self):
+        if CHUNKER_MODE in ("semantico", "janela"):
+            return FastSemanticChunker(self.embedding_model, mode=CHUNKER_MODE)
+        return SemanticChunker(
             embeddings=self.embedding_model,
             breakpoint_threshold_type="percentile",
             breakpoint_threshold_amount=CHUNK_PERCENTILE
         )
-        chunks = splitter.split_documents(documents)
-        print(f"[DEBUG] {len(chunks)} chunks gerados.")
-        return chunks
+
+    def load_and_chunk(self, source: PdfInput):
+        source = self.pdf_source(source)
+        print(f"[DEBUG] Carregando PDF: {source.name}")
+        with telemetry.span("ingestao.chunking") as span:
+            documents = [Document(page_content=p["text"], metadata=p["metadata"])
+                         for p in extract_page_range(source, 0, count_pages(source))]
+            print(f"[DEBUG] {len(documents)} documentos carregados.")
+            chunks = self._splitter().split_documents(documents)
+            print(f"[DEBUG] {len(chunks)} chunks gerados.")
+            span.set(paginas=len(documents), chunks=len(chunks))
+            return chunks
+
+    def _page_batches(self, source: PdfSource, batch_pages: int):
+        """Gera (páginas, total de páginas) por lote, de forma sequencial ou com o pool de processos"""
+        workers = INGEST_WORKERS if INGEST_MODE == "paralelo" else 1
+        for pages, total_pages in iter_page_batches(source, batch_pages, workers):
+            if workers > 1:
+                # Embeda de uma vez as sentenças que o chunker vai pedir; no chunking elas já estarão no cache
+                combined = [c for p in pages for c in p["combined"]]
+                if combined:
+                    self.embedding_model.prefetch(combined)
+            yield [Document(page_content=p["text"], metadata=p["metadata"]) for p in pages], total_pages
+
+    def iter_chunk_batches(self, source: PdfInput, batch_pages: int = INGEST_BATCH_PAGES):
+        """Lê as páginas sob demanda e gera (chunks, vetores, páginas lidas, total de páginas) por lote"""
+        source = self.pdf_source(source)
+        print(f"[DEBUG] Ingestão ({INGEST_MODE}): {source.name} (lotes de {batch_pages} páginas)")
+        splitter = self._splitter()
+        pages_done = 0
+        for pages, total_pages in self._page_batches(source, batch_pages):
+            with telemetry.span("ingestao.lote", paginas=len(pages)) as span:
+                pages_done += len(pages)
+                chunks = splitter.split_documents(pages)
+                vectors = self.embed_chunks(chunks) if chunks else []
+                span.set(chunks=len(chunks))
+            yield chunks, vectors, pages_done, total_pages
+        print(f"[DEBUG] Ingestão concluída: {pages_done} páginas. Embeddings: {self.embedding_model.stats()}")
+
+    def embed_chunks(self, chunks):
+        """Vetores dos chunks, derivados dos vetores das sentenças quando CHUNK_VECTOR_MODE = "derivar" """
+        with telemetry.span("ingestao.embeddings", chunks=len(chunks), modo=CHUNK_VECTOR_MODE):
+            return self._embed_chunks(chunks)
+
+    def _embed_chunks(self, chunks):
+        if CHUNK_VECTOR_MODE != "derivar":
+            return self.embedding_model.embed_documents([c.page_content for c in chunks])
+
+        vectors = [None] * len(chunks)
+        # Chunks consecutivos da mesma página particionam a lista de sentenças daquela página
+        start = 0
+        while start < len(chunks):
+            page_key = (chunks[start].metadata.get("source"), chunks[start].metadata.get("page"))
+            end = start
+            while end < len(chunks) and (chunks[end].metadata.get("source"), chunks[end].metadata.get("page")) == page_key:
+                end += 1
+            group = chunks[start:end]
+            per_chunk = [split_sentences(c.page_content) for c in group]
+            sentences = [s for chunk_sentences in per_chunk for s in chunk_sentences]
+            sentence_vectors = self.embedding_model.lookup(combine_sentences(sentences))
+            if any(v is None for v in sentence_vectors):
+                group_vectors = self.embedding_model.embed_documents([c.page_content for c in group])
+            else:
+                group_vectors, offset = [], 0
+                for chunk_sentences in per_chunk:
+                    window = sentence_vectors[offset:offset + len(chunk_sentences)]
+                    mean = np.mean(np.asarray(window, dtype=np.float32), axis=0)
+                    # A média de vetores unitários fica mais curta: o FAISS compara por L2 com consultas unitárias,
+                    # então sem normalizar a ordem dos resultados mudaria em relação a embedar o texto do chunk
+                    group_vectors.append((mean / max(float(np.linalg.norm(mean)), 1e-12)).tolist())
+                    offset += len(chunk_sentences)
+                self.embedding_model.record_derived(len(group))
+            vectors[start:end] = group_vectors
+            start = end
+        return vectors
+
+    def build_vectorstore(self, chunks, vectors=None):
+        if vectors is None:
+            vectors = self.embed_chunks(chunks)
+        with telemetry.span("ingestao.indice", chunks=len(chunks)):
+            db_faiss = FAISS.from_embeddings(
+                list(zip([c.page_content for c in chunks], vectors)),
+                self.embedding_model,
+                metadatas=[c.metadata for c in chunks]
+            )
+            # Índice BM25 com as mesmas posições do FAISS, para a busca híbrida
+            db_faiss.lexical_index = BM25Index()
+            db_faiss.lexical_index.add(c.page_content for c in chunks)
+        print(f"[DEBUG] Embeddings: {self.embedding_model.stats()}")
+        return db_faiss
+
+    def finalize_vectorstore(self, db_faiss, lock=None):
+        """Converte o índice exato para o modo de VECTOR_INDEX_MODE e compacta o BM25 quando o documento termina
+
+        Com `lock` (o da ingestão), as estruturas novas são trocadas dentro dele: buscas durante a ingestão nunca
+        veem uma troca pela metade.
+        """
+        lexical_index = lexical_index_of(db_faiss)
+        if lexical_index is not None:
+            lexical_index.compact(lock)
+        return compress_vectorstore(db_faiss, lock=lock)
 
     def create_retriever(self, chunks):
         print(f"[DEBUG] Criando retriever com {len(chunks)} chunks...")
-        db_faiss = FAISS.from_documents(chunks, self.embedding_model)
+        db_faiss = self.finalize_vectorstore(self.build_vectorstore(chunks))
         print("[DEBUG] Retriever criado com sucesso!")
-        return db_faiss.as_retriever(search_type="similarity", search_kwargs={"k": SEARCH_K}) 
\ No newline at end of file
+        return self._as_retriever(db_faiss)
+
+    def process_pdf(self, source: PdfInput, pdf_hash: str = None):
+        """Retorna o retriever do PDF, reutilizando o índice em cache quando possível"""
+        with telemetry.span("ingestao.pdf") as span, self.pdf_source(source) as source:
+            key = self.index_cache.key_for(pdf_hash or source.sha256)
+            db_faiss = self.index_cache.load(key, self.embedding_model)
+            span.set(cache="hit" if db_faiss is not None else "miss")
+            telemetry.count("cache_indices", resultado="hit" if db_faiss is not None else "miss")
+            if db_faiss is None:
+                chunks = self.load_and_chunk(source)
+                print(f"[DEBUG] Criando índice com {len(chunks)} chunks...")
+                db_faiss = self.finalize_vectorstore(self.build_vectorstore(chunks))
+                self.index_cache.store(key, db_faiss)
+            return self._as_retriever(db_faiss)
+
+    def start_ingestion(self, source: PdfInput, pdf_hash: str = None):
+        """Retorna (vectorstore, job): em cache hit o índice vem pronto; caso contrário a ingestão segue em segundo plano
+
+        O PDF pode ser caminho, bytes, stream ou PdfSource; a fonte é liberada quando não for mais necessária.
+        """
+        with telemetry.span("ingestao.iniciar") as span:
+            source = self.pdf_source(source)
+            key = self.index_cache.key_for(pdf_hash or source.sha256)
+            db_faiss = self.index_cache.load(key, self.embedding_model)
+            span.set(cache="hit" if db_faiss is not None else "miss", em_disco=source.spilled)
+            telemetry.count("cache_indices", resultado="hit" if db_faiss is not None else "miss")
+            if db_faiss is not None:
+                source.close()
+                return db_faiss, None
+            return None, IngestionJob(self, source, cache_key=key).start()
+
+    @staticmethod
+    def _as_retriever(db_faiss):
+        return db_faiss.as_retriever(search_type="similarity", search_kwargs={"k": SEARCH_K})
@@ -0,0 +1,118 @@
+"""
+Armazenamento de embeddings endereçado por conteúdo para o Agente de Estudos
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from config import EMBEDDING_STORE_PATH
+
+
+class EmbeddingStore:
+    """Guarda vetores em SQLite, indexados pelo hash do texto e pelo nome do modelo"""
+
+    def __init__(self, path: str = EMBEDDING_STORE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def key_for(model_name: str, text: str) -> str:
+        return hashlib.sha256(f"{model_name}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            # SQLite limita a quantidade de parâmetros por consulta
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, model_name: str, items: Dict[str, np.ndarray]):
+        rows = [(key, model_name, np.asarray(vec, dtype=np.float32).tobytes()) for key, vec in items.items()]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, model, vector) VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings que consultam o EmbeddingStore antes de chamar o modelo"""
+
+    def __init__(self, base: Embeddings, model_name: str, store: Optional[EmbeddingStore] = None):
+        self.base = base
+        self.model_name = model_name
+        self.store = store or EmbeddingStore()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.derived = 0
+        self.prefetched = 0
+
+    def _keys(self, texts: List[str]) -> List[str]:
+        return [EmbeddingStore.key_for(self.model_name, t) for t in texts]
+
+    def lookup(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Retorna os vetores já conhecidos (None quando o texto nunca foi embedado)"""
+        keys = self._keys(texts)
+        found = self.store.get_many(list(set(keys)))
+        return [found[k].tolist() if k in found else None for k in keys]
+
+    def prefetch(self, texts: List[str]):
+        """Embeda antecipadamente, em lote, textos que serão pedidos em seguida"""
+        before = self.misses
+        self.embed_documents(texts)
+        with self._stats_lock:
+            # As leituras seguintes desses textos não representam economia real
+            self.hits -= len(texts) - (self.misses - before)
+            self.prefetched += self.misses - before
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = self._keys(texts)
+        found = self.store.get_many(list(set(keys)))
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.base.embed_documents(list(missing.values()))
+            computed = {key: np.asarray(vec, dtype=np.float32) for key, vec in zip(missing.keys(), vectors)}
+            self.store.put_many(self.model_name, computed)
+            found.update(computed)
+        with self._stats_lock:
+            self.misses += len(missing)
+            self.hits += len(texts) - len(missing)
+        return [found[k].tolist() for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.base.embed_query(text)
+
+    def record_derived(self, count: int):
+        """Contabiliza vetores obtidos a partir de vetores já armazenados"""
+        with self._stats_lock:
+            self.derived += count
+
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "derivados": self.derived,
+                "chamadas_economizadas": self.hits - self.prefetched + self.derived,
+            }
@@ -0,0 +1,109 @@
+"""
+Chunker semântico vetorizado (e modo de janelas fixas) para a ingestão de PDFs
+"""
+import copy
+from typing import Iterable, List, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from config import CHUNK_PERCENTILE, CHUNK_MIN_CHARS, CHUNK_MAX_CHARS, CHUNK_WINDOW_CHARS
+from sentences import split_sentences, combine_sentences
+
+# Faixa [início, fim) de sentenças de uma página que forma um chunk
+Span = Tuple[int, int]
+
+
+def _joined_length(lengths: np.ndarray, start: int, end: int) -> int:
+    """Tamanho de " ".join(sentenças[start:end]) a partir das somas acumuladas dos tamanhos"""
+    return int(lengths[end] - lengths[start]) + (end - start - 1)
+
+
+def enforce_sizes(spans: List[Span], lengths: np.ndarray, min_chars: int, max_chars: int) -> List[Span]:
+    """Junta chunks menores que min_chars ao vizinho e reparte os maiores que max_chars em fim de sentença
+
+    Os cortes continuam em fronteiras de sentença (uma sentença sozinha maior que max_chars fica inteira).
+    """
+    merged: List[Span] = []
+    for start, end in spans:
+        if merged and _joined_length(lengths, *merged[-1]) < min_chars:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    if len(merged) > 1 and _joined_length(lengths, *merged[-1]) < min_chars:
+        last = merged.pop()
+        merged[-1] = (merged[-1][0], last[1])
+    if not max_chars:
+        return merged
+    result: List[Span] = []
+    for start, end in merged:
+        piece_start = start
+        for i in range(start + 1, end):
+            if _joined_length(lengths, piece_start, i + 1) > max_chars:
+                result.append((piece_start, i))
+                piece_start = i
+        result.append((piece_start, end))
+    return result
+
+
+class FastSemanticChunker:
+    """Mesmos cortes do SemanticChunker (percentil das distâncias entre sentenças vizinhas de cada página),
+    com uma única chamada de embedding por lote de páginas e as distâncias calculadas em NumPy
+
+    Em mode="janela" não há embeddings: as sentenças são agrupadas em janelas de até window_chars caracteres.
+    """
+
+    def __init__(self, embeddings=None, percentile: float = CHUNK_PERCENTILE, min_chars: int = CHUNK_MIN_CHARS,
+                 max_chars: int = CHUNK_MAX_CHARS, mode: str = "semantico", window_chars: int = CHUNK_WINDOW_CHARS):
+        if mode == "semantico" and embeddings is None:
+            raise ValueError("O modo semântico precisa de um modelo de embeddings")
+        self.embeddings = embeddings
+        self.percentile = percentile
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.mode = mode
+        self.window_chars = window_chars
+
+    def _semantic_spans(self, pages: List[List[str]]) -> List[List[Span]]:
+        # Páginas de uma sentença não são embedadas (como no SemanticChunker)
+        combined = [c for sentences in pages if len(sentences) > 1 for c in combine_sentences(sentences)]
+        vectors = np.asarray(self.embeddings.embed_documents(combined), dtype=np.float32) if combined else None
+        if vectors is not None:
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            # Distância de cosseno entre cada sentença e a seguinte, para o lote inteiro de uma vez
+            distances = 1.0 - np.einsum("ij,ij->i", vectors[:-1], vectors[1:])
+        spans, offset = [], 0
+        for sentences in pages:
+            n = len(sentences)
+            if n == 1:
+                spans.append([(0, 1)])
+                continue
+            # Os pares que atravessam a divisa entre duas páginas são descartados
+            page_distances = distances[offset:offset + n - 1]
+            offset += n
+            threshold = np.percentile(page_distances, self.percentile)
+            cuts = (np.flatnonzero(page_distances > threshold) + 1).tolist()
+            bounds = [0] + cuts + [n]
+            spans.append([(a, b) for a, b in zip(bounds, bounds[1:]) if a < b])
+        return spans
+
+    def _window_spans(self, pages: List[List[str]]) -> List[List[Span]]:
+        spans = []
+        for sentences in pages:
+            lengths = np.concatenate([[0], np.cumsum([len(s) for s in sentences])])
+            spans.append(enforce_sizes([(0, len(sentences))], lengths, 0, self.window_chars))
+        return spans
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        documents = [d for d in documents if d.page_content.strip()]
+        pages = [split_sentences(d.page_content) for d in documents]
+        spans = self._semantic_spans(pages) if self.mode == "semantico" else self._window_spans(pages)
+        chunks = []
+        for document, sentences, page_spans in zip(documents, pages, spans):
+            lengths = np.concatenate([[0], np.cumsum([len(s) for s in sentences])])
+            for start, end in enforce_sizes(page_spans, lengths, self.min_chars, self.max_chars):
+                chunks.append(Document(page_content=" ".join(sentences[start:end]),
+                                       metadata=copy.deepcopy(document.metadata)))
+        return chunks
+
+    def split_text(self, text: str) -> List[str]:
+        return [d.page_content for d in self.split_documents([Document(page_content=text)])]
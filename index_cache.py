@@ -0,0 +1,158 @@
+"""
+Cache persistente de índices FAISS para o Agente de Estudos
+"""
+import hashlib
+import os
+import shutil
+import uuid
+from typing import Optional, Set, Union
+
+import faiss
+from langchain_community.vectorstores import FAISS
+from config import (
+    EMBEDDING_MODEL, CHUNK_PERCENTILE, CHUNK_VECTOR_MODE, INDEX_CACHE_DIR, INDEX_CACHE_MAX_MB,
+    CHUNKER_MODE, CHUNK_MIN_CHARS, CHUNK_MAX_CHARS, CHUNK_WINDOW_CHARS,
+    VECTOR_INDEX_MODE, VECTOR_INDEX_MIN_VECTORS
+)
+from vector_index import configure_search
+from lexical_index import BM25Index, build_lexical_index, lexical_index_of
+
+_HASH_BLOCK_SIZE = 1024 * 1024
+LEXICAL_FILE = "lexical.npz"  # Índice BM25, gravado na mesma entrada do índice FAISS
+
+
+def hash_pdf(source: Union[bytes, str]) -> str:
+    """Calcula o hash SHA-256 do conteúdo de um PDF (bytes ou caminho)"""
+    digest = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        digest.update(source)
+    else:
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+class IndexCache:
+    """Guarda índices FAISS em disco, indexados pelo hash do PDF e pelas configurações de ingestão"""
+
+    def __init__(self, cache_dir: str = INDEX_CACHE_DIR, max_mb: float = INDEX_CACHE_MAX_MB):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.pinned: Set[str] = set()  # Chaves que a limpeza não remove (índices do pool ainda referenciados)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def settings_fingerprint() -> str:
+        """Resume as configurações que alteram o conteúdo do índice"""
+        chunker = CHUNKER_MODE if CHUNKER_MODE == "langchain" else (
+            f"{CHUNKER_MODE}:{CHUNK_MIN_CHARS}-{CHUNK_MAX_CHARS}:{CHUNK_WINDOW_CHARS}"
+        )
+        return (f"{EMBEDDING_MODEL}|percentile={CHUNK_PERCENTILE}|chunker={chunker}|vetores={CHUNK_VECTOR_MODE}"
+                f"|indice={VECTOR_INDEX_MODE}:{VECTOR_INDEX_MIN_VECTORS}")
+
+    def key_for(self, pdf_hash: str) -> str:
+        """Chave de cache: hash do PDF + modelo de embeddings + parâmetros de chunking"""
+        return hashlib.sha256(f"{pdf_hash}|{self.settings_fingerprint()}".encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def contains(self, key: str) -> bool:
+        path = self._entry_path(key)
+        return os.path.exists(os.path.join(path, "index.faiss")) and os.path.exists(os.path.join(path, "index.pkl"))
+
+    def load(self, key: str, embedding_model) -> Optional[FAISS]:
+        """Carrega um índice do cache com memory-map; retorna None em caso de miss"""
+        if not self.contains(key):
+            return None
+        path = self._entry_path(key)
+        try:
+            vectorstore = self._load_mmap(path, embedding_model)
+        except Exception as e:
+            print(f"[ERRO] Entrada de cache corrompida ({key[:12]}), descartando: {e}")
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+        configure_search(vectorstore.index)
+        lexical_path = os.path.join(path, LEXICAL_FILE)
+        if os.path.exists(lexical_path):
+            vectorstore.lexical_index = BM25Index.load(lexical_path)
+        else:
+            build_lexical_index(vectorstore)  # Entrada gravada antes da busca híbrida
+        os.utime(path)  # Marca o último acesso para a política LRU
+        print(f"[DEBUG] Índice carregado do cache: {key[:12]}")
+        return vectorstore
+
+    @staticmethod
+    def _load_mmap(path: str, embedding_model) -> FAISS:
+        # Índices flat/HNSW/int8 aceitam o mmap dos códigos (IFC); os IVF só o mmap das listas invertidas
+        flag_sets = [faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0), faiss.IO_FLAG_MMAP]
+        for attempt, flags in enumerate(flag_sets):
+            try:
+                return FAISS.load_local(
+                    path,
+                    embedding_model,
+                    allow_dangerous_deserialization=True,  # Arquivos gerados por este próprio cache
+                    io_flags=flags | faiss.IO_FLAG_READ_ONLY
+                )
+            except RuntimeError:
+                if attempt == len(flag_sets) - 1:
+                    raise
+
+    def store(self, key: str, vectorstore: FAISS):
+        """Salva o índice no cache e aplica o orçamento de tamanho"""
+        path = self._entry_path(key)
+        # Diretório temporário único: duas threads do mesmo processo podem salvar o mesmo PDF ao mesmo tempo
+        tmp_path = f"{path}.tmp-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        try:
+            vectorstore.save_local(tmp_path)
+            if lexical_index_of(vectorstore) is not None:
+                lexical_index_of(vectorstore).save(os.path.join(tmp_path, LEXICAL_FILE))
+            try:
+                os.replace(tmp_path, path)
+            except OSError:
+                if not os.path.isdir(path):
+                    raise
+                # Outra thread ou processo salvou a mesma chave antes: a entrada existente é equivalente e pode
+                # estar sendo lida agora, então fica onde está
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                print(f"[DEBUG] Índice já estava no cache: {key[:12]}")
+                return
+        except Exception as e:
+            print(f"[ERRO] Falha ao salvar índice no cache: {e}")
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return
+        print(f"[DEBUG] Índice salvo no cache: {key[:12]}")
+        self.evict(keep=key)
+
+    @staticmethod
+    def _dir_size(path: str) -> int:
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+
+    def evict(self, keep: Optional[str] = None):
+        """Remove as entradas menos usadas recentemente até caber em INDEX_CACHE_MAX_MB"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if os.path.isdir(path) and ".tmp-" not in name:
+                entries.append((os.path.getmtime(path), name, self._dir_size(path)))
+        total = sum(size for _, _, size in entries)
+        for _, name, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name == keep or name in self.pinned:
+                continue
+            shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+            total -= size
+            print(f"[DEBUG] Índice removido do cache por tamanho: {name[:12]}")
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
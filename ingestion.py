@@ -0,0 +1,127 @@
+"""
+Ingestão em streaming de PDFs grandes para o Agente de Estudos
+"""
+import threading
+import time
+from typing import Dict, List, Optional
+
+from config import SEARCH_K, INGEST_MODE
+from telemetry import telemetry
+
+
+class LiveRetriever:
+    """Retriever sobre um índice que ainda está recebendo chunks"""
+
+    def __init__(self, job: "IngestionJob", k: int = SEARCH_K):
+        self.job = job
+        self.k = k
+
+    def get_relevant_documents(self, query: str) -> List:
+        with self.job.lock:
+            if self.job.vectorstore is None:
+                return []
+            return self.job.vectorstore.similarity_search(query, k=self.k)
+
+    def invoke(self, query: str, **kwargs) -> List:
+        return self.get_relevant_documents(query)
+
+
+class IngestionJob:
+    """Lê, faz chunking, embeda e indexa um PDF em lotes de páginas numa thread de fundo"""
+
+    def __init__(self, processor, source, cache_key: Optional[str] = None):
+        self.processor = processor
+        self.source = source  # PdfSource; liberado (memória e arquivo temporário) quando a ingestão termina
+        self.disk_bytes = source.disk_bytes
+        self.cache_key = cache_key
+        self.lock = threading.Lock()
+        self.vectorstore = None
+        self.pages_done = 0
+        self.total_pages = 0
+        self.chunks_done = 0
+        self.error: Optional[Exception] = None
+        self.started_at = None
+        self.finished_at = None
+        self._first_batch = threading.Event()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="ingestao-pdf", daemon=True)
+
+    def start(self) -> "IngestionJob":
+        self.started_at = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            for chunks, vectors, pages_done, total_pages in self.processor.iter_chunk_batches(self.source):
+                with self.lock:
+                    if chunks:
+                        self._add(chunks, vectors)
+                    self.pages_done = pages_done
+                    self.total_pages = total_pages
+                    self.chunks_done += len(chunks)
+                if not self._first_batch.is_set() and self.source.first_page_ms is not None:
+                    telemetry.observe("ingestao.primeira_pagina", self.source.first_page_ms / 1000)
+                self._first_batch.set()
+            if self.vectorstore is not None:
+                # Durante a ingestão o índice é exato (aceita inserções); ao final vira o índice configurado.
+                # A conversão roda fora do lock; a troca, dentro dele, então as buscas usam o antigo até ela
+                self.processor.finalize_vectorstore(self.vectorstore, self.lock)
+            if self.cache_key and self.vectorstore is not None:
+                self.processor.index_cache.store(self.cache_key, self.vectorstore)
+            print(f"[DEBUG] Vazão da ingestão: {self.stats()}")
+        except Exception as e:
+            print(f"[ERRO] Falha na ingestão de {self.source.name}: {e}")
+            self.error = e
+        finally:
+            self.source.close()
+            self.finished_at = time.perf_counter()
+            self._first_batch.set()
+            self._done.set()
+
+    def _add(self, chunks, vectors):
+        if self.vectorstore is None:
+            self.vectorstore = self.processor.build_vectorstore(chunks, vectors)
+        else:
+            self.vectorstore.add_embeddings(
+                list(zip([c.page_content for c in chunks], vectors)),
+                metadatas=[c.metadata for c in chunks]
+            )
+            self.vectorstore.lexical_index.add(c.page_content for c in chunks)
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def progress(self) -> float:
+        if self.done:
+            return 1.0
+        return self.pages_done / self.total_pages if self.total_pages else 0.0
+
+    def stats(self) -> Dict:
+        """Vazão da ingestão (páginas/s e chunks/s), latência até a primeira página e uso de disco"""
+        end = self.finished_at or time.perf_counter()
+        elapsed = max(end - (self.started_at or end), 1e-9)
+        first_page_ms = self.source.first_page_ms
+        return {
+            "modo": INGEST_MODE,
+            "paginas": self.pages_done,
+            "chunks": self.chunks_done,
+            "segundos": round(elapsed, 3),
+            "paginas_por_s": round(self.pages_done / elapsed, 2),
+            "chunks_por_s": round(self.chunks_done / elapsed, 2),
+            # Do fim do upload até a extração das primeiras páginas
+            "primeira_pagina_ms": round(first_page_ms, 1) if first_page_ms is not None else None,
+            "disco_mb": round(self.disk_bytes / 2 ** 20, 2),
+            "disco_pico_mb": self.processor.scratch.stats()["pico_mb"],
+        }
+
+    def wait_first_batch(self, timeout: Optional[float] = None) -> bool:
+        return self._first_batch.wait(timeout)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def as_retriever(self) -> LiveRetriever:
+        return LiveRetriever(self)
@@ -0,0 +1,109 @@
+"""
+Roteador de intenção local (sem LLM) para o Agente de Estudos
+"""
+import re
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+from config import ROUTER_MIN_SIMILARITY, ROUTER_MIN_MARGIN
+
+# Frases-protótipo rotuladas; a pergunta vai para a rota do protótipo mais parecido
+PROTOTYPES: Dict[str, List[str]] = {
+    "explicar": [
+        "Explique o que é este conceito",
+        "O que significa este termo?",
+        "Qual é a diferença entre estes dois conceitos?",
+        "Como funciona este processo?",
+        "Por que isso acontece?",
+        "Resuma o conteúdo do capítulo",
+        "Qual é o tema principal do texto?",
+        "Me ajude a entender esta parte do material",
+        "Explain this concept to me",
+        "What is the main idea of this document?",
+        "How does this work?",
+        "Why is this important?",
+    ],
+    "gerar_pergunta": [
+        "Gere uma pergunta de múltipla escolha sobre o conteúdo",
+        "Crie 5 perguntas sobre o texto",
+        "Me faça uma pergunta para eu testar meu conhecimento",
+        "Quero um quiz sobre este capítulo",
+        "Elabore questões de revisão com gabarito",
+        "Me pergunte algo sobre o material",
+        "Monte um simulado com este conteúdo",
+        "Generate a multiple-choice question about the content",
+        "Create a quiz with 10 questions",
+        "Ask me a question to test my understanding",
+    ],
+}
+
+# Regras de palavras-chave com precedência sobre a similaridade
+KEYWORD_RULES = [
+    (re.compile(r"\b(ger[ae]r?|crie|criar|fa[çc]a|elabore|monte|prepare)\b.{0,40}\b(pergunta|quest[aãõo]|quiz|simulado|prova|exerc[ií]cio)", re.I),
+     "gerar_pergunta"),
+    (re.compile(r"\b(me pergunte|me teste|quiz|simulado)\b", re.I), "gerar_pergunta"),
+    (re.compile(r"\b(generate|create|make|write)\b.{0,40}\b(questions?|quiz|exercises?)\b", re.I), "gerar_pergunta"),
+    (re.compile(r"\b(ask me|quiz me|test me)\b", re.I), "gerar_pergunta"),
+]
+
+
+@dataclass
+class RouteDecision:
+    route: str
+    confidence: float
+    method: str  # "regra", "embedding" ou "llm"
+    latency_ms: float
+
+
+class IntentRouter:
+    """Classifica a pergunta com regras e similaridade a protótipos; usa o LLM só em casos de baixa confiança"""
+
+    def __init__(self, embedding_model, llm_service=None,
+                 min_similarity: float = ROUTER_MIN_SIMILARITY, min_margin: float = ROUTER_MIN_MARGIN):
+        self.embedding_model = embedding_model
+        self.llm_service = llm_service
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self._labels: Optional[List[str]] = None
+        self._matrix: Optional[np.ndarray] = None
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    def _prototypes(self):
+        if self._matrix is None:
+            labels, phrases = [], []
+            for label, examples in PROTOTYPES.items():
+                labels.extend([label] * len(examples))
+                phrases.extend(examples)
+            vectors = np.asarray(self.embedding_model.embed_documents(phrases), dtype=np.float32)
+            self._labels, self._matrix = labels, self._normalize(vectors)
+        return self._labels, self._matrix
+
+    def route(self, question: str) -> RouteDecision:
+        start = time.perf_counter()
+        for pattern, label in KEYWORD_RULES:
+            if pattern.search(question):
+                return RouteDecision(label, 1.0, "regra", (time.perf_counter() - start) * 1000)
+
+        labels, matrix = self._prototypes()
+        query = self._normalize(np.asarray(self.embedding_model.embed_query(question), dtype=np.float32))
+        similarities = matrix @ query
+        best: Dict[str, float] = {}
+        for label, similarity in zip(labels, similarities):
+            best[label] = max(best.get(label, -1.0), float(similarity))
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)
+        top_label, top_score = ranked[0]
+        margin = top_score - ranked[1][1] if len(ranked) > 1 else top_score
+        if (top_score >= self.min_similarity and margin >= self.min_margin) or self.llm_service is None:
+            return RouteDecision(top_label, margin, "embedding", (time.perf_counter() - start) * 1000)
+
+        label = self.llm_service.classify(question)
+        return RouteDecision(label, margin, "llm", (time.perf_counter() - start) * 1000)
+
+    def classify(self, question: str) -> str:
+        return self.route(question).route
@@ -0,0 +1,164 @@
+"""
+Índice invertido BM25 dos chunks de um documento, persistido junto ao índice vetorial
+"""
+import math
+import re
+import unicodedata
+from collections import Counter
+from contextlib import nullcontext
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from config import BM25_K1, BM25_B
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+# Palavras frequentes demais para discriminar chunks; ficam fora do índice para economizar espaço
+STOPWORDS = frozenset("""
+a ao aos as com como da das de do dos e em entre foi ha isso mais mas na nas no nos o os ou para pela pelas pelo
+pelos por que se ser sem sua suas seu seus so sao tambem tem um uma umas uns
+an and are as at be by for from in is it of on or that the this to was were with
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Termos em minúsculas e sem acentos ("função" e "funcao" casam); números e siglas são mantidos"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return [t for t in _TERM_RE.findall(text) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """Postings por termo (posição do chunk no shard, frequência) com pontuação BM25 vetorizada
+
+    As posições são as mesmas do índice FAISS do shard. Durante a ingestão as postings ficam em listas que
+    aceitam inserções; compact() as converte para arrays contíguos (CSR), mais compactos e rápidos de pontuar.
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._lengths: List[int] = []
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        # Forma compacta: termo -> linha; postings da linha i em _docs/_tfs[_offsets[i]:_offsets[i + 1]]
+        self._vocab: Optional[Dict[str, int]] = None
+        self._offsets = self._docs = self._tfs = None
+        self._length_array = None
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    @property
+    def vocabulary_size(self) -> int:
+        return len(self._vocab) if self._vocab is not None else len(self._postings)
+
+    @property
+    def nbytes(self) -> int:
+        """Memória aproximada das postings e dos tamanhos dos chunks"""
+        if self._vocab is not None:
+            postings = self._offsets.nbytes + self._docs.nbytes + self._tfs.nbytes
+        else:
+            postings = 16 * sum(len(p) for p in self._postings.values())
+        return int(postings) + 64 * self.vocabulary_size + 8 * len(self._lengths)
+
+    def add(self, texts: Iterable[str]):
+        """Indexa os textos nas próximas posições do shard"""
+        if self._vocab is not None:
+            self._expand()
+        for text in texts:
+            position = len(self._lengths)
+            terms = tokenize(text)
+            self._lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                self._postings.setdefault(term, []).append((position, tf))
+        self._length_array = None
+
+    def compact(self, lock=None) -> "BM25Index":
+        """Converte para CSR; os arrays são montados fora de `lock` e publicados de uma vez dentro dele, para
+        quem busca segurando o mesmo lock nunca ver a conversão pela metade"""
+        if self._vocab is not None:
+            return self
+        terms = sorted(self._postings)
+        vocab = {term: i for i, term in enumerate(terms)}
+        sizes = np.fromiter((len(self._postings[t]) for t in terms), dtype=np.int64, count=len(terms))
+        offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        flat = [posting for t in terms for posting in self._postings[t]]
+        docs = np.fromiter((d for d, _ in flat), dtype=np.int32, count=len(flat))
+        tfs = np.fromiter((tf for _, tf in flat), dtype=np.uint16, count=len(flat))
+        with lock if lock is not None else nullcontext():
+            self._offsets, self._docs, self._tfs = offsets, docs, tfs
+            self._vocab = vocab
+            self._postings = {}
+        return self
+
+    def _expand(self):
+        terms = sorted(self._vocab, key=self._vocab.get)
+        for i, term in enumerate(terms):
+            start, end = self._offsets[i], self._offsets[i + 1]
+            self._postings[term] = list(zip(self._docs[start:end].tolist(), self._tfs[start:end].tolist()))
+        self._vocab = self._offsets = self._docs = self._tfs = None
+
+    def _term_postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        if self._vocab is not None:
+            row = self._vocab.get(term)
+            if row is None:
+                return np.empty(0, np.int32), np.empty(0, np.uint16)
+            start, end = self._offsets[row], self._offsets[row + 1]
+            return self._docs[start:end], self._tfs[start:end]
+        postings = self._postings.get(term, [])
+        return (np.fromiter((d for d, _ in postings), np.int32, len(postings)),
+                np.fromiter((tf for _, tf in postings), np.uint16, len(postings)))
+
+    def search(self, query_terms: List[str], k: int) -> List[Tuple[int, float]]:
+        """(posição, score) dos k chunks de maior BM25; só entram chunks com ao menos um termo da consulta"""
+        n_docs = len(self._lengths)
+        if not n_docs or not query_terms or k <= 0:
+            return []
+        if self._length_array is None or len(self._length_array) != n_docs:
+            self._length_array = np.asarray(self._lengths, dtype=np.float32)
+        lengths = self._length_array
+        norm = self.k1 * (1 - self.b + self.b * lengths / max(float(lengths.mean()), 1.0))
+        scores = np.zeros(n_docs, dtype=np.float32)
+        for term in set(query_terms):
+            docs, tfs = self._term_postings(term)
+            if not len(docs):
+                continue
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            tfs = tfs.astype(np.float32)
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm[docs])
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(int(i), float(scores[i])) for i in matched]
+
+    def save(self, path: str):
+        self.compact()
+        terms = sorted(self._vocab, key=self._vocab.get)
+        np.savez(path, terms=np.array(terms, dtype=str), offsets=self._offsets, docs=self._docs, tfs=self._tfs,
+                 lengths=np.asarray(self._lengths, dtype=np.int32), params=np.array([self.k1, self.b]))
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path) as data:
+            k1, b = data["params"].tolist()
+            index = cls(k1, b)
+            index._vocab = {term: i for i, term in enumerate(data["terms"].tolist())}
+            index._offsets, index._docs, index._tfs = data["offsets"], data["docs"], data["tfs"]
+            index._lengths = data["lengths"].tolist()
+        return index
+
+
+def lexical_index_of(vectorstore) -> Optional[BM25Index]:
+    """Índice BM25 anexado ao vectorstore do shard (None em vectorstores de fora do DocumentProcessor)"""
+    return getattr(vectorstore, "lexical_index", None)
+
+
+def build_lexical_index(vectorstore) -> BM25Index:
+    """Indexa os chunks que já estão no docstore, na ordem das posições do índice FAISS"""
+    index = BM25Index()
+    index.add(vectorstore.docstore.search(vectorstore.index_to_docstore_id[i]).page_content
+              for i in range(vectorstore.index.ntotal))
+    vectorstore.lexical_index = index.compact()
+    return index
@@ -0,0 +1,475 @@
+"""
+Clientes HTTP dos modelos de linguagem: backends plugáveis com conexões keep-alive, prazo por chamada,
+novas tentativas com backoff, hedging e failover para o modelo reserva
+"""
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from config import (
+    Config, HF_CHAT_URL, HF_TOKEN, LLM_CONNECT_TIMEOUT, LLM_DO_SAMPLE, LLM_ENDPOINT_URL, LLM_HEDGE_MIN_SAMPLES,
+    LLM_HEDGE_PERCENTILE, LLM_LATENCY_WINDOW, LLM_MAX_TOKENS, LLM_POOL_CONNECTIONS, LLM_RETRY_BACKOFF,
+    LLM_RETRY_BACKOFF_MAX, OLLAMA_URL
+)
+from telemetry import telemetry
+
+_RETRY_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """Chamada ao modelo sem sucesso: erro permanente, ou tentativas e backends esgotados"""
+
+
+class TransientLLMError(LLMError):
+    """Falha que vale tentar de novo: conexão recusada ou caída, HTTP 429/5xx"""
+
+
+class DeadlineExceeded(TransientLLMError):
+    """O backend não respondeu dentro do prazo da tentativa"""
+
+
+class LatencyWindow:
+    """Latências recentes de um backend, para decidir quando disparar o hedging"""
+
+    def __init__(self, size: int = LLM_LATENCY_WINDOW):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float, min_samples: int = LLM_HEDGE_MIN_SAMPLES) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < max(1, min_samples):
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+class ChatBackend:
+    """Endpoint de chat completions compatível com OpenAI (HuggingFace, Ollama, vLLM, servidor falso...)
+
+    Cada backend mantém um pool de conexões keep-alive por processo (e um assíncrono por event loop), compartilhado
+    por todas as sessões; o timeout é passado a cada chamada com o prazo que ainda resta.
+    """
+
+    def __init__(self, name: str, base_url: str, model: str, api_key: Optional[str] = None,
+                 max_tokens: int = LLM_MAX_TOKENS, temperature: float = 0.0,
+                 pool_connections: int = LLM_POOL_CONNECTIONS):
+        self.name = name
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self._headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self._limits = httpx.Limits(max_connections=pool_connections, max_keepalive_connections=pool_connections)
+        self._client = httpx.Client(headers=self._headers, limits=self._limits)
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = \
+            weakref.WeakKeyDictionary()
+        self.latency = LatencyWindow()  # Resposta completa (call)
+        self.first_token_latency = LatencyWindow()  # Até o primeiro token (stream)
+
+    def _async_client(self) -> httpx.AsyncClient:
+        """Um pool assíncrono por event loop: conexões abertas num loop não servem em outro"""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = self._async_clients[loop] = httpx.AsyncClient(headers=self._headers, limits=self._limits)
+        return client
+
+    def close(self):
+        """Fecha os pools de conexões; os assíncronos são fechados no próprio loop, se ele ainda estiver rodando"""
+        self._client.close()
+        for loop, client in list(self._async_clients.items()):
+            if loop.is_running():
+                asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        self._async_clients.clear()
+
+    def _payload(self, prompt: str, stream: bool) -> Dict:
+        return {"model": self.model, "messages": [{"role": "user", "content": prompt}],
+                "max_tokens": self.max_tokens, "temperature": self.temperature, "stream": stream}
+
+    @staticmethod
+    def _timeout(seconds: float) -> httpx.Timeout:
+        return httpx.Timeout(seconds, connect=min(LLM_CONNECT_TIMEOUT, seconds))
+
+    @contextmanager
+    def _errors(self):
+        """Traduz as falhas de rede do httpx para os erros do cliente"""
+        try:
+            yield
+        except (httpx.TimeoutException, asyncio.TimeoutError) as e:
+            raise DeadlineExceeded(f"{self.name}: sem resposta dentro do prazo") from e
+        except httpx.TransportError as e:
+            raise TransientLLMError(f"{self.name}: {type(e).__name__}: {e}") from e
+
+    def _check(self, response: httpx.Response):
+        if response.status_code in _RETRY_STATUS:
+            raise TransientLLMError(f"{self.name}: HTTP {response.status_code}")
+        if response.status_code >= 400:
+            raise LLMError(f"{self.name}: HTTP {response.status_code}: {response.text[:200]}")
+
+    def _parse(self, content: bytes) -> Tuple[str, Optional[Dict]]:
+        try:
+            body = json.loads(content)
+            text = body["choices"][0]["message"].get("content") or ""
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            raise LLMError(f"{self.name}: resposta inválida ({type(e).__name__})") from e
+        usage = body.get("usage") or {}
+        if "prompt_tokens" not in usage:
+            return text, None
+        return text, {"input_tokens": usage["prompt_tokens"], "output_tokens": usage.get("completion_tokens", 0)}
+
+    def _delta(self, line: str) -> str:
+        """Texto de uma linha do stream SSE ('' para linhas sem conteúdo)"""
+        if not line.startswith("data:"):
+            return ""
+        data = line[5:].strip()
+        if not data or data == "[DONE]":
+            return ""
+        try:
+            chunk = json.loads(data)
+        except ValueError as e:
+            raise LLMError(f"{self.name}: evento inválido no stream") from e
+        if chunk.get("error"):
+            raise LLMError(f"{self.name}: {chunk['error']}")
+        choices = chunk.get("choices") or [{}]
+        return (choices[0].get("delta") or {}).get("content") or ""
+
+    def complete(self, prompt: str, timeout: float) -> Tuple[str, Optional[Dict]]:
+        """(texto, uso de tokens informado pelo provedor ou None)"""
+        deadline = time.monotonic() + timeout
+        content = bytearray()
+        # O timeout do httpx vale por operação de rede: lendo o corpo aos pedaços, uma resposta que pinga bytes
+        # devagar é abortada no primeiro pedaço que chegar depois do prazo total da tentativa
+        with self._errors(), self._client.stream("POST", self.url, json=self._payload(prompt, False),
+                                                 timeout=self._timeout(timeout)) as response:
+            if response.status_code >= 400:
+                response.read()
+                self._check(response)
+            for chunk in response.iter_bytes():
+                if time.monotonic() > deadline:
+                    raise DeadlineExceeded(f"{self.name}: sem resposta dentro do prazo")
+                content += chunk
+        return self._parse(bytes(content))
+
+    async def acomplete(self, prompt: str, timeout: float) -> Tuple[str, Optional[Dict]]:
+        with self._errors():
+            # O timeout do httpx vale por operação de rede; o wait_for garante o prazo total da tentativa
+            response = await asyncio.wait_for(
+                self._async_client().post(self.url, json=self._payload(prompt, False), timeout=self._timeout(timeout)),
+                timeout
+            )
+        self._check(response)
+        return self._parse(response.content)
+
+    def stream(self, prompt: str, timeout: float) -> Iterator[str]:
+        """Tokens da resposta; o timeout vale até o primeiro byte e para cada intervalo entre pedaços"""
+        with self._errors(), self._client.stream("POST", self.url, json=self._payload(prompt, True),
+                                                 timeout=self._timeout(timeout)) as response:
+            if response.status_code >= 400:
+                response.read()
+                self._check(response)
+            for line in response.iter_lines():
+                text = self._delta(line)
+                if text:
+                    yield text
+
+    async def astream(self, prompt: str, timeout: float) -> AsyncIterator[str]:
+        with self._errors():
+            async with self._async_client().stream("POST", self.url, json=self._payload(prompt, True),
+                                                 timeout=self._timeout(timeout)) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                    self._check(response)
+                async for line in response.aiter_lines():
+                    text = self._delta(line)
+                    if text:
+                        yield text
+
+
+def build_backend(kind: str, model: str, max_tokens: int = LLM_MAX_TOKENS) -> ChatBackend:
+    """Backend por tipo: "huggingface", "openai" (LLM_ENDPOINT_URL) ou "ollama" (OLLAMA_URL)"""
+    temperature = 0.7 if LLM_DO_SAMPLE else 0.0
+    if kind == "huggingface":
+        return ChatBackend(f"huggingface:{model}", HF_CHAT_URL, model, HF_TOKEN, max_tokens, temperature)
+    if kind == "openai":
+        if not LLM_ENDPOINT_URL:
+            raise ValueError("LLM_BACKEND=openai exige LLM_ENDPOINT_URL")
+        return ChatBackend(f"openai:{model}", LLM_ENDPOINT_URL, model, os.getenv("LLM_ENDPOINT_API_KEY", "local"),
+                           max_tokens, temperature)
+    if kind == "ollama":
+        return ChatBackend(f"ollama:{model}", OLLAMA_URL.rstrip("/") + "/v1", model, None, max_tokens, temperature)
+    raise ValueError(f"Backend de LLM desconhecido: {kind}")
+
+
+def _chain(first: str, tokens: Iterator[str]) -> Iterator[str]:
+    try:
+        if first:
+            yield first
+        yield from tokens
+    finally:
+        tokens.close()
+
+
+async def _achain(first: str, tokens: AsyncIterator[str]) -> AsyncIterator[str]:
+    try:
+        if first:
+            yield first
+        async for token in tokens:
+            yield token
+    finally:
+        await tokens.aclose()
+
+
+class ResilientLLM:
+    """Chama uma cadeia de backends (o principal e os reservas, em ordem) com prazo, retry, hedging e failover
+
+    Cada backend da cadeia tem `timeout` segundos por chamada, somando tentativas e esperas. Falhas transitórias
+    (timeout, conexão, HTTP 429/5xx) são repetidas até max_retries vezes, com backoff exponencial com jitter;
+    erros permanentes ou o prazo esgotado passam para o próximo backend. Com hedge_percentile, uma tentativa que
+    passa desse percentil da latência recente do backend ganha uma cópia, e vale a que responder primeiro. Em
+    streams, retry, hedging e failover valem até o primeiro token.
+    """
+
+    def __init__(self, backends: List[ChatBackend], timeout: float = Config.REQUEST_TIMEOUT,
+                 max_retries: int = Config.MAX_RETRIES, hedge_percentile: float = LLM_HEDGE_PERCENTILE,
+                 backoff: float = LLM_RETRY_BACKOFF, backoff_max: float = LLM_RETRY_BACKOFF_MAX):
+        if not backends:
+            raise ValueError("Informe ao menos um backend")
+        self.backends = backends
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.hedge_percentile = hedge_percentile
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self._executor = ThreadPoolExecutor(LLM_POOL_CONNECTIONS, thread_name_prefix="llm-hedge") \
+            if hedge_percentile else None
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = {b.name: {} for b in backends}
+
+    def _attempts(self, errors: List[LLMError]) -> Iterator[Tuple[ChatBackend, float, float]]:
+        """(backend, espera antes, prazo) de cada tentativa; o chamador registra em errors a falha da anterior
+        antes de pedir a próxima"""
+        for index, backend in enumerate(self.backends):
+            if index:
+                print(f"[DEBUG] LLM: {self.backends[index - 1].name} falhou; usando o reserva {backend.name}")
+                telemetry.count("llm_failover", backend=backend.name)
+            deadline = time.monotonic() + self.timeout
+            delay = 0.0
+            for attempt in range(self.max_retries + 1):
+                remaining = deadline - time.monotonic() - delay
+                if remaining <= 0:
+                    break
+                yield backend, delay, remaining
+                if not isinstance(errors[-1], TransientLLMError):
+                    break
+                # Jitter total: tentativas de várias requisições não voltam todas ao mesmo tempo
+                delay = random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+    def _tally(self, backend: ChatBackend, result: str):
+        telemetry.count("llm_tentativas", backend=backend.name, resultado=result)
+        with self._lock:
+            counts = self._counts.setdefault(backend.name, {})
+            counts[result] = counts.get(result, 0) + 1
+
+    def _succeeded(self, backend: ChatBackend, window: LatencyWindow, histogram: str, started: float):
+        elapsed = time.perf_counter() - started
+        window.add(elapsed)
+        telemetry.observe(histogram, elapsed)  # Um histograma de latência por backend
+        self._tally(backend, "ok")
+
+    def _failed(self, backend: ChatBackend, error: LLMError) -> LLMError:
+        print(f"[ERRO] LLM {error}")
+        self._tally(backend, "timeout" if isinstance(error, DeadlineExceeded) else "erro")
+        return error
+
+    @staticmethod
+    def _exhausted(errors: List[LLMError]) -> LLMError:
+        error = LLMError(f"Nenhum backend respondeu ({errors[-1] if errors else 'sem prazo para tentar'})")
+        error.__cause__ = errors[-1] if errors else None
+        return error
+
+    def _hedge_delay(self, window: LatencyWindow, timeout: float) -> Optional[float]:
+        if not self.hedge_percentile:
+            return None
+        delay = window.percentile(self.hedge_percentile)
+        return delay if delay is not None and delay < timeout else None
+
+    def _complete(self, backend: ChatBackend, prompt: str, timeout: float) -> Tuple[str, Optional[Dict]]:
+        started = time.perf_counter()
+        try:
+            result = backend.complete(prompt, timeout)
+        except LLMError as e:
+            raise self._failed(backend, e)
+        self._succeeded(backend, backend.latency, f"llm.backend.{backend.name}", started)
+        return result
+
+    async def _acomplete(self, backend: ChatBackend, prompt: str, timeout: float) -> Tuple[str, Optional[Dict]]:
+        started = time.perf_counter()
+        try:
+            result = await backend.acomplete(prompt, timeout)
+        except LLMError as e:
+            raise self._failed(backend, e)
+        self._succeeded(backend, backend.latency, f"llm.backend.{backend.name}", started)
+        return result
+
+    def _first_token(self, backend: ChatBackend, prompt: str, timeout: float) -> Tuple[str, Iterator[str]]:
+        started = time.perf_counter()
+        tokens = backend.stream(prompt, timeout)
+        try:
+            first = next(tokens, "")
+        except LLMError as e:
+            raise self._failed(backend, e)
+        self._succeeded(backend, backend.first_token_latency, f"llm.backend.{backend.name}.primeiro_token", started)
+        return first, tokens
+
+    async def _afirst_token(self, backend: ChatBackend, prompt: str,
+                            timeout: float) -> Tuple[str, AsyncIterator[str]]:
+        started = time.perf_counter()
+        tokens = backend.astream(prompt, timeout)
+        try:
+            first = await anext(tokens, "")
+        except LLMError as e:
+            raise self._failed(backend, e)
+        self._succeeded(backend, backend.first_token_latency, f"llm.backend.{backend.name}.primeiro_token", started)
+        return first, tokens
+
+    def _hedged(self, backend: ChatBackend, window: LatencyWindow, attempt: Callable, prompt: str, timeout: float,
+                discard: Optional[Callable] = None):
+        """Executa a tentativa; se passar do percentil de latência, dispara uma cópia e fica com a primeira
+        resposta. A cópia perdedora não é interrompida (o cliente síncrono não cancela): termina na sua thread e
+        o resultado é descartado"""
+        delay = self._hedge_delay(window, timeout)
+        if delay is None:
+            return attempt(backend, prompt, timeout)
+        futures = [self._executor.submit(telemetry.wrap(attempt), backend, prompt, timeout)]
+        done, _ = wait(futures, timeout=delay)
+        if not done:
+            telemetry.count("llm_hedges", backend=backend.name)
+            futures.append(self._executor.submit(telemetry.wrap(attempt), backend, prompt, timeout - delay))
+        error = None
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except LLMError as e:
+                error = e
+                continue
+            for other in futures:
+                if other is not future and discard is not None:
+                    other.add_done_callback(lambda f: f.exception() is None and discard(f.result()))
+            return result
+        raise error
+
+    async def _ahedged(self, backend: ChatBackend, window: LatencyWindow, attempt: Callable, prompt: str,
+                       timeout: float, discard: Optional[Callable] = None):
+        """Como _hedged, mas a tentativa perdedora é cancelada e a conexão dela volta ao pool"""
+        delay = self._hedge_delay(window, timeout)
+        tasks = [asyncio.ensure_future(attempt(backend, prompt, timeout))]
+        winner = None
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    telemetry.count("llm_hedges", backend=backend.name)
+                    tasks.append(asyncio.ensure_future(attempt(backend, prompt, timeout - delay)))
+            error = None
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    winner = await next_done
+                except LLMError as e:
+                    error = e
+                    continue
+                return winner
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif (discard is not None and not task.cancelled() and task.exception() is None
+                      and task.result() is not winner):
+                    await discard(task.result())
+
+    def call(self, prompt: str) -> Tuple[str, Optional[Dict], str]:
+        """(texto, uso de tokens informado pelo provedor ou None, backend que respondeu)"""
+        errors: List[LLMError] = []
+        for backend, delay, timeout in self._attempts(errors):
+            time.sleep(delay)
+            try:
+                text, usage = self._hedged(backend, backend.latency, self._complete, prompt, timeout)
+            except LLMError as e:
+                errors.append(e)
+                continue
+            return text, usage, backend.name
+        raise self._exhausted(errors)
+
+    async def acall(self, prompt: str) -> Tuple[str, Optional[Dict], str]:
+        errors: List[LLMError] = []
+        for backend, delay, timeout in self._attempts(errors):
+            await asyncio.sleep(delay)
+            try:
+                text, usage = await self._ahedged(backend, backend.latency, self._acomplete, prompt, timeout)
+            except LLMError as e:
+                errors.append(e)
+                continue
+            return text, usage, backend.name
+        raise self._exhausted(errors)
+
+    def open_stream(self, prompt: str) -> Tuple[Iterator[str], str]:
+        """(tokens, backend): abre o stream no primeiro backend que entregar o primeiro token; uma falha depois
+        dele sobe para o chamador como LLMError"""
+        errors: List[LLMError] = []
+        for backend, delay, timeout in self._attempts(errors):
+            time.sleep(delay)
+            try:
+                first, tokens = self._hedged(backend, backend.first_token_latency, self._first_token, prompt,
+                                             timeout, discard=lambda result: result[1].close())
+            except LLMError as e:
+                errors.append(e)
+                continue
+            return _chain(first, tokens), backend.name
+        raise self._exhausted(errors)
+
+    async def aopen_stream(self, prompt: str) -> Tuple[AsyncIterator[str], str]:
+        errors: List[LLMError] = []
+        for backend, delay, timeout in self._attempts(errors):
+            await asyncio.sleep(delay)
+            try:
+                first, tokens = await self._ahedged(backend, backend.first_token_latency, self._afirst_token, prompt,
+                                                    timeout, discard=lambda result: result[1].aclose())
+            except LLMError as e:
+                errors.append(e)
+                continue
+            return _achain(first, tokens), backend.name
+        raise self._exhausted(errors)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        for backend in self.backends:
+            backend.close()
+
+    def stats(self) -> Dict[str, Dict]:
+        """Tentativas por resultado e latências recentes (p50/p95) de cada backend"""
+        stats = {}
+        for backend in self.backends:
+            with self._lock:
+                entry = dict(self._counts.get(backend.name, {}))
+            for label, window in (("latencia", backend.latency), ("primeiro_token", backend.first_token_latency)):
+                for p in (50, 95):
+                    value = window.percentile(p, min_samples=1)
+                    if value is not None:
+                        entry[f"{label}_p{p}_ms"] = round(value * 1000, 1)
+            stats[backend.name] = entry
+        return stats
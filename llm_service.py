@@ -1,25 +1,119 @@
-from langchain_huggingface.llms.huggingface_endpoint import HuggingFaceEndpoint
-from langchain_huggingface import ChatHuggingFace
-from config import LLM_REPO_ID, HF_TOKEN, LLM_MAX_TOKENS, LLM_DO_SAMPLE, LLM_REPETITION_PENALTY
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from config import Config, LLM_BACKEND, LLM_FALLBACK_BACKEND, LLM_MAX_TOKENS, LLM_REPO_ID, OLLAMA_MODEL
+from context_packer import TokenCounter
+from llm_clients import LLMError, ResilientLLM, build_backend
+from typing import AsyncIterator, Iterator, Optional
+from telemetry import telemetry
+import time
+
+# Devolvida no lugar da resposta quando nenhum backend responde e Config.USE_SIMPLE_RESPONSE está ligado
+SIMPLE_RESPONSE = "Não consegui consultar o modelo de linguagem agora. Tente novamente em alguns instantes."
+# Último pedaço do stream quando o backend falha depois do primeiro token (o que já saiu não pode ser refeito)
+STREAM_INTERRUPTED = "\n\n[Resposta interrompida: o modelo parou de responder. Tente novamente.]"
+
+
+def default_client() -> ResilientLLM:
+    """Modelo principal no LLM_BACKEND, seguido do modelo reserva de Config no LLM_FALLBACK_BACKEND"""
+    model = OLLAMA_MODEL if LLM_BACKEND == "ollama" else LLM_REPO_ID
+    backends = [build_backend(LLM_BACKEND, model, LLM_MAX_TOKENS)]
+    fallback = Config.FALLBACK_MODEL_REPO_ID
+    if fallback and (fallback, LLM_FALLBACK_BACKEND) != (model, LLM_BACKEND):
+        backends.append(build_backend(LLM_FALLBACK_BACKEND, fallback, Config.FALLBACK_MAX_TOKENS))
+    return ResilientLLM(backends)
+
 
 class LLMService:
-    """Serviço para interagir com o LLM via LangChain"""
-    def __init__(self):
-        self.llm = HuggingFaceEndpoint(
-            repo_id=LLM_REPO_ID,
-            task="text-generation",
-            max_new_tokens=LLM_MAX_TOKENS,
-            do_sample=LLM_DO_SAMPLE,
-            repetition_penalty=LLM_REPETITION_PENALTY,
-            huggingfacehub_api_token=HF_TOKEN  # Certifique-se que HF_TOKEN está correto
-        )
-        self.chat_model = ChatHuggingFace(llm=self.llm)
-        # Removido o carregamento de HuggingFaceEmbeddings daqui
+    """Serviço para interagir com o LLM: backends plugáveis com prazo, novas tentativas e modelo reserva"""
+    def __init__(self, client: Optional[ResilientLLM] = None, counter: Optional[TokenCounter] = None):
+        self.client = client or default_client()
+        self.counter = counter or TokenCounter()
+
+    def _record_usage(self, span, prompt: str, completion: str, usage=None):
+        """Tokens de entrada e saída: os informados pelo provedor ou, na falta deles, os do contador do contexto"""
+        prompt_tokens = usage["input_tokens"] if usage else self.counter.count(prompt)
+        completion_tokens = usage["output_tokens"] if usage else self.counter.count(completion)
+        span.set(tokens_prompt=prompt_tokens, tokens_resposta=completion_tokens, tokens_estimados=not usage)
+        telemetry.count("llm_tokens", prompt_tokens, tipo="prompt")
+        telemetry.count("llm_tokens", completion_tokens, tipo="resposta")
+
+    @staticmethod
+    def _degraded(span, error: LLMError) -> str:
+        """Resposta simples quando nenhum backend respondeu (ou o erro, se Config.USE_SIMPLE_RESPONSE estiver desligado)"""
+        if not Config.USE_SIMPLE_RESPONSE:
+            raise error
+        print(f"[ERRO] {error}; usando a resposta simples")
+        span.set(resposta_simples=True)
+        telemetry.count("llm_respostas_simples")
+        return SIMPLE_RESPONSE
+
+    @staticmethod
+    def _interrupted(span, error: LLMError) -> str:
+        print(f"[ERRO] {error}; stream interrompido")
+        span.set(interrompido=True)
+        telemetry.count("llm_streams_interrompidos")
+        return STREAM_INTERRUPTED
 
     def call(self, prompt: str):
-        response = self.chat_model.invoke(prompt)
-        return getattr(response, "content", str(response))
+        with telemetry.span("llm.call") as span:
+            try:
+                text, usage, backend = self.client.call(prompt)
+            except LLMError as e:
+                return self._degraded(span, e)
+            span.set(backend=backend)
+            self._record_usage(span, prompt, text, usage)
+            return text
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """Gera os tokens da resposta à medida que o endpoint os produz"""
+        with telemetry.span("llm.stream") as span:
+            start = time.perf_counter()
+            try:
+                tokens, backend = self.client.open_stream(prompt)
+            except LLMError as e:
+                yield self._degraded(span, e)
+                return
+            span.set(backend=backend, primeiro_token_ms=round((time.perf_counter() - start) * 1000, 1))
+            parts = []
+            try:
+                for text in tokens:
+                    parts.append(text)
+                    yield text
+            except LLMError as e:
+                yield self._interrupted(span, e)
+            self._record_usage(span, prompt, "".join(parts))
+
+    async def acall(self, prompt: str):
+        with telemetry.span("llm.call") as span:
+            try:
+                text, usage, backend = await self.client.acall(prompt)
+            except LLMError as e:
+                return self._degraded(span, e)
+            span.set(backend=backend)
+            self._record_usage(span, prompt, text, usage)
+            return text
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        with telemetry.span("llm.stream") as span:
+            start = time.perf_counter()
+            try:
+                tokens, backend = await self.client.aopen_stream(prompt)
+            except LLMError as e:
+                yield self._degraded(span, e)
+                return
+            span.set(backend=backend, primeiro_token_ms=round((time.perf_counter() - start) * 1000, 1))
+            parts = []
+            try:
+                async for text in tokens:
+                    parts.append(text)
+                    yield text
+            except LLMError as e:
+                yield self._interrupted(span, e)
+            self._record_usage(span, prompt, "".join(parts))
+
+    def stats(self):
+        return self.client.stats()
+
+    def close(self):
+        self.client.close()
 
     def classify(self, question: str) -> str:
         prompt = (
@@ -0,0 +1,295 @@
+"""
+Backends de armazenamento de memória para o Agente de Estudos
+"""
+import os
+import sqlite3
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from config import MEMORY_ID, MEM0_API_KEY, MEMORY_DB_PATH, MEMORY_SEARCH_K, MEMORY_PAGE_SIZE, MEMORY_INDEX_MAX_USERS
+
+
+@dataclass
+class MemoryPage:
+    """Uma página da listagem de memórias; next_cursor é None na última página"""
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+
+
+class PartialWriteError(Exception):
+    """add_many falhou no meio: as `written` primeiras conversas já estão gravadas"""
+
+    def __init__(self, written: int, cause: Exception):
+        super().__init__(f"{written} conversas gravadas antes da falha: {cause}")
+        self.written = written
+
+
+class MemoryBackend(ABC):
+    """Interface comum aos backends de memória"""
+
+    @abstractmethod
+    def add(self, messages: List[Dict[str, str]], user_id: str):
+        pass
+
+    def add_many(self, conversations: List[List[Dict[str, str]]], user_id: str):
+        """Grava várias conversas; os backends podem sobrescrever para gravar numa operação só
+
+        Uma falha depois de parte das conversas gravadas levanta PartialWriteError, para quem tenta de novo não
+        duplicá-las.
+        """
+        for done, messages in enumerate(conversations):
+            try:
+                self.add(messages, user_id)
+            except Exception as e:
+                raise PartialWriteError(done, e) from e
+
+    @abstractmethod
+    def search(self, query: str, user_id: str, since: datetime) -> List[Dict[str, Any]]:
+        """Memórias relevantes para a query criadas a partir de `since`"""
+
+    @abstractmethod
+    def list_page(self, user_id: str, cursor: Optional[str] = None, page_size: int = MEMORY_PAGE_SIZE,
+                  start: Optional[datetime] = None, end: Optional[datetime] = None,
+                  role: Optional[str] = None) -> MemoryPage:
+        """Memórias da mais recente para a mais antiga, a partir do cursor, com filtros de data e papel"""
+
+    def close(self):
+        """Libera conexões do backend (nada a fazer por padrão)"""
+
+    def list_all(self, user_id: str) -> List[Dict[str, Any]]:
+        items, cursor = [], None
+        while True:
+            page = self.list_page(user_id, cursor=cursor)
+            items.extend(page.items)
+            if page.next_cursor is None:
+                return items
+            cursor = page.next_cursor
+
+
+class Mem0Backend(MemoryBackend):
+    """Memória hospedada no Mem0"""
+
+    def __init__(self, client=None):
+        if client is None:
+            from mem0 import MemoryClient
+            client = MemoryClient(api_key=MEM0_API_KEY)
+        self.client = client
+
+    def initialize(self, user_id: str):
+        try:
+            self.client.create(memory_id=MEMORY_ID, user_id=user_id, description="Memória do Agente de Estudos")
+        except Exception:
+            pass  # Memória já existe
+
+    def add(self, messages: List[Dict[str, str]], user_id: str):
+        # O Mem0 define a data de criação por conta própria
+        messages = [{"role": m["role"], "content": m["content"]} for m in messages]
+        self.client.add(messages=messages, user_id=user_id, memory_id=MEMORY_ID)
+
+    def search(self, query: str, user_id: str, since: datetime) -> List[Dict[str, Any]]:
+        results = self.client.search(query=query, user_id=user_id, memory_id=MEMORY_ID)
+        # O Mem0 não filtra por data na busca: o corte é aplicado depois do ranking
+        return [
+            r for r in results
+            if datetime.fromisoformat(r["created_at"]).replace(tzinfo=timezone.utc) >= since
+        ]
+
+    def list_page(self, user_id: str, cursor: Optional[str] = None, page_size: int = MEMORY_PAGE_SIZE,
+                  start: Optional[datetime] = None, end: Optional[datetime] = None,
+                  role: Optional[str] = None) -> MemoryPage:
+        # No Mem0 o cursor é o número da página do get_all
+        page = int(cursor) if cursor else 1
+        filters: List[Dict[str, Any]] = [{"user_id": user_id}]
+        created_at = {}
+        if start is not None:
+            created_at["gte"] = start.isoformat()
+        if end is not None:
+            created_at["lte"] = end.isoformat()
+        if created_at:
+            filters.append({"created_at": created_at})
+        response = self.client.get_all(version="v2", filters={"AND": filters}, page=page, page_size=page_size)
+        if isinstance(response, dict):
+            results, has_next = response.get("results", []), bool(response.get("next"))
+        else:
+            results, has_next = response, len(response) == page_size
+        if role is not None:
+            # As memórias do Mem0 nem sempre guardam o papel: sem o campo, o item é mantido
+            results = [r for r in results if r.get("role", role) == role]
+        return MemoryPage(results, str(page + 1) if has_next else None)
+
+
+class _UserVectors:
+    """Memórias de um usuário com os vetores já normalizados, mantidas em RAM entre as buscas
+
+    Só cresce no fim (com folga, como uma lista): uma busca pode usar as primeiras n linhas fora do lock
+    enquanto outra thread acrescenta memórias novas.
+    """
+
+    def __init__(self):
+        self.records: List[Dict[str, Any]] = []
+        self._vectors: Optional[np.ndarray] = None
+        self._timestamps = np.empty(0, dtype=np.float64)
+
+    def extend(self, rows):
+        """Linhas (id, role, content, created_at, created_ts, vetor em bytes)"""
+        rows = [r for r in rows if r[5]]
+        if not rows:
+            return
+        new = np.stack([np.frombuffer(r[5], dtype=np.float32) for r in rows])
+        new /= np.maximum(np.linalg.norm(new, axis=1, keepdims=True), 1e-12)
+        n, added = len(self.records), len(rows)
+        if self._vectors is None or n + added > len(self._vectors):
+            capacity = max(64, 2 * (n + added))
+            vectors = np.empty((capacity, new.shape[1]), dtype=np.float32)
+            timestamps = np.empty(capacity, dtype=np.float64)
+            if n:
+                vectors[:n], timestamps[:n] = self._vectors[:n], self._timestamps[:n]
+            self._vectors, self._timestamps = vectors, timestamps
+        self._vectors[n:n + added] = new
+        self._timestamps[n:n + added] = [r[4] for r in rows]
+        self.records.extend(LocalMemoryBackend._record(r) for r in rows)
+
+    def snapshot(self) -> Tuple[Optional[np.ndarray], np.ndarray, List[Dict[str, Any]]]:
+        n = len(self.records)
+        if not n:
+            return None, self._timestamps[:0], self.records
+        return self._vectors[:n], self._timestamps[:n], self.records
+
+
+class LocalMemoryBackend(MemoryBackend):
+    """Memória embarcada: registros em SQLite e ranking vetorial sobre os vetores de cada usuário mantidos em RAM"""
+
+    def __init__(self, embedding_model, path: str = MEMORY_DB_PATH, top_k: int = MEMORY_SEARCH_K,
+                 max_users: int = MEMORY_INDEX_MAX_USERS):
+        self.embedding_model = embedding_model
+        self.top_k = top_k
+        self.max_users = max_users
+        self._users: "OrderedDict[str, _UserVectors]" = OrderedDict()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS memories (
+                id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                memory_id TEXT NOT NULL,
+                conversation_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                created_ts REAL NOT NULL,
+                vector BLOB
+            );
+            DROP INDEX IF EXISTS idx_memories_user_time;
+            CREATE INDEX IF NOT EXISTS idx_memories_user_time_id ON memories (user_id, memory_id, created_ts, id);
+            """
+        )
+        self._conn.commit()
+
+    def add(self, messages: List[Dict[str, str]], user_id: str):
+        self.add_many([messages], user_id)
+
+    def add_many(self, conversations: List[List[Dict[str, str]]], user_id: str):
+        # Um único lote de embeddings e uma única transação para todas as conversas
+        now = datetime.now(timezone.utc)
+        contents = [m["content"] for messages in conversations for m in messages]
+        vectors = iter(self.embedding_model.embed_documents(contents))
+        rows = []
+        for messages in conversations:
+            conversation_id = uuid.uuid4().hex
+            for m in messages:
+                created_at = datetime.fromisoformat(m["created_at"]) if m.get("created_at") else now
+                rows.append(
+                    (uuid.uuid4().hex, user_id, MEMORY_ID, conversation_id, m["role"], m["content"],
+                     created_at.isoformat(), created_at.timestamp(),
+                     np.asarray(next(vectors), dtype=np.float32).tobytes())
+                )
+        with self._lock:
+            self._conn.executemany("INSERT INTO memories VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+            # Sob o mesmo lock do INSERT: quem carregar o usuário depois já lê estas linhas do banco
+            if user_id in self._users:
+                self._users[user_id].extend((r[0], r[4], r[5], r[6], r[7], r[8]) for r in rows)
+
+    @staticmethod
+    def _record(row) -> Dict[str, Any]:
+        memory_id, role, content, created_at = row[:4]
+        return {"id": memory_id, "role": role, "memory": content, "created_at": created_at}
+
+    def _user_vectors(self, user_id: str) -> _UserVectors:
+        """Vetores do usuário (chamar com o lock): lidos do SQLite só na primeira busca depois de iniciar"""
+        vectors = self._users.get(user_id)
+        if vectors is not None:
+            self._users.move_to_end(user_id)
+            return vectors
+        vectors = _UserVectors()
+        vectors.extend(self._conn.execute(
+            "SELECT id, role, content, created_at, created_ts, vector FROM memories "
+            "WHERE user_id = ? AND memory_id = ? ORDER BY created_ts, id",
+            (user_id, MEMORY_ID)
+        ))
+        self._users[user_id] = vectors
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+        return vectors
+
+    def search(self, query: str, user_id: str, since: datetime) -> List[Dict[str, Any]]:
+        with self._lock:
+            matrix, timestamps, records = self._user_vectors(user_id).snapshot()
+        if matrix is None:
+            return []
+        recent = np.flatnonzero(timestamps >= since.timestamp())
+        if not len(recent):
+            return []
+        if len(recent) < len(timestamps):
+            matrix = matrix[recent]
+        query_vector = np.asarray(self.embedding_model.embed_query(query), dtype=np.float32)
+        scores = matrix @ (query_vector / max(float(np.linalg.norm(query_vector)), 1e-12))
+        k = min(self.top_k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [{**records[recent[i]], "score": float(scores[i])} for i in best]
+
+    def list_page(self, user_id: str, cursor: Optional[str] = None, page_size: int = MEMORY_PAGE_SIZE,
+                  start: Optional[datetime] = None, end: Optional[datetime] = None,
+                  role: Optional[str] = None) -> MemoryPage:
+        # Paginação por chave (created_ts, id): o custo de cada página não cresce com o número de memórias
+        clauses, params = ["user_id = ?", "memory_id = ?"], [user_id, MEMORY_ID]
+        if cursor:
+            created_ts, _, last_id = cursor.partition(":")
+            clauses.append("(created_ts, id) < (?, ?)")
+            params += [float(created_ts), last_id]
+        if start is not None:
+            clauses.append("created_ts >= ?")
+            params.append(start.timestamp())
+        if end is not None:
+            clauses.append("created_ts <= ?")
+            params.append(end.timestamp())
+        if role is not None:
+            clauses.append("role = ?")
+            params.append(role)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, role, content, created_at, created_ts FROM memories WHERE {' AND '.join(clauses)} "
+                "ORDER BY created_ts DESC, id DESC LIMIT ?",
+                (*params, page_size + 1)
+            ).fetchall()
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = f"{rows[-1][4]!r}:{rows[-1][0]}"
+        return MemoryPage([self._record(r) for r in rows], next_cursor)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+            self._users.clear()
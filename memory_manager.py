@@ -1,112 +1,127 @@
 """
 Gerenciador de memória para o Agente de Estudos
 """
-from mem0 import MemoryClient
+import threading
 from datetime import datetime, timedelta, timezone
-from typing import List, Dict, Any
-from config import MEMORY_ID, USER_ID, MEM0_API_KEY, MEMORY_DAYS_BACK
+from typing import List, Dict, Any, Optional, Set
+from config import USER_ID, MEMORY_DAYS_BACK, MEMORY_BACKEND, MEMORY_PAGE_SIZE, WRITE_BEHIND_ENABLED
+from memory_backends import MemoryBackend, MemoryPage, Mem0Backend, LocalMemoryBackend, PartialWriteError
+from persistence_queue import WriteBehindQueue
+from telemetry import telemetry
 
 
 class MemoryManager:
-    """Gerencia operações de memória usando Mem0"""
-    
-    def __init__(self):
-        self.client = MemoryClient(api_key=MEM0_API_KEY)
-        self._initialize_memory()
-    
-    def _initialize_memory(self):
-        try:
-            self.client.create(memory_id=MEMORY_ID, user_id=USER_ID, description="Memória do Agente de Estudos")
-        except Exception:
-            pass  # Memória já existe
-    
-    def save_conversation(self, user_message: str, assistant_message: str) -> bool:
-        """Salva uma conversa na memória"""
-        try:
-            messages = [
-                {"role": "user", "content": user_message},
-                {"role": "assistant", "content": assistant_message}
-            ]
-            
-            self.client.add(
-                messages=messages,
-                user_id=USER_ID,
-                memory_id=MEMORY_ID
-            )
-            return True
-        except Exception as e:
-            return False
-    
-    def search_relevant_memories(self, query: str) -> str:
+    """Gerencia operações de memória sobre o backend configurado (Mem0 ou local)"""
+
+    def __init__(self, embedding_model=None, backend: Optional[MemoryBackend] = None,
+                 write_behind: bool = WRITE_BEHIND_ENABLED):
+        self.backend = backend or self._default_backend(embedding_model)
+        self._initialized_users = set()
+        self._init_lock = threading.Lock()
+        self._initialize_memory(USER_ID)
+        self.persistence = WriteBehindQueue(self._write_batch) if write_behind else None
+
+    @staticmethod
+    def _default_backend(embedding_model) -> MemoryBackend:
+        if MEMORY_BACKEND == "local":
+            if embedding_model is None:
+                from langchain_huggingface import HuggingFaceEmbeddings
+                from config import EMBEDDING_MODEL
+                embedding_model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+            return LocalMemoryBackend(embedding_model)
+        return Mem0Backend()
+
+    def _initialize_memory(self, user_id: str):
+        """Cria a memória do usuário no Mem0 na primeira vez que ele aparece"""
+        if user_id in self._initialized_users:
+            return
+        with self._init_lock:
+            if user_id in self._initialized_users:
+                return
+            if isinstance(self.backend, Mem0Backend):
+                self.backend.initialize(user_id)
+            self._initialized_users.add(user_id)
+
+    def save_conversation(self, user_message: str, assistant_message: str, user_id: Optional[str] = None) -> bool:
+        """Salva uma conversa na memória do usuário (com write-behind, só enfileira e retorna na hora)"""
+        user_id = user_id or USER_ID
+        self._initialize_memory(user_id)
+        messages = [
+            {"role": "user", "content": user_message},
+            {"role": "assistant", "content": assistant_message}
+        ]
+        with telemetry.span("memoria.salvar", modo="fila" if self.persistence is not None else "direto") as span:
+            if self.persistence is not None:
+                created_at = datetime.now(timezone.utc).isoformat()
+                self.persistence.enqueue({"user_id": user_id,
+                                          "messages": [{**m, "created_at": created_at} for m in messages]})
+                return True
+            try:
+                self.backend.add(messages, user_id)
+                return True
+            except Exception as e:
+                span.set(erro=str(e))
+                return False
+
+    def _write_batch(self, records: List[Dict[str, Any]], written: Set[str]):
+        """Grava o lote usuário a usuário e marca em `written` os registros gravados; a falha de um usuário
+        não impede os demais e é levantada no fim"""
+        by_user: Dict[str, List[Dict[str, Any]]] = {}
+        for record in records:
+            # Registros do journal gravados antes dos IDs por usuário pertencem ao usuário padrão
+            by_user.setdefault(record.get("user_id", USER_ID), []).append(record)
+        error = None
+        for user_id, user_records in by_user.items():
+            try:
+                self.backend.add_many([r["messages"] for r in user_records], user_id)
+            except PartialWriteError as e:
+                written.update(r["id"] for r in user_records[:e.written])
+                error = error or e
+                continue
+            except Exception as e:
+                error = error or e
+                continue
+            written.update(r["id"] for r in user_records)
+        if error is not None:
+            raise error
+
+    def close(self):
+        """Grava (ou manda para o journal) o que ainda está na fila e fecha o backend"""
+        if self.persistence is not None:
+            self.persistence.close()
+        self.backend.close()
+
+    def persistence_stats(self) -> Optional[Dict[str, Any]]:
+        return self.persistence.stats() if self.persistence is not None else None
+
+    def search_relevant_memories(self, query: str, user_id: Optional[str] = None) -> str:
         """Busca memórias relevantes para uma query"""
-        try:
-            results = self.client.search(
-                query=query,
-                user_id=USER_ID,
-                memory_id=MEMORY_ID
-            )
-            
-            # Filtrar memórias recentes
-            last_week = datetime.now(timezone.utc) - timedelta(days=MEMORY_DAYS_BACK)
-            recent = [
-                r for r in results 
-                if datetime.fromisoformat(r["created_at"]).replace(tzinfo=timezone.utc) >= last_week
-            ]
-            
-            return "\n".join([r.get("message", r.get("memory", "")) for r in recent])
-        except Exception as e:
-            return ""
-    
-    def list_all_memories(self) -> List[Dict[str, Any]]:
-        """Lista todas as memórias usando diferentes estratégias"""
-        try:
-            # Estratégia 1: Query vazia
+        with telemetry.span("memoria.buscar") as span:
             try:
-                results = self.client.search(
-                    query=" ",
-                    user_id=USER_ID,
-                    memory_id=MEMORY_ID
-                )
-                if results:
-                    return results
-            except:
-                pass
-            
-            # Estratégia 2: Query genérica
+                last_week = datetime.now(timezone.utc) - timedelta(days=MEMORY_DAYS_BACK)
+                recent = self.backend.search(query, user_id or USER_ID, since=last_week)
+                span.set(resultados=len(recent))
+                return "\n".join([r.get("message", r.get("memory", "")) for r in recent])
+            except Exception as e:
+                span.set(erro=str(e))
+                return ""
+
+    def list_memories(self, cursor: Optional[str] = None, page_size: int = MEMORY_PAGE_SIZE,
+                      start: Optional[datetime] = None, end: Optional[datetime] = None,
+                      role: Optional[str] = None, user_id: Optional[str] = None) -> MemoryPage:
+        """Lista uma página de memórias (mais recentes primeiro); passe next_cursor para a página seguinte"""
+        with telemetry.span("memoria.listar") as span:
             try:
-                results = self.client.search(
-                    query="a",
-                    user_id=USER_ID,
-                    memory_id=MEMORY_ID
-                )
-                if results:
-                    return results
-            except:
-                pass
-            
-            # Estratégia 3: Buscar por termos comuns
-            common_terms = ["pergunta", "resposta", "explicação", "avaliação", "conclusão"]
-            all_results = []
-            
-            for term in common_terms:
-                try:
-                    results = self.client.search(
-                        query=term,
-                        user_id=USER_ID,
-                        memory_id=MEMORY_ID
-                    )
-                    all_results.extend(results)
-                except:
-                    continue
-            
-            # Remover duplicatas
-            unique_results = []
-            seen_ids = set()
-            for r in all_results:
-                if r.get('id') not in seen_ids:
-                    unique_results.append(r)
-                    seen_ids.add(r.get('id'))
-            return unique_results
-            
+                page = self.backend.list_page(user_id or USER_ID, cursor, page_size, start, end, role)
+                span.set(itens=len(page.items))
+                return page
+            except Exception as e:
+                span.set(erro=str(e))
+                return MemoryPage([])
+
+    def list_all_memories(self, user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Lista todas as memórias percorrendo as páginas (mantido por compatibilidade)"""
+        try:
+            return self.backend.list_all(user_id or USER_ID)
         except Exception as e:
-            return [] 
\ No newline at end of file
+            return []
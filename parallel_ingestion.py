@@ -0,0 +1,86 @@
+"""
+Extração de páginas de PDF em lotes, opcionalmente com um pool de processos
+"""
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from pdf_source import PdfSource
+from sentences import split_sentences, combine_sentences
+
+_worker_source: Optional[PdfSource] = None  # PDF recebido uma única vez por worker, no initializer
+
+
+def _init_worker(source: PdfSource):
+    global _worker_source
+    _worker_source = source
+
+
+def _page_metadata(doc, source: PdfSource, page_number: int) -> Dict:
+    metadata = {k: v for k, v in doc.metadata.items() if isinstance(v, (str, int))}
+    metadata.update({
+        "source": source.name,
+        "file_path": source.name,
+        "page": page_number,
+        "total_pages": doc.page_count,
+    })
+    return metadata
+
+
+def extract_page_range(source: PdfSource, start: int, end: int) -> List[Dict]:
+    """Extrai o texto das páginas [start, end) e já separa as sentenças"""
+    pages = []
+    with source.open() as doc:
+        for page_number in range(start, min(end, doc.page_count)):
+            text = doc[page_number].get_text()
+            sentences = split_sentences(text)
+            pages.append({
+                "text": text,
+                "metadata": _page_metadata(doc, source, page_number),
+                # O SemanticChunker não embeda páginas com uma única sentença
+                "combined": combine_sentences(sentences) if len(sentences) > 1 else [],
+            })
+    return pages
+
+
+def _extract_in_worker(start: int, end: int) -> List[Dict]:
+    """Executado nos workers, sobre o PDF recebido no initializer"""
+    return extract_page_range(_worker_source, start, end)
+
+
+def count_pages(source: PdfSource) -> int:
+    with source.open() as doc:
+        return doc.page_count
+
+
+def iter_page_batches(source: PdfSource, batch_pages: int, workers: int) -> Iterator[Tuple[List[Dict], int]]:
+    """Distribui faixas de páginas entre os workers e devolve os lotes na ordem original do PDF"""
+    for pages, total_pages in _iter_page_batches(source, batch_pages, workers):
+        source.mark_first_page()
+        yield pages, total_pages
+
+
+def _iter_page_batches(source: PdfSource, batch_pages: int, workers: int) -> Iterator[Tuple[List[Dict], int]]:
+    total_pages = count_pages(source)
+    starts = iter(range(0, total_pages, batch_pages))
+    if workers <= 1:
+        for start in starts:
+            yield extract_page_range(source, start, start + batch_pages), total_pages
+        return
+    # PDFs em memória vão para cada worker uma vez só, em vez de a cada faixa de páginas. Workers com "spawn":
+    # um fork copiaria locks presos pelas threads de ingestão, do torch e dos pools do httpx (risco de deadlock)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(source,)) as executor:
+        # Janela limitada de faixas em andamento: mantém a memória constante e a ordem determinística
+        pending = deque()
+        for start in starts:
+            pending.append(executor.submit(_extract_in_worker, start, start + batch_pages))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            pages = pending.popleft().result()
+            start = next(starts, None)
+            if start is not None:
+                pending.append(executor.submit(_extract_in_worker, start, start + batch_pages))
+            yield pages, total_pages
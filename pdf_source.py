@@ -0,0 +1,225 @@
+"""
+PDFs enviados pelo usuário: lidos direto da memória ou, quando grandes, de uma área temporária gerenciada
+"""
+import atexit
+import hashlib
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import IO, Dict, Iterator, Optional, Union
+
+import pymupdf
+from config import PDF_MEMORY_MAX_MB, PDF_SCRATCH_DIR, PDF_SCRATCH_MAX_MB, PDF_SCRATCH_STALE_HOURS
+
+_READ_BLOCK_SIZE = 1024 * 1024
+
+
+class PdfTooLarge(Exception):
+    """O PDF passa do tamanho máximo aceito"""
+
+
+class ScratchFull(Exception):
+    """A área temporária não tem espaço para mais um upload agora"""
+
+
+class ScratchArea:
+    """Diretório temporário próprio do processo para uploads grandes, com limite de espaço total
+
+    Cada arquivo é removido quando a ingestão que o usa termina; o diretório inteiro sai quando o processo
+    encerra, e diretórios esquecidos por processos que caíram são limpos na próxima inicialização.
+    """
+
+    def __init__(self, directory: str = PDF_SCRATCH_DIR, max_mb: float = PDF_SCRATCH_MAX_MB):
+        os.makedirs(directory, exist_ok=True)
+        self._purge_stale(directory)
+        self.directory = os.path.join(directory, f"proc-{os.getpid()}-{uuid.uuid4().hex[:8]}")
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._files: Dict[str, int] = {}
+        self.used_bytes = 0
+        self.peak_bytes = 0
+        atexit.register(self.cleanup)
+
+    @staticmethod
+    def _purge_stale(directory: str):
+        limit = time.time() - PDF_SCRATCH_STALE_HOURS * 3600
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.startswith("proc-") and os.path.isdir(path) and os.path.getmtime(path) < limit:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def spill(self, blocks: Iterator[bytes]) -> str:
+        """Grava os blocos num arquivo novo da área; levanta ScratchFull se o espaço total acabar no meio"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{uuid.uuid4().hex}.pdf")
+        with self._lock:
+            self._files[path] = 0
+        try:
+            with open(path, "wb") as f:
+                for block in blocks:
+                    with self._lock:
+                        if self.used_bytes + len(block) > self.max_bytes:
+                            raise ScratchFull(f"Área temporária cheia ({self.max_bytes / 2 ** 20:.0f} MB)")
+                        self.used_bytes += len(block)
+                        self._files[path] += len(block)
+                        self.peak_bytes = max(self.peak_bytes, self.used_bytes)
+                    f.write(block)
+        except BaseException:
+            self.release(path)
+            raise
+        return path
+
+    def release(self, path: str):
+        with self._lock:
+            self.used_bytes -= self._files.pop(path, 0)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def cleanup(self):
+        with self._lock:
+            self._files.clear()
+            self.used_bytes = 0
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "arquivos": len(self._files),
+                "uso_mb": round(self.used_bytes / 2 ** 20, 2),
+                "pico_mb": round(self.peak_bytes / 2 ** 20, 2),
+                "limite_mb": round(self.max_bytes / 2 ** 20, 1),
+            }
+
+
+class PdfSource:
+    """Um PDF a ser lido: bytes em memória, arquivo do chamador ou arquivo da área temporária
+
+    close() libera o conteúdo (e remove o arquivo, se for da área temporária); arquivos do chamador ficam.
+    """
+
+    def __init__(self, name: str, data: Optional[bytes] = None, path: Optional[str] = None,
+                 sha256: Optional[str] = None, scratch: Optional[ScratchArea] = None):
+        if (data is None) == (path is None):
+            raise ValueError("Informe exatamente um entre data e path")
+        self.name = name
+        self.data = data
+        self.path = path
+        self.size = len(data) if data is not None else os.path.getsize(path)
+        self.received_at = time.perf_counter()
+        self.first_page_at: Optional[float] = None
+        self._sha256 = sha256
+        self._scratch = scratch
+
+    @property
+    def spilled(self) -> bool:
+        return self._scratch is not None
+
+    @property
+    def disk_bytes(self) -> int:
+        """Espaço em disco ocupado por este upload (0 quando está só em memória ou é arquivo do chamador)"""
+        return self.size if self._scratch is not None else 0
+
+    @property
+    def sha256(self) -> str:
+        if self._sha256 is None:
+            digest = hashlib.sha256()
+            if self.data is not None:
+                digest.update(self.data)
+            else:
+                with open(self.path, "rb") as f:
+                    for block in iter(lambda: f.read(_READ_BLOCK_SIZE), b""):
+                        digest.update(block)
+            self._sha256 = digest.hexdigest()
+        return self._sha256
+
+    def open(self) -> pymupdf.Document:
+        if self.data is not None:
+            return pymupdf.open(stream=self.data, filetype="pdf")
+        return pymupdf.open(self.path)
+
+    def mark_first_page(self):
+        if self.first_page_at is None:
+            self.first_page_at = time.perf_counter()
+
+    @property
+    def first_page_ms(self) -> Optional[float]:
+        """Do recebimento do upload até a primeira página extraída"""
+        if self.first_page_at is None:
+            return None
+        return (self.first_page_at - self.received_at) * 1000
+
+    def close(self):
+        if self._scratch is not None:
+            self._scratch.release(self.path)
+            self._scratch = None
+        self.data = None
+
+    def __getstate__(self):
+        # Cópias enviadas aos workers só leem: remover o arquivo continua sendo papel do original
+        return {**self.__dict__, "_scratch": None}
+
+    def __enter__(self) -> "PdfSource":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+PdfInput = Union[str, os.PathLike, bytes, bytearray, memoryview, IO[bytes], PdfSource]
+
+
+def open_pdf_source(source: PdfInput, name: Optional[str] = None, scratch: Optional[ScratchArea] = None,
+                    max_mb: Optional[float] = None, memory_max_mb: float = PDF_MEMORY_MAX_MB) -> PdfSource:
+    """Aceita caminho, bytes ou arquivo aberto (ex.: o upload) e devolve um PdfSource
+
+    Conteúdo até memory_max_mb fica em memória; acima disso vai para a área temporária, sem passar inteiro pela
+    RAM quando vem de um stream. Levanta PdfTooLarge acima de max_mb.
+    """
+    if isinstance(source, PdfSource):
+        return source
+    if isinstance(source, (str, os.PathLike)):
+        path = os.fspath(source)
+        return PdfSource(name or path, path=path)
+    if name is None:
+        name = getattr(source, "name", None) if isinstance(getattr(source, "name", None), str) else "upload.pdf"
+    max_bytes = int(max_mb * 1024 * 1024) if max_mb else None
+    memory_max_bytes = int(memory_max_mb * 1024 * 1024)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = bytes(source)
+        if max_bytes is not None and len(data) > max_bytes:
+            raise PdfTooLarge(f"PDF maior que {max_mb:g} MB")
+        if len(data) <= memory_max_bytes or scratch is None:
+            return PdfSource(name, data=data)
+        view = memoryview(data)
+        path = scratch.spill(view[i:i + _READ_BLOCK_SIZE] for i in range(0, len(view), _READ_BLOCK_SIZE))
+        return PdfSource(name, path=path, scratch=scratch)
+
+    digest = hashlib.sha256()
+    head, size = [], 0
+    for block in iter(lambda: source.read(_READ_BLOCK_SIZE), b""):
+        size += len(block)
+        if max_bytes is not None and size > max_bytes:
+            raise PdfTooLarge(f"PDF maior que {max_mb:g} MB")
+        digest.update(block)
+        head.append(block)
+        if size > memory_max_bytes and scratch is not None:
+            break
+    else:
+        return PdfSource(name, data=b"".join(head), sha256=digest.hexdigest())
+
+    def rest():
+        nonlocal size
+        yield from head
+        head.clear()
+        for block in iter(lambda: source.read(_READ_BLOCK_SIZE), b""):
+            size += len(block)
+            if max_bytes is not None and size > max_bytes:
+                raise PdfTooLarge(f"PDF maior que {max_mb:g} MB")
+            digest.update(block)
+            yield block
+    path = scratch.spill(rest())
+    return PdfSource(name, path=path, sha256=digest.hexdigest(), scratch=scratch)
@@ -0,0 +1,253 @@
+"""
+Fila write-behind para persistir conversas sem atrasar as respostas
+"""
+import atexit
+import itertools
+import json
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from config import (
+    WRITE_BEHIND_BATCH_SIZE, WRITE_BEHIND_FLUSH_INTERVAL, WRITE_BEHIND_MAX_RETRIES,
+    WRITE_BEHIND_BACKOFF, WRITE_BEHIND_JOURNAL, WRITE_BEHIND_REPLAY_LOCK_STALE
+)
+
+
+class WriteBehindQueue:
+    """Enfileira registros e os grava em lotes numa thread própria
+
+    Cada registro recebe um "id". write_batch(lote, gravados) acrescenta a `gravados` o id de cada registro já
+    persistido, então uma nova tentativa depois de uma falha parcial reenvia só os que faltam. Os que falham
+    depois de todas as tentativas vão para um journal JSONL reenviado na próxima inicialização: cada instância
+    grava arquivos próprios, que não mudam depois de criados, e um arquivo de lock garante que só um processo
+    reenvia os journals de cada vez. O reenvio roda numa thread separada: um journal grande ou um backend fora
+    do ar não seguram as gravações novas.
+    """
+
+    def __init__(self, write_batch: Callable[[List[Dict[str, Any]], Set[str]], None],
+                 journal_path: str = WRITE_BEHIND_JOURNAL, batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+                 flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL, max_retries: int = WRITE_BEHIND_MAX_RETRIES,
+                 backoff: float = WRITE_BEHIND_BACKOFF):
+        self.write_batch = write_batch
+        self._journal_root, self._journal_ext = os.path.splitext(journal_path)
+        self._journal_ext = self._journal_ext or ".jsonl"
+        self._legacy_journal = journal_path  # Journal único das versões anteriores, também reenviado
+        # Prefixo dos journals desta instância; cada despejo vira um arquivo novo
+        self.journal_path = f"{self._journal_root}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._journal_seq = itertools.count()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        self._journal_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stop = threading.Event()
+        # Lote que a thread de gravação está enviando e os ids dele já gravados: se o close desistir de esperar,
+        # o restante vai para o journal em vez de se perder com a thread
+        self._in_flight: Optional[Tuple[List[Dict[str, Any]], Set[str]]] = None
+        self._in_flight_lock = threading.Lock()
+        self.written = 0
+        self.failures = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.flushes = 0
+        self.flush_ms_total = 0.0
+        self.last_flush_ms = 0.0
+        directory = os.path.dirname(journal_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._worker, name="write-behind", daemon=True)
+        self._thread.start()
+        self._replay_thread = threading.Thread(target=self._replay, name="write-behind-replay", daemon=True)
+        self._replay_thread.start()
+        atexit.register(self.close)
+
+    def enqueue(self, record: Dict[str, Any]):
+        record.setdefault("id", uuid.uuid4().hex)
+        self._queue.put(record)
+
+    def _write_with_retry(self, batch: List[Dict[str, Any]],
+                          written: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+        """Grava o lote; devolve os registros que continuaram sem gravar depois de todas as tentativas"""
+        written = set() if written is None else written
+        pending = batch
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                self.write_batch(pending, written)
+            except Exception:
+                with self._stats_lock:
+                    self.failures += 1
+                # Só o que ainda não foi gravado volta a ser enviado: nada é duplicado no backend
+                pending = [r for r in pending if r["id"] not in written]
+                if attempt < self.max_retries and not self._stop.is_set():
+                    # Backoff exponencial com jitter para não sincronizar as tentativas
+                    time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+                continue
+            elapsed = (time.perf_counter() - start) * 1000
+            with self._stats_lock:
+                self.written += len(batch)
+                self.flushes += 1
+                self.flush_ms_total += elapsed
+                self.last_flush_ms = elapsed
+            return []
+        with self._stats_lock:
+            self.written += len(batch) - len(pending)
+        return pending
+
+    def _spill(self, batch: List[Dict[str, Any]]):
+        # Gravado com outro nome e renomeado: um reenvio nunca lê um journal pela metade
+        path = f"{self.journal_path}-{next(self._journal_seq):06d}{self._journal_ext}"
+        with self._journal_lock:
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                for record in batch:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            os.replace(path + ".tmp", path)
+        with self._stats_lock:
+            self.spilled += len(batch)
+
+    def _acquire_replay_lock(self) -> bool:
+        lock_path = self._journal_root + ".replay.lock"
+        for _ in range(2):
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) < WRITE_BEHIND_REPLAY_LOCK_STALE:
+                        return False  # Outro processo está reenviando; os journals ficam para a próxima vez
+                    os.remove(lock_path)  # Lock deixado por um processo que caiu no meio do reenvio
+                except FileNotFoundError:
+                    pass
+        return False
+
+    def _journals(self) -> List[str]:
+        directory = os.path.dirname(self._journal_root) or "."
+        prefix = os.path.basename(self._journal_root) + "-"
+        paths = [os.path.join(directory, name) for name in os.listdir(directory)
+                 if name.startswith(prefix) and name.endswith(self._journal_ext)]
+        if os.path.exists(self._legacy_journal):
+            paths.append(self._legacy_journal)
+        return sorted(paths, key=os.path.getmtime)
+
+    def _replay(self):
+        """Reenvia os journals deixados por execuções anteriores (desta ou de outras instâncias)"""
+        if not self._acquire_replay_lock():
+            return
+        try:
+            for path in self._journals():
+                with open(path, encoding="utf-8", errors="replace") as f:
+                    pending = []
+                    for line in f:
+                        try:
+                            pending.append(json.loads(line))
+                        except ValueError:
+                            continue  # Linha truncada por uma queda no meio da gravação
+                for i in range(0, len(pending), self.batch_size):
+                    if self._stop.is_set():
+                        # Encerrando: o resto vai para um journal novo, reenviado na próxima inicialização
+                        self._spill(pending[i:])
+                        os.remove(path)
+                        return
+                    batch = pending[i:i + self.batch_size]
+                    for record in batch:
+                        record.setdefault("id", uuid.uuid4().hex)
+                    failed = self._write_with_retry(batch)
+                    with self._stats_lock:
+                        self.replayed += len(batch) - len(failed)
+                    if failed:
+                        # Backend fora do ar: o resto deste journal vai para um novo e os demais ficam como estão
+                        self._spill(failed + pending[i + self.batch_size:])
+                        os.remove(path)
+                        return
+                os.remove(path)
+        finally:
+            os.remove(self._journal_root + ".replay.lock")
+
+    def _next_batch(self) -> List[Dict[str, Any]]:
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if not batch:
+                continue
+            written: Set[str] = set()
+            with self._in_flight_lock:
+                self._in_flight = (batch, written)
+            failed = self._write_with_retry(batch, written)
+            with self._in_flight_lock:
+                abandoned = self._in_flight is None  # O close já mandou o restante do lote para o journal
+                self._in_flight = None
+            if failed and not abandoned:
+                self._spill(failed)
+            for _ in batch:
+                self._queue.task_done()
+
+    def flush(self, timeout: float = None) -> bool:
+        """Espera a fila esvaziar; devolve False se o timeout acabar antes"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout: float = 5.0):
+        """Grava o que falta; o que não couber no timeout vai para o journal
+
+        Um lote ainda em gravação quando o timeout acaba também vai para o journal (menos os registros já
+        confirmados): se a gravação terminar depois disso, o reenvio pode duplicá-lo, mas nada se perde.
+        """
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        deadline = time.monotonic() + timeout
+        self._thread.join(timeout)
+        self._replay_thread.join(max(0.0, deadline - time.monotonic()))
+        leftover = []
+        if self._thread.is_alive():
+            with self._in_flight_lock:
+                in_flight, self._in_flight = self._in_flight, None
+            if in_flight is not None:
+                batch, written = in_flight
+                done = set(written)
+                leftover.extend(r for r in batch if r["id"] not in done)
+        while True:
+            try:
+                leftover.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if leftover:
+            self._spill(leftover)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "fila": self._queue.qsize(),
+                "gravados": self.written,
+                "falhas": self.failures,
+                "no_journal": self.spilled,
+                "reenviados": self.replayed,
+                "flush_ultimo_ms": round(self.last_flush_ms, 1),
+                "flush_medio_ms": round(self.flush_ms_total / self.flushes, 1) if self.flushes else 0.0,
+            }
@@ -0,0 +1,223 @@
+"""
+Geração de perguntas em paralelo sobre grupos de chunks e banco de perguntas por documento
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from config import (
+    QUESTION_FANOUT_PER_CALL, QUESTION_FANOUT_GROUP_SIZE, QUESTION_FANOUT_WORKERS,
+    QUESTION_BANK_SIZE, QUESTION_BANK_DIR
+)
+from telemetry import telemetry
+
+# Início de uma pergunta numerada: "1.", "2)", "**3.**"...
+QUESTION_START_RE = re.compile(r"^\s*\**\s*(\d+)\s*[.)]\**\s*", re.M)
+
+# (texto da pergunta do usuário, chunks, histórico, idioma, número de perguntas) -> prompt
+PromptBuilder = Callable[[str, List[Document], str, str, int], str]
+
+
+def split_questions(text: str) -> List[str]:
+    """Separa a saída do LLM em perguntas, sem a numeração original"""
+    starts = list(QUESTION_START_RE.finditer(text))
+    if not starts:
+        return [text.strip()] if text.strip() else []
+    blocks = []
+    for match, following in zip(starts, starts[1:] + [None]):
+        block = text[match.end():following.start() if following else len(text)].strip()
+        if block:
+            blocks.append(block.rstrip("-").strip())
+    return blocks
+
+
+def number_questions(blocks: List[str], start: int = 1) -> str:
+    return "\n\n".join(f"{start + i}. {block}" for i, block in enumerate(blocks))
+
+
+def split_count(total: int, per_call: int) -> List[int]:
+    """Divide total perguntas em chamadas de no máximo per_call, o mais equilibradas possível"""
+    calls = max(1, -(-total // per_call))
+    base, extra = divmod(total, calls)
+    return [base + (1 if i < extra else 0) for i in range(calls)]
+
+
+def sample_chunk_groups(chunks: List[Document], n_groups: int, group_size: int,
+                        rng: random.Random) -> List[List[Document]]:
+    """Um grupo de chunks consecutivos por faixa do documento, para cobrir o material inteiro"""
+    if not chunks:
+        return [[] for _ in range(n_groups)]
+    groups = []
+    for i in range(n_groups):
+        lo = i * len(chunks) // n_groups
+        hi = max(lo + 1, (i + 1) * len(chunks) // n_groups)
+        start = rng.randrange(lo, max(lo + 1, hi - group_size + 1))
+        groups.append(chunks[start:start + group_size])
+    return groups
+
+
+class QuestionFanOut:
+    """Divide N perguntas entre chamadas simultâneas ao LLM, cada uma sobre um grupo diferente de chunks"""
+
+    def __init__(self, llm_service, build_prompt: PromptBuilder, per_call: int = QUESTION_FANOUT_PER_CALL,
+                 group_size: int = QUESTION_FANOUT_GROUP_SIZE, workers: int = QUESTION_FANOUT_WORKERS):
+        self.llm_service = llm_service
+        self.build_prompt = build_prompt
+        self.per_call = per_call
+        self.group_size = group_size
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="perguntas")
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def _prompts(self, user_question: str, n: int, chunks: List[Document], history: str, idioma: str,
+                 seed: Optional[int]) -> List[Tuple[int, str]]:
+        counts = split_count(n, self.per_call)
+        groups = sample_chunk_groups(chunks, len(counts), self.group_size, random.Random(seed))
+        return [(count, self.build_prompt(user_question, group, history, idioma, count))
+                for count, group in zip(counts, groups)]
+
+    def _call(self, count: int, prompt: str) -> List[str]:
+        with telemetry.span("perguntas.chamada", pedidas=count) as span:
+            blocks = split_questions(self.llm_service.call(prompt))[:count]
+            span.set(geradas=len(blocks))
+            return blocks
+
+    def generate(self, user_question: str, n: int, chunks: List[Document], history: str = "", idioma: str = "pt",
+                 on_blocks: Optional[Callable[[List[str]], None]] = None, seed: Optional[int] = None) -> List[str]:
+        """Perguntas na ordem em que as chamadas terminam; on_blocks recebe cada lote assim que fica pronto"""
+        prompts = self._prompts(user_question, n, chunks, history, idioma, seed)
+        futures = [self._executor.submit(telemetry.wrap(self._call), count, prompt) for count, prompt in prompts]
+        blocks = []
+        for future in as_completed(futures):
+            try:
+                new_blocks = future.result()
+            except Exception as e:
+                print(f"[ERRO] Falha numa chamada de geração de perguntas: {e}")
+                continue
+            blocks.extend(new_blocks)
+            if on_blocks is not None and new_blocks:
+                on_blocks(new_blocks)
+        return blocks
+
+    async def agenerate(self, user_question: str, n: int, chunks: List[Document], history: str = "",
+                        idioma: str = "pt", on_blocks: Optional[Callable[[List[str]], None]] = None,
+                        seed: Optional[int] = None) -> List[str]:
+        prompts = self._prompts(user_question, n, chunks, history, idioma, seed)
+        semaphore = asyncio.Semaphore(self.workers)
+
+        async def call(count, prompt):
+            async with semaphore:
+                with telemetry.span("perguntas.chamada", pedidas=count) as span:
+                    blocks = split_questions(await self.llm_service.acall(prompt))[:count]
+                    span.set(geradas=len(blocks))
+                    return blocks
+
+        blocks = []
+        for next_done in asyncio.as_completed([call(count, prompt) for count, prompt in prompts]):
+            try:
+                new_blocks = await next_done
+            except Exception as e:
+                print(f"[ERRO] Falha numa chamada de geração de perguntas: {e}")
+                continue
+            blocks.extend(new_blocks)
+            if on_blocks is not None and new_blocks:
+                on_blocks(new_blocks)
+        return blocks
+
+
+class QuestionBank:
+    """Perguntas geradas em segundo plano ao fim da ingestão, servidas na hora aos pedidos de quiz"""
+
+    def __init__(self, fanout: QuestionFanOut, size: int = QUESTION_BANK_SIZE, directory: str = QUESTION_BANK_DIR):
+        self.fanout = fanout
+        self.size = size
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._banks: Dict[str, Dict] = {}
+        self._building: Dict[str, threading.Thread] = {}
+        self._cursor: Dict[str, int] = {}
+        self.served = 0
+
+    def _path(self, doc_id: str) -> str:
+        return os.path.join(self.directory, f"{doc_id}.json")
+
+    def _load(self, doc_id: str) -> Optional[Dict]:
+        with self._lock:
+            if doc_id in self._banks:
+                return self._banks[doc_id]
+        try:
+            with open(self._path(doc_id), encoding="utf-8") as f:
+                bank = json.load(f)
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            self._banks[doc_id] = bank
+        return bank
+
+    def schedule(self, document, idioma: str = "pt"):
+        """Gera o banco do documento numa thread, depois que a ingestão dele terminar"""
+        if self._load(document.doc_id) is not None:
+            return
+        with self._lock:
+            if document.doc_id in self._building:
+                return
+            thread = threading.Thread(target=self._build, args=(document, idioma), name="banco-perguntas", daemon=True)
+            self._building[document.doc_id] = thread
+        thread.start()
+
+    def _build(self, document, idioma: str):
+        try:
+            if document.job is not None:
+                document.job.wait()
+                if document.job.error is not None:
+                    return
+            chunks = document.chunks()
+            with telemetry.span("perguntas.banco", documento=document.name, perguntas=self.size):
+                questions = self.fanout.generate("", self.size, chunks, idioma=idioma, seed=0)
+            bank = {"idioma": idioma, "perguntas": questions}
+            tmp_path = self._path(document.doc_id) + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(bank, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(document.doc_id))
+            with self._lock:
+                self._banks[document.doc_id] = bank
+        except Exception as e:
+            print(f"[ERRO] Falha ao gerar o banco de perguntas de {document.name}: {e}")
+        finally:
+            with self._lock:
+                self._building.pop(document.doc_id, None)
+
+    def status(self, doc_id: str) -> Optional[str]:
+        with self._lock:
+            if doc_id in self._building:
+                return "gerando"
+        bank = self._load(doc_id)
+        return f"{len(bank['perguntas'])} perguntas" if bank else None
+
+    def take(self, doc_ids: List[str], n: int, idioma: str) -> Optional[List[str]]:
+        """n perguntas dos bancos dos documentos (revezando entre eles), ou None se não houver o suficiente"""
+        banks = [(doc_id, self._load(doc_id)) for doc_id in doc_ids]
+        banks = [(doc_id, bank) for doc_id, bank in banks if bank and bank["idioma"] == idioma and bank["perguntas"]]
+        if sum(len(bank["perguntas"]) for _, bank in banks) < n:
+            return None
+        questions = []
+        with self._lock:
+            while len(questions) < n:
+                for doc_id, bank in banks:
+                    if len(questions) == n:
+                        break
+                    # Cursor circular por documento: pedidos seguidos recebem perguntas diferentes
+                    cursor = self._cursor.get(doc_id, 0)
+                    questions.append(bank["perguntas"][cursor % len(bank["perguntas"])])
+                    self._cursor[doc_id] = cursor + 1
+            self.served += n
+        return questions
@@ -0,0 +1,177 @@
+"""
+Registro de recursos pesados compartilhados pelo processo (modelos, clientes e o grafo compilado)
+"""
+import hashlib
+import importlib
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict
+
+import config
+
+# Recriados quando o config.py muda, junto com os módulos que os definem (dependências antes de quem as importa)
+_RELOADABLE_RESOURCES = ("workflow", "llm_service", "token_counter", "memory_manager", "router", "response_cache")
+_RELOADABLE_MODULES = (
+    "context_packer", "llm_clients", "llm_service", "memory_backends", "persistence_queue", "memory_manager",
+    "intent_router", "response_cache", "question_generation", "workflow_engine",
+)
+
+
+class ResourceRegistry:
+    """Cria cada recurso uma única vez e o compartilha entre sessões e threads
+
+    O Streamlit reexecuta o script a cada interação; com o registro, modelo de embeddings, cliente do LLM,
+    memória e grafo sobrevivem aos reruns. Quando o config.py muda, os recursos baratos são fechados e
+    recriados com os novos valores (ver reload).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._resources: Dict[str, Any] = {}
+        self._load_ms: Dict[str, float] = {}
+        self._config_mtime = None
+        self._fingerprint = self._config_fingerprint()
+        self.reloads = 0
+
+    @staticmethod
+    def _config_fingerprint() -> str:
+        with open(config.__file__, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    def _get(self, name: str, factory: Callable[[], Any]) -> Any:
+        resource = self._resources.get(name)
+        if resource is not None:
+            return resource
+        with self._lock:
+            if name not in self._resources:
+                start = time.perf_counter()
+                self._resources[name] = factory()
+                self._load_ms[name] = (time.perf_counter() - start) * 1000
+            return self._resources[name]
+
+    def provide(self, name: str, resource: Any):
+        """Registra um recurso já pronto (ex.: dublês de LLM e memória nos testes locais do serviço)"""
+        with self._lock:
+            self._resources[name] = resource
+            self._load_ms[name] = 0.0
+
+    # Os imports ficam dentro das fábricas para usar sempre a versão atual dos módulos após um reload
+
+    def document_processor(self):
+        from document_processor import DocumentProcessor
+        return self._get("document_processor", DocumentProcessor)
+
+    def embedding_model(self):
+        return self.document_processor().embedding_model
+
+    def retriever_pool(self):
+        from retriever_pool import RetrieverPool
+        return self._get("retriever_pool", lambda: RetrieverPool(self.document_processor()))
+
+    def token_counter(self):
+        """Contador de tokens do modelo, comum ao empacotamento do contexto e ao uso registrado do LLM"""
+        from context_packer import TokenCounter
+
+        def build():
+            counter = TokenCounter()
+            counter.exact  # Carrega o tokenizer aqui, não na primeira pergunta
+            return counter
+        return self._get("token_counter", build)
+
+    def llm_service(self):
+        from llm_service import LLMService
+        return self._get("llm_service", lambda: LLMService(counter=self.token_counter()))
+
+    def memory_manager(self):
+        from memory_manager import MemoryManager
+        return self._get("memory_manager", lambda: MemoryManager(self.embedding_model()))
+
+    def router(self):
+        from intent_router import IntentRouter
+        if config.ROUTER_MODE != "local":
+            return None
+        return self._get("router", lambda: IntentRouter(self.embedding_model(), self.llm_service()))
+
+    def response_cache(self):
+        from response_cache import ResponseCache
+        if not config.RESPONSE_CACHE_ENABLED:
+            return None
+        return self._get("response_cache", lambda: ResponseCache(self.embedding_model()))
+
+    def workflow(self):
+        from workflow_engine import WorkflowEngine
+
+        from context_packer import ContextPacker
+        from question_generation import QuestionBank
+
+        def build():
+            packer = ContextPacker(counter=self.token_counter()) if config.CONTEXT_PACKING_ENABLED else None
+            engine = WorkflowEngine(self.memory_manager(), self.llm_service(), self.router(), self.response_cache(),
+                                    context_packer=packer)
+            if config.QUESTION_BANK_ENABLED and engine.question_fanout is not None:
+                engine.question_bank = QuestionBank(engine.question_fanout)
+            engine.graph  # Compila o grafo junto com o resto dos recursos
+            return engine
+        return self._get("workflow", build)
+
+    def question_bank(self):
+        """Banco de perguntas pré-geradas do fluxo (None quando desativado)"""
+        return self.workflow().question_bank
+
+    def check_config(self) -> bool:
+        """Recarrega tudo se o config.py mudou desde a última verificação; devolve True quando recarregou"""
+        mtime = os.path.getmtime(config.__file__)
+        if mtime == self._config_mtime:
+            return False
+        self._config_mtime = mtime
+        if self._config_fingerprint() == self._fingerprint:
+            return False
+        self.reload()
+        return True
+
+    def reload(self):
+        """Recarrega o config e recria os recursos baratos (LLM, memória, cache, roteador e grafo) com os novos valores
+
+        Modelo de embeddings, processador de documentos e pool de índices continuam: sessões vivas guardam CorpusIndex
+        que apontam para eles, e recriá-los exigiria carregar o modelo de novo. As configurações lidas só por eles
+        valem a partir do próximo início do processo.
+        """
+        with self._lock:
+            self._close(_RELOADABLE_RESOURCES)
+            importlib.reload(config)
+            for name in _RELOADABLE_MODULES:
+                module = sys.modules.get(name)
+                if module is not None:
+                    importlib.reload(module)
+            self._fingerprint = self._config_fingerprint()
+            self.reloads += 1
+
+    def close(self):
+        """Fecha todos os recursos (fim do processo)"""
+        with self._lock:
+            self._close(list(self._resources))
+
+    def _close(self, names):
+        # O grafo primeiro: ele usa os outros recursos
+        for name in sorted(names, key=lambda n: n != "workflow"):
+            resource = self._resources.pop(name, None)
+            self._load_ms.pop(name, None)
+            close = getattr(resource, "close", None)
+            if close is None:
+                continue
+            try:
+                close()
+            except Exception as e:
+                print(f"[ERRO] Falha ao fechar o recurso {name}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "recursos": {name: round(ms, 1) for name, ms in self._load_ms.items()},
+                "recarregamentos": self.reloads,
+            }
+
+
+registry = ResourceRegistry()
@@ -0,0 +1,172 @@
+"""
+Cache semântico de respostas para o Agente de Estudos
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Sequence, Union
+
+import numpy as np
+from config import (
+    RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL, RESPONSE_CACHE_SIMILARITY, RESPONSE_CACHE_PATH
+)
+
+
+@dataclass
+class CacheEntry:
+    key: str
+    scope: str
+    route: str
+    question: str
+    answer: str
+    vector: Optional[np.ndarray]
+    created_at: float
+    latency_ms: float
+
+
+def _normalize_question(question: str) -> str:
+    return " ".join(question.lower().split())
+
+
+class ResponseCache:
+    """Cache em dois níveis (texto exato e similaridade de embeddings) com LRU, TTL e persistência opcional"""
+
+    def __init__(self, embedding_model=None, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+                 ttl: float = RESPONSE_CACHE_TTL, threshold: float = RESPONSE_CACHE_SIMILARITY,
+                 path: Optional[str] = RESPONSE_CACHE_PATH):
+        self.embedding_model = embedding_model
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.latency_saved_ms = 0.0
+        self._conn = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS respostas (key TEXT PRIMARY KEY, scope TEXT, route TEXT, question TEXT, "
+                "answer TEXT, vector BLOB, created_at REAL, latency_ms REAL)"
+            )
+            self._conn.commit()
+            self._load()
+
+    @staticmethod
+    def key_for(scope: str, question: str) -> str:
+        return hashlib.sha256(f"{scope}\x00{_normalize_question(question)}".encode("utf-8")).hexdigest()
+
+    def _load(self):
+        cutoff = time.time() - self.ttl
+        self._conn.execute("DELETE FROM respostas WHERE created_at < ?", (cutoff,))
+        self._conn.commit()
+        rows = self._conn.execute(
+            "SELECT key, scope, route, question, answer, vector, created_at, latency_ms FROM respostas "
+            "ORDER BY created_at DESC LIMIT ?", (self.max_entries,)
+        ).fetchall()
+        for key, scope, route, question, answer, blob, created_at, latency_ms in reversed(rows):
+            vector = np.frombuffer(blob, dtype=np.float32) if blob else None
+            self._entries[key] = CacheEntry(key, scope, route, question, answer, vector, created_at, latency_ms)
+
+    def _embed(self, question: str) -> Optional[np.ndarray]:
+        if self.embedding_model is None:
+            return None
+        vector = np.asarray(self.embedding_model.embed_query(question), dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _expired(self, entry: CacheEntry, now: float) -> bool:
+        return now - entry.created_at > self.ttl
+
+    def _remove(self, key: str):
+        self._entries.pop(key, None)
+        if self._conn is not None:
+            self._conn.execute("DELETE FROM respostas WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def lookup(self, scope: Union[str, Sequence[str]], question: str,
+               route: Optional[str] = None) -> Optional[CacheEntry]:
+        """Procura uma resposta para a pergunta no escopo (documentos) informado
+
+        Com uma sequência de escopos, procura em ordem de prioridade e conta um único hit ou miss.
+        """
+        now = time.time()
+        query, embedded = None, False
+        for current in ((scope,) if isinstance(scope, str) else scope):
+            key = self.key_for(current, question)
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and self._expired(entry, now):
+                    self._remove(key)
+                    entry = None
+                if entry is not None and (route is None or entry.route == route):
+                    self._entries.move_to_end(key)
+                    self.exact_hits += 1
+                    self.latency_saved_ms += entry.latency_ms
+                    return entry
+                candidates = [
+                    e for e in self._entries.values()
+                    if e.scope == current and e.vector is not None and (route is None or e.route == route)
+                ]
+            if candidates and not embedded:
+                query, embedded = self._embed(question), True
+            if not candidates or query is None:
+                continue
+            similarities = np.stack([e.vector for e in candidates]) @ query
+            best = int(np.argmax(similarities))
+            entry = candidates[best]
+            if similarities[best] >= self.threshold and not self._expired(entry, now):
+                with self._lock:
+                    if entry.key in self._entries:
+                        self._entries.move_to_end(entry.key)
+                    self.semantic_hits += 1
+                    self.latency_saved_ms += entry.latency_ms
+                return entry
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store(self, scope: str, question: str, route: str, answer: str, latency_ms: float):
+        entry = CacheEntry(
+            self.key_for(scope, question), scope, route, question, answer,
+            self._embed(question), time.time(), latency_ms
+        )
+        with self._lock:
+            self._entries[entry.key] = entry
+            self._entries.move_to_end(entry.key)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO respostas VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (entry.key, scope, route, question, answer,
+                     entry.vector.tobytes() if entry.vector is not None else None,
+                     entry.created_at, latency_ms)
+                )
+                self._conn.commit()
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "entradas": len(self._entries),
+                "hits_exatos": self.exact_hits,
+                "hits_semanticos": self.semantic_hits,
+                "misses": self.misses,
+                "taxa_acerto": round((self.exact_hits + self.semantic_hits) / lookups, 3) if lookups else 0.0,
+                "latencia_economizada_ms": round(self.latency_saved_ms, 1),
+            }
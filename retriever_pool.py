@@ -0,0 +1,216 @@
+"""
+Pool de índices FAISS compartilhados entre sessões, com contagem de referências e orçamento de memória
+"""
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from config import RETRIEVER_POOL_MAX_MB
+from lexical_index import lexical_index_of
+from pdf_source import PdfSource
+from telemetry import telemetry
+from vector_index import index_bytes
+
+
+def resident_bytes(vectorstore) -> int:
+    """Estimativa da memória de um shard: índice FAISS, textos do docstore e índice BM25"""
+    texts = sum(len(vectorstore.docstore.search(doc_id).page_content)
+                for doc_id in vectorstore.index_to_docstore_id.values())
+    lexical_index = lexical_index_of(vectorstore)
+    return index_bytes(vectorstore.index) + texts + (lexical_index.nbytes if lexical_index is not None else 0)
+
+
+@dataclass(eq=False)
+class _Entry:
+    pdf_hash: str
+    cache_key: str
+    vectorstore: Any = None  # None enquanto em ingestão ou depois de sair da RAM
+    job: Any = None
+    refs: int = 0
+    last_access: float = field(default_factory=time.monotonic)
+    nbytes: int = 0
+    chunk_count: int = 0
+    started: bool = False
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class PoolLease:
+    """Referência de uma sessão a um índice do pool; release() a devolve (chamadas repetidas são ignoradas)"""
+
+    def __init__(self, pool: "RetrieverPool", entry: _Entry):
+        self.pool = pool
+        self.pdf_hash = entry.pdf_hash
+        self.job = entry.job
+        self._entry = entry
+        self._released = False
+
+    def vectorstore(self):
+        """Índice do documento, recarregado do cache em disco se tiver saído da RAM"""
+        return self.pool._vectorstore(self._entry)
+
+    @property
+    def chunk_count(self) -> int:
+        return self._entry.chunk_count
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.pool._release(self._entry)
+
+
+class RetrieverPool:
+    """Um índice por PDF (hash do conteúdo) para todas as sessões do processo
+
+    Sessões que enviam o mesmo PDF compartilham o mesmo índice somente leitura e a mesma ingestão. Quando a soma
+    dos índices em memória passa de max_mb, os menos usados recentemente saem da RAM (os sem referências
+    primeiro); os que ainda têm referências voltam do IndexCache no próximo uso, por isso a entrada deles no
+    disco fica protegida da limpeza do cache.
+    """
+
+    def __init__(self, processor, max_mb: float = RETRIEVER_POOL_MAX_MB):
+        self.processor = processor
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _Entry] = {}
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = 0
+
+    def acquire(self, pdf_hash: str, source) -> PoolLease:
+        """Referência ao índice do PDF; só o primeiro pedido de cada PDF carrega o cache ou inicia a ingestão
+
+        source é o PDF (caminho, bytes, stream ou PdfSource) e só é lido por quem inicia a ingestão.
+        """
+        with self._lock:
+            entry = self._entries.get(pdf_hash)
+            if entry is not None and entry.job is not None and entry.job.error is not None:
+                entry = None  # A ingestão anterior falhou: tenta de novo
+            hit = entry is not None
+            if not hit:
+                entry = _Entry(pdf_hash, self.processor.index_cache.key_for(pdf_hash))
+                self._entries[pdf_hash] = entry
+            entry.refs += 1
+            entry.last_access = time.monotonic()
+            self.processor.index_cache.pinned.add(entry.cache_key)
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        telemetry.count("pool_indices", resultado="hit" if hit else "miss")
+        with entry.lock:
+            if not entry.started:
+                try:
+                    vectorstore, entry.job = self.processor.start_ingestion(source, pdf_hash)
+                except Exception:
+                    self._discard(entry)
+                    raise
+                if vectorstore is not None:
+                    self._set_resident(entry, vectorstore)
+                entry.started = True
+            elif isinstance(source, PdfSource):
+                source.close()  # Índice já compartilhado: o upload repetido não é usado
+        lease = PoolLease(self, entry)
+        self._evict(keep=entry)
+        return lease
+
+    def _discard(self, entry: _Entry):
+        with self._lock:
+            if self._entries.get(entry.pdf_hash) is entry:
+                del self._entries[entry.pdf_hash]
+            self.processor.index_cache.pinned.discard(entry.cache_key)
+
+    @staticmethod
+    def _set_resident(entry: _Entry, vectorstore):
+        entry.nbytes = resident_bytes(vectorstore)
+        entry.chunk_count = vectorstore.index.ntotal
+        entry.vectorstore = vectorstore
+
+    def _adopt(self, entry: _Entry):
+        """Assume o índice de uma ingestão concluída; o job deixa de apontar para ele, para a RAM ser liberada
+        quando o pool o descartar"""
+        with entry.lock:
+            job = entry.job
+            if job is None or not job.done or job.error is not None:
+                return
+            if job.vectorstore is not None:
+                self._set_resident(entry, job.vectorstore)
+                job.vectorstore = None
+            entry.job = None
+
+    def _adopt_finished(self):
+        for entry in [e for e in list(self._entries.values()) if e.job is not None and e.job.done]:
+            self._adopt(entry)
+
+    def _vectorstore(self, entry: _Entry):
+        entry.last_access = time.monotonic()
+        job = entry.job
+        if job is not None:
+            if not job.done or job.error is not None:
+                return job.vectorstore  # Ainda em ingestão: quem consulta segura o lock do job
+            self._evict(keep=entry)  # Assume o índice do job e já o conta no orçamento
+        vectorstore = entry.vectorstore
+        if vectorstore is not None:
+            return vectorstore
+        with entry.lock:
+            vectorstore = entry.vectorstore
+            if vectorstore is None:
+                vectorstore = self.processor.index_cache.load(entry.cache_key, self.processor.embedding_model)
+                if vectorstore is None:
+                    print(f"[ERRO] Índice {entry.cache_key[:12]} saiu da memória e não está mais no cache em disco")
+                    return None
+                self._set_resident(entry, vectorstore)
+                with self._lock:
+                    self.reloads += 1
+                telemetry.count("pool_indices", resultado="recarga")
+        self._evict(keep=entry)
+        return vectorstore
+
+    def _release(self, entry: _Entry):
+        with self._lock:
+            entry.refs -= 1
+            if entry.refs > 0:
+                return
+            self.processor.index_cache.pinned.discard(entry.cache_key)
+            # Sem referências, fica na RAM enquanto couber (outra sessão pode enviar o mesmo PDF)
+            if entry.vectorstore is None and (entry.job is None or entry.job.done):
+                if self._entries.get(entry.pdf_hash) is entry:
+                    del self._entries[entry.pdf_hash]
+
+    def _evict(self, keep: Optional[_Entry] = None):
+        """Tira da RAM os índices menos usados recentemente até caber no orçamento"""
+        self._adopt_finished()
+        with self._lock:
+            resident = [e for e in self._entries.values() if e.vectorstore is not None]
+            total = sum(e.nbytes for e in resident)
+            for entry in sorted(resident, key=lambda e: (e.refs > 0, e.last_access)):
+                if total <= self.max_bytes:
+                    break
+                if entry is keep or (entry.refs and not self.processor.index_cache.contains(entry.cache_key)):
+                    continue
+                entry.vectorstore = None
+                total -= entry.nbytes
+                self.evictions += 1
+                telemetry.count("pool_indices", resultado="remocao")
+                if not entry.refs:
+                    del self._entries[entry.pdf_hash]
+                print(f"[DEBUG] Índice {entry.cache_key[:12]} removido da memória ({entry.nbytes / 2 ** 20:.1f} MB)")
+
+    def stats(self) -> Dict[str, Any]:
+        self._evict()
+        with self._lock:
+            resident = [e for e in self._entries.values() if e.vectorstore is not None]
+            lookups = self.hits + self.misses
+            return {
+                "indices": len(self._entries),
+                "residentes": len(resident),
+                "referencias": sum(e.refs for e in self._entries.values()),
+                "memoria_mb": round(sum(e.nbytes for e in resident) / 2 ** 20, 1),
+                "orcamento_mb": round(self.max_bytes / 2 ** 20, 1),
+                "hits": self.hits,
+                "misses": self.misses,
+                "taxa_acerto": self.hits / lookups if lookups else 0.0,
+                "recargas": self.reloads,
+                "remocoes": self.evictions,
+            }
@@ -0,0 +1,24 @@
+"""
+Divisão de texto em sentenças, compatível com o SemanticChunker
+"""
+import re
+from typing import List
+
+# Mesma regex e buffer usados pelo SemanticChunker, para reencontrar os vetores das sentenças
+SENTENCE_SPLIT_REGEX = r"(?<=[.?!])\s+"
+SENTENCE_BUFFER_SIZE = 1
+
+
+def split_sentences(text: str) -> List[str]:
+    return re.split(SENTENCE_SPLIT_REGEX, text)
+
+
+def combine_sentences(sentences: List[str], buffer_size: int = SENTENCE_BUFFER_SIZE) -> List[str]:
+    """Reproduz as sentenças combinadas (com vizinhas) que o SemanticChunker embeda"""
+    combined = []
+    for i, sentence in enumerate(sentences):
+        before = sentences[max(0, i - buffer_size):i]
+        after = sentences[i + 1:i + 1 + buffer_size]
+        text = "".join(s + " " for s in before) + sentence + "".join(" " + s for s in after)
+        combined.append(text)
+    return combined
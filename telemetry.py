@@ -0,0 +1,202 @@
+"""
+Telemetria do Agente de Estudos: spans com tempos e atributos, métricas em texto Prometheus e traces em JSONL
+"""
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from config import TELEMETRY_ENABLED, TELEMETRY_TRACE_PATH
+
+# Limites (em segundos) dos buckets dos histogramas de duração
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RECENT_TRACES = 100  # Traces mantidos em memória para consulta (painel de depuração)
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: Optional[str]
+    span_id: str
+    parent_id: Optional[str]
+    start: float
+    duration_ms: float = 0.0
+    status: str = "ok"
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+class _Trace:
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: List[Span] = []
+        self.lock = threading.Lock()
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+
+_current_trace: contextvars.ContextVar[Optional[_Trace]] = contextvars.ContextVar("trace", default=None)
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("span", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items())) + "}"
+
+
+class Telemetry:
+    """Coleta spans aninhados (inclusive entre threads, via contextvars) e agrega métricas por nome"""
+
+    def __init__(self, enabled: bool = TELEMETRY_ENABLED, trace_path: Optional[str] = TELEMETRY_TRACE_PATH):
+        self.enabled = enabled
+        self.trace_path = trace_path
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, _Histogram] = {}
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._traces: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        """Mede um trecho; dentro de um trace o span entra na árvore, fora dele só alimenta as métricas"""
+        if not self.enabled:
+            yield Span(name, None, "", None, time.time(), attributes=attributes)
+            return
+        trace = _current_trace.get()
+        parent = _current_span.get()
+        span = Span(name, trace.trace_id if trace else None, uuid.uuid4().hex[:16],
+                    parent.span_id if parent else None, time.time(), attributes=attributes)
+        token = _current_span.set(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.status = f"erro: {type(e).__name__}"
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            span.duration_ms = elapsed * 1000
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                pass  # Gerador encerrado em outro contexto (ex.: stream abandonado no meio)
+            with self._lock:
+                self._histograms.setdefault(name, _Histogram()).observe(elapsed)
+            if trace is not None:
+                with trace.lock:
+                    trace.spans.append(span)
+
+    @contextmanager
+    def trace(self, name: str, **attributes) -> Iterator[Span]:
+        """Abre um trace (ex.: uma pergunta); ao fechar, ele vira o último trace e vai para o JSONL"""
+        if not self.enabled or _current_trace.get() is not None:
+            with self.span(name, **attributes) as span:
+                yield span
+            return
+        trace = _Trace(uuid.uuid4().hex)
+        token = _current_trace.set(trace)
+        try:
+            with self.span(name, **attributes) as span:
+                yield span
+        finally:
+            try:
+                _current_trace.reset(token)
+            except ValueError:
+                pass  # Gerador encerrado em outro contexto (ex.: stream finalizado pelo event loop)
+            spans = sorted((asdict(s) for s in trace.spans), key=lambda s: s["start"])
+            with self._lock:
+                self._traces[trace.trace_id] = spans
+                while len(self._traces) > RECENT_TRACES:
+                    self._traces.popitem(last=False)
+            if self.trace_path:
+                self._append_trace(spans)
+
+    def _append_trace(self, spans: List[Dict[str, Any]]):
+        directory = os.path.dirname(self.trace_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock, open(self.trace_path, "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span, ensure_ascii=False, default=str) + "\n")
+
+    def observe(self, name: str, seconds: float):
+        """Registra no histograma de `name` uma duração medida fora de um span"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._histograms.setdefault(name, _Histogram()).observe(seconds)
+
+    def count(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    @staticmethod
+    def wrap(fn):
+        """Faz fn rodar em outra thread com o trace e o span atuais como pais"""
+        context = contextvars.copy_context()
+        return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+    def get_trace(self, trace_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._traces.get(trace_id, []))
+
+    def last_trace(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(next(reversed(self._traces.values()), []))
+
+    def prometheus_text(self) -> str:
+        lines = [
+            "# HELP agente_span_seconds Duração dos spans por nome",
+            "# TYPE agente_span_seconds histogram",
+        ]
+        with self._lock:
+            for name, histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    cumulative += count
+                    lines.append(f"agente_span_seconds_bucket{_labels({'span': name, 'le': bound})} {cumulative}")
+                lines.append(f"agente_span_seconds_bucket{_labels({'span': name, 'le': '+Inf'})} {histogram.count}")
+                lines.append(f"agente_span_seconds_sum{_labels({'span': name})} {histogram.total:.6f}")
+                lines.append(f"agente_span_seconds_count{_labels({'span': name})} {histogram.count}")
+            names = sorted({name for name, _ in self._counters})
+            for name in names:
+                lines.append(f"# TYPE agente_{name}_total counter")
+                for (counter, labels), value in sorted(self._counters.items()):
+                    if counter == name:
+                        lines.append(f"agente_{name}_total{_labels(dict(labels))} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._traces.clear()
+
+
+telemetry = Telemetry()
@@ -0,0 +1,8 @@
+"""
+Configuração dos testes: a raiz do repositório entra no sys.path para importar os módulos e os dublês de
+benchmarks/fakes.py, como nos benchmarks
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
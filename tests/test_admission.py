@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api_service import AdmissionController, Overloaded, create_app
+from benchmarks.fakes import HashEmbeddings
+
+
+def test_fila_cheia_recusa_na_hora():
+    async def scenario():
+        controller = AdmissionController("teste", max_concurrent=1, max_queue=0, queue_timeout=1.0)
+        async with controller.slot():
+            with pytest.raises(Overloaded, match="fila_cheia"):
+                controller.check()
+            with pytest.raises(Overloaded, match="fila_cheia"):
+                async with controller.slot():
+                    pass
+        async with controller.slot():  # A vaga foi devolvida
+            pass
+        return controller.stats()
+
+    stats = asyncio.run(scenario())
+    assert (stats["admitidas"], stats["rejeitadas"], stats["executando"], stats["na_fila"]) == (2, 2, 0, 0)
+
+
+def test_espera_esgotada_na_fila():
+    async def scenario():
+        controller = AdmissionController("teste", max_concurrent=1, max_queue=1, queue_timeout=0.05)
+        async with controller.slot():
+            with pytest.raises(Overloaded, match="espera_esgotada"):
+                async with controller.slot():
+                    pass
+        return controller.stats()
+
+    stats = asyncio.run(scenario())
+    assert (stats["rejeitadas"], stats["na_fila"]) == (1, 0)
+
+
+class _Resources:
+    """Só o que as rotas de sessão e de pergunta usam antes do controle de admissão"""
+
+    def embedding_model(self):
+        return HashEmbeddings()
+
+    def workflow(self):
+        raise AssertionError("A pergunta não deveria ter sido admitida")
+
+
+@pytest.mark.parametrize("rota", ["perguntas", "perguntas/stream"])
+def test_servico_sobrecarregado_responde_503(rota):
+    app = create_app(_Resources())
+    service = app.state.service
+    service.questions = AdmissionController("perguntas", max_concurrent=0, max_queue=0, queue_timeout=0.05)
+    client = TestClient(app)
+    session_id = client.post("/sessoes", json={"usuario": "aluno"}).json()["sessao"]
+    service.sessions[session_id].corpus.add_document("doc", "doc.pdf", vectorstore=object())
+
+    response = client.post(f"/sessoes/{session_id}/{rota}", json={"pergunta": "O que é fotossíntese?"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert "fila_cheia" in response.json()["erro"]
@@ -0,0 +1,50 @@
+from langchain_core.documents import Document
+
+from context_packer import ContextPacker, TokenCounter
+
+
+def _packer(budget, **kwargs):
+    return ContextPacker(budget=budget, counter=TokenCounter(None), **kwargs)
+
+
+def test_estimativa_sem_tokenizer_conta_palavras_e_pontuacao():
+    counter = TokenCounter(None)
+    assert not counter.exact
+    assert counter.count("Olá, mundo! Fotossíntese.") == 6
+    assert counter.count("") == 0
+
+
+def test_pacote_respeita_o_orcamento_e_corta_em_fim_de_sentenca():
+    docs = [Document(page_content=f"Frase {i} sobre o tema {i}. Outra frase longa do trecho {i}.") for i in range(10)]
+    packed = _packer(40).pack(docs, "")
+    assert packed.tokens_before > 40
+    assert packed.tokens_after <= 40
+    assert sum(TokenCounter(None).count(d.page_content) for d in packed.docs) == packed.tokens_after
+    assert packed.dropped_chunks + len(packed.docs) == len(docs)
+    for doc in packed.docs:
+        assert doc.page_content.endswith(".")
+
+
+def test_chunks_repetidos_sao_descartados_e_a_ordem_e_mantida():
+    text = "A fotossíntese converte luz em energia química nas folhas das plantas."
+    docs = [Document(page_content=text), Document(page_content="A mitocôndria produz ATP na respiração celular."),
+            Document(page_content=text)]
+    packed = _packer(1000).pack(docs, "")
+    assert [d.page_content for d in packed.docs] == [docs[0].page_content, docs[1].page_content]
+    assert packed.dropped_chunks == 1
+
+
+def test_historico_repetido_ou_ja_presente_nos_chunks_sai_do_prompt():
+    chunk = "A fotossíntese converte luz em energia química nas folhas das plantas."
+    history = "\n".join([
+        "Usuário: o que é fotossíntese?",
+        "Assistente: A fotossíntese converte luz em energia química nas folhas das plantas.",
+        "Usuário: e a respiração celular libera energia da glicose nas mitocôndrias?",
+        "Usuário: e a respiração celular libera energia da glicose nas mitocôndrias?",
+    ])
+    packed = _packer(1000).pack([Document(page_content=chunk)], history)
+    assert packed.history.splitlines() == [
+        "Usuário: o que é fotossíntese?",
+        "Usuário: e a respiração celular libera energia da glicose nas mitocôndrias?",
+    ]
+    assert packed.dropped_history_lines == 2
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from langchain_community.document_loaders import PyMuPDFLoader
+from langchain_core.documents import Document
+from langchain_experimental.text_splitter import SemanticChunker
+
+from benchmarks.fakes import HashEmbeddings, generate_pdf
+from config import CHUNK_PERCENTILE
+from fast_chunker import FastSemanticChunker, enforce_sizes
+
+
+@pytest.fixture(scope="module")
+def pages(tmp_path_factory):
+    path = generate_pdf(str(tmp_path_factory.mktemp("pdf") / "doc.pdf"), 8, seed=7)
+    return PyMuPDFLoader(path).load()
+
+
+def test_sem_limites_gera_os_mesmos_chunks_do_semantic_chunker(pages):
+    embeddings = HashEmbeddings()
+    reference = SemanticChunker(embeddings, breakpoint_threshold_type="percentile",
+                                breakpoint_threshold_amount=CHUNK_PERCENTILE).split_documents(pages)
+    calls = embeddings.calls
+    fast = FastSemanticChunker(embeddings, min_chars=0, max_chars=0).split_documents(pages)
+    assert embeddings.calls - calls == 1  # Uma chamada de embedding para o lote inteiro
+    assert [c.page_content for c in fast] == [c.page_content for c in reference]
+    assert [c.metadata for c in fast] == [c.metadata for c in reference]
+
+
+def test_limites_de_tamanho_respeitam_fronteiras_de_sentenca():
+    sentences = ["a" * 10, "b" * 10, "c" * 100, "d" * 10, "e" * 30]
+    lengths = np.concatenate([[0], np.cumsum([len(s) for s in sentences])])
+    # Chunks curtos se juntam ao vizinho; o longo é repartido; a sentença maior que o limite fica inteira
+    assert enforce_sizes([(0, 1), (1, 2), (2, 5)], lengths, min_chars=15, max_chars=50) == [(0, 2), (2, 3), (3, 5)]
+    assert enforce_sizes([(0, 4), (4, 5)], lengths, min_chars=40, max_chars=0) == [(0, 5)]
+
+
+def test_modo_janela_nao_usa_embeddings():
+    text = " ".join(f"Esta é a frase número {i} do texto." for i in range(40))
+    chunks = FastSemanticChunker(mode="janela", window_chars=200).split_text(text)
+    assert len(chunks) > 1
+    assert " ".join(chunks) == text
+    assert all(len(c) <= 200 for c in chunks)
+
+
+def test_modo_semantico_exige_embeddings():
+    with pytest.raises(ValueError):
+        FastSemanticChunker(embeddings=None)
+    assert FastSemanticChunker(HashEmbeddings()).split_documents([Document(page_content="   ")]) == []
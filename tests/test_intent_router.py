@@ -0,0 +1,51 @@
+import json
+import os
+
+import pytest
+
+from benchmarks.fakes import HashEmbeddings
+from intent_router import IntentRouter
+
+DATASET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "data",
+                       "router_questions.jsonl")
+# Acurácia mínima do roteador local no conjunto rotulado (a mesma conferida pelo benchmarks/bench_router.py)
+MIN_ACCURACY = 0.85
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    with open(DATASET, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class _LabelLLM:
+    """Classificador via LLM que acerta sempre: mostra quais perguntas o roteador delega"""
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.questions = []
+
+    def classify(self, question):
+        self.questions.append(question)
+        return self.labels[question]
+
+
+def test_roteador_local_concorda_com_os_rotulos(dataset):
+    router = IntentRouter(HashEmbeddings())
+    decisions = [router.route(item["pergunta"]) for item in dataset]
+    accuracy = sum(d.route == item["rota"] for d, item in zip(decisions, dataset)) / len(dataset)
+    assert accuracy >= MIN_ACCURACY
+    assert {d.method for d in decisions} <= {"regra", "embedding"}
+    assert all(d.method != "regra" or d.confidence == 1.0 for d in decisions)
+
+
+def test_baixa_confianca_vai_para_o_llm(dataset):
+    llm = _LabelLLM({item["pergunta"]: item["rota"] for item in dataset})
+    router = IntentRouter(HashEmbeddings(), llm, min_similarity=1.1)
+    decisions = [router.route(item["pergunta"]) for item in dataset]
+    assert all(d.route == item["rota"] for d, item in zip(decisions, dataset))
+    delegated = [item["pergunta"] for d, item in zip(decisions, dataset) if d.method == "llm"]
+    assert delegated == llm.questions
+    # As regras resolvem sem embedding nem LLM
+    assert all(d.method in ("regra", "llm") for d in decisions)
+    assert any(d.method == "regra" for d in decisions)
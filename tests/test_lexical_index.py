@@ -0,0 +1,73 @@
+from langchain_community.vectorstores import FAISS
+
+from benchmarks.fakes import HashEmbeddings
+from corpus_index import CorpusIndex
+from lexical_index import BM25Index, build_lexical_index, tokenize
+
+TEXTS = [
+    "A fotossíntese converte luz em energia química.",
+    "A respiração celular libera energia da glicose.",
+    "Luz, luz e mais luz: a fotossíntese depende da luz.",
+    "O império romano dominou o Mediterrâneo.",
+]
+
+
+def test_tokenize_remove_acentos_e_stopwords():
+    assert tokenize("A Função da Célula é a base") == ["funcao", "celula", "base"]
+    assert tokenize("funcao") == tokenize("função")
+
+
+def test_bm25_ordena_por_frequencia_e_raridade():
+    index = BM25Index()
+    index.add(TEXTS)
+    results = index.search(tokenize("luz"), k=10)
+    assert [position for position, _ in results] == [2, 0]
+    assert index.search(tokenize("império"), k=10)[0][0] == 3
+    assert index.search(tokenize("inexistente"), k=10) == []
+    assert len(index.search(tokenize("energia luz"), k=1)) == 1
+
+
+def test_compactar_salvar_e_carregar_mantem_os_resultados(tmp_path):
+    index = BM25Index()
+    index.add(TEXTS)
+    queries = [tokenize(q) for q in ("luz energia", "fotossíntese", "glicose celular", "romano luz")]
+    expected = [index.search(q, 10) for q in queries]
+    index.compact()
+    assert [index.search(q, 10) for q in queries] == expected
+
+    path = str(tmp_path / "bm25.npz")
+    index.save(path)
+    loaded = BM25Index.load(path)
+    assert len(loaded) == len(TEXTS)
+    assert loaded.vocabulary_size == index.vocabulary_size
+    assert [loaded.search(q, 10) for q in queries] == expected
+
+    # Depois de compactado, o índice ainda aceita novos chunks
+    loaded.add(["Mais luz para a fotossíntese."])
+    assert {p for p, _ in loaded.search(tokenize("luz"), 10)} == {0, 2, 4}
+
+
+def _shard(texts, embeddings):
+    vectorstore = FAISS.from_texts(texts, embeddings)
+    build_lexical_index(vectorstore)
+    return vectorstore
+
+
+def test_busca_hibrida_funde_o_bm25_pela_posicao_em_cada_shard():
+    embeddings = HashEmbeddings()
+    corpus = CorpusIndex(embeddings)
+    # No shard grande o termo é comum (IDF baixo); no pequeno é raro (IDF alto): os scores BM25 não se comparam
+    large = [f"Mitocôndria trecho {i} sobre energia celular." for i in range(30)] + ["Outro assunto."] * 10
+    corpus.add_document("grande", "grande.pdf", vectorstore=_shard(large, embeddings))
+    corpus.add_document("pequeno", "pequeno.pdf", vectorstore=_shard(
+        ["A mitocôndria produz ATP.", "O império romano dominou o Mediterrâneo."] * 20, embeddings))
+
+    query = "mitocôndria"
+    targets = corpus._targets(None)
+    results = corpus._hybrid_search(targets, query, embeddings.embed_query(query), k=2, lexical_weight=1.0)
+    # O primeiro do BM25 de cada shard empata na fusão, independentemente do score bruto
+    assert {d.metadata["doc_id"] for d in results} == {"grande", "pequeno"}
+
+    results = corpus.search("império romano", k=3)
+    assert results and all("império" in d.page_content for d in results)
+    assert all(d.metadata["documento"] == "pequeno.pdf" for d in results)
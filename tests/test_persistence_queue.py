@@ -0,0 +1,97 @@
+import glob
+import os
+import threading
+import time
+
+from persistence_queue import WriteBehindQueue
+
+
+class _Backend:
+    """Backend de memória que pode falhar nas primeiras chamadas, depois de gravar parte do lote"""
+
+    def __init__(self, failures: int = 0, partial: int = 0):
+        self.failures = failures
+        self.partial = partial
+        self.records = []
+        self._lock = threading.Lock()
+
+    def write_batch(self, batch, written):
+        with self._lock:
+            if self.failures:
+                self.failures -= 1
+                for record in batch[:self.partial]:
+                    self.records.append(record)
+                    written.add(record["id"])
+                raise ConnectionError("backend fora do ar")
+            for record in batch:
+                self.records.append(record)
+                written.add(record["id"])
+
+
+def _queue(backend, tmp_path, **kwargs):
+    kwargs.setdefault("max_retries", 3)
+    return WriteBehindQueue(backend.write_batch, journal_path=str(tmp_path / "journal.jsonl"), batch_size=10,
+                            flush_interval=0.01, backoff=0.001, **kwargs)
+
+
+def _journals(tmp_path):
+    return glob.glob(str(tmp_path / "journal-*.jsonl"))
+
+
+def _wait(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Tempo esgotado"
+        time.sleep(0.01)
+
+
+def test_nova_tentativa_reenvia_so_o_que_faltou(tmp_path):
+    backend = _Backend(failures=2, partial=2)
+    queue = _queue(backend, tmp_path)
+    for i in range(5):
+        queue.enqueue({"conteudo": f"mensagem {i}"})
+    assert queue.flush(5)
+    queue.close()
+    contents = [r["conteudo"] for r in backend.records]
+    assert sorted(contents) == [f"mensagem {i}" for i in range(5)]
+    assert len({r["id"] for r in backend.records}) == 5
+    stats = queue.stats()
+    assert (stats["gravados"], stats["falhas"], stats["no_journal"]) == (5, 2, 0)
+    assert not _journals(tmp_path)
+
+
+def test_registros_vao_para_o_journal_e_sao_reenviados_na_proxima_instancia(tmp_path):
+    down = _Backend(failures=10 ** 6)
+    queue = _queue(down, tmp_path, max_retries=1)
+    for i in range(3):
+        queue.enqueue({"conteudo": f"mensagem {i}"})
+    assert queue.flush(5)
+    queue.close()
+    assert queue.stats()["no_journal"] == 3
+    assert _journals(tmp_path)
+
+    backend = _Backend()
+    replay = _queue(backend, tmp_path)
+    _wait(lambda: replay.stats()["reenviados"] == 3)
+    replay.close()
+    assert sorted(r["conteudo"] for r in backend.records) == [f"mensagem {i}" for i in range(3)]
+    assert not _journals(tmp_path)
+    assert not os.path.exists(str(tmp_path / "journal.replay.lock"))
+
+
+def test_close_com_backend_travado_manda_o_lote_em_andamento_para_o_journal(tmp_path):
+    release = threading.Event()
+
+    def stuck(batch, written):
+        written.add(batch[0]["id"])  # O primeiro registro foi confirmado antes de o backend travar
+        release.wait(5)
+
+    queue = WriteBehindQueue(stuck, journal_path=str(tmp_path / "journal.jsonl"), batch_size=10,
+                             flush_interval=0.01, backoff=0.001)
+    for i in range(3):
+        queue.enqueue({"conteudo": f"mensagem {i}"})
+    _wait(lambda: queue.stats()["fila"] == 0)
+    time.sleep(0.05)
+    queue.close(timeout=0.1)
+    release.set()
+    assert queue.stats()["no_journal"] == 2
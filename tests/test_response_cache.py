@@ -0,0 +1,72 @@
+import time
+
+from benchmarks.fakes import HashEmbeddings
+from response_cache import ResponseCache
+
+
+def _cache(**kwargs):
+    kwargs.setdefault("max_entries", 10)
+    kwargs.setdefault("ttl", 3600)
+    kwargs.setdefault("threshold", 0.9)
+    return ResponseCache(path=None, **kwargs)
+
+
+def test_hit_exato_ignora_caixa_e_espacos():
+    cache = _cache()
+    cache.store("docs", "O que é fotossíntese?", "explicar", "resposta", 120.0)
+    entry = cache.lookup("docs", "  o que é   FOTOSSÍNTESE? ")
+    assert entry is not None and entry.answer == "resposta"
+    assert cache.lookup("outros-docs", "O que é fotossíntese?") is None
+    assert cache.lookup("docs", "O que é fotossíntese?", route="resumir") is None
+    stats = cache.stats()
+    assert (stats["hits_exatos"], stats["misses"]) == (1, 2)
+
+
+def test_hit_semantico_com_embeddings():
+    cache = _cache(embedding_model=HashEmbeddings(), threshold=0.8)
+    cache.store("docs", "explique a fotossíntese nas plantas", "explicar", "resposta", 50.0)
+    assert cache.lookup("docs", "explique a fotossíntese nas plantas verdes").answer == "resposta"
+    assert cache.lookup("docs", "qual a capital do império romano") is None
+    assert cache.stats()["hits_semanticos"] == 1
+
+
+def test_lru_remove_a_entrada_menos_usada():
+    cache = _cache(max_entries=2)
+    cache.store("docs", "pergunta 1", "explicar", "r1", 1.0)
+    cache.store("docs", "pergunta 2", "explicar", "r2", 1.0)
+    assert cache.lookup("docs", "pergunta 1") is not None  # Passa a ser a mais recente
+    cache.store("docs", "pergunta 3", "explicar", "r3", 1.0)
+    assert cache.lookup("docs", "pergunta 2") is None
+    assert cache.lookup("docs", "pergunta 1") is not None
+    assert cache.lookup("docs", "pergunta 3") is not None
+    assert cache.stats()["entradas"] == 2
+
+
+def test_ttl_expira_a_entrada(monkeypatch):
+    cache = _cache(ttl=60)
+    cache.store("docs", "pergunta", "explicar", "resposta", 1.0)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.lookup("docs", "pergunta") is None
+    assert cache.stats()["entradas"] == 0
+
+
+def test_escopos_em_ordem_de_prioridade_contam_um_unico_acesso():
+    cache = _cache(embedding_model=HashEmbeddings())
+    cache.store("docs", "pergunta", "explicar", "compartilhada", 1.0)
+    cache.store("aluno:docs", "pergunta", "explicar", "pessoal", 1.0)
+    assert cache.lookup(("aluno:docs", "docs"), "pergunta").answer == "pessoal"
+    assert cache.lookup(("outro:docs", "docs"), "pergunta").answer == "compartilhada"
+    assert cache.lookup(("outro:docs", "docs"), "outra coisa") is None
+    stats = cache.stats()
+    assert (stats["hits_exatos"], stats["misses"]) == (2, 1)
+
+
+def test_persistencia_recarrega_as_entradas(tmp_path):
+    path = str(tmp_path / "respostas.sqlite")
+    cache = ResponseCache(max_entries=10, ttl=3600, threshold=0.9, path=path)
+    cache.store("docs", "pergunta", "explicar", "resposta", 1.0)
+    cache.close()
+    reloaded = ResponseCache(max_entries=10, ttl=3600, threshold=0.9, path=path)
+    assert reloaded.lookup("docs", "pergunta").answer == "resposta"
+    reloaded.close()
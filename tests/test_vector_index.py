@@ -0,0 +1,41 @@
+import faiss
+import numpy as np
+import pytest
+
+from benchmarks.bench_vector_index import _recall, synthetic_vectors
+from vector_index import INDEX_MODES, build_index, restricted_search_params
+
+# Recall@k mínimo contra a busca exata em cada modo (os aproximados trocam um pouco de recall por memória/latência)
+MIN_RECALL = {"flat": 1.0, "ivf": 0.95, "hnsw": 0.95, "pq": 0.8, "int8": 0.95}
+K = 4
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    vectors = synthetic_vectors(20000, 64, clusters=64)
+    # Consultas próximas de vetores do índice, como no benchmarks/bench_vector_index.py
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), 200, replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, K)
+    return vectors, queries, truth
+
+
+@pytest.mark.parametrize("mode", INDEX_MODES)
+def test_recall_contra_o_indice_exato(dataset, mode):
+    vectors, queries, truth = dataset
+    index = build_index(vectors, mode)
+    assert index.ntotal == len(vectors)
+    _, found = index.search(queries, K)
+    assert _recall(found, truth) >= MIN_RECALL[mode]
+
+
+@pytest.mark.parametrize("mode", INDEX_MODES)
+def test_busca_restrita_so_devolve_as_posicoes_permitidas(dataset, mode):
+    vectors, queries, _ = dataset
+    index = build_index(vectors, mode)
+    allowed = np.arange(0, len(vectors), 7, dtype=np.int64)
+    _, found = index.search(queries[:20], K, params=restricted_search_params(index, allowed))
+    assert np.isin(found[found >= 0], allowed).all()
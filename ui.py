@@ -1,67 +1,233 @@
 import streamlit as st
-import tempfile
-from document_processor import DocumentProcessor
-from memory_manager import MemoryManager
-from llm_service import LLMService
-from workflow_engine import WorkflowEngine, GraphState
+import json
+from datetime import datetime, time, timezone
+from corpus_index import CorpusIndex
+from index_cache import hash_pdf
+from resource_registry import ResourceRegistry, registry
+from telemetry import telemetry
+from workflow_engine import GraphState
 from langchain.embeddings import HuggingFaceEmbeddings
 
 class StudyAgentUI:
-    def __init__(self):
-        self.memory_manager = MemoryManager()
-        self.llm_service = LLMService()
-        self.doc_processor = DocumentProcessor()
-        self.workflow = WorkflowEngine(self.memory_manager, self.llm_service)
+    def __init__(self, resources: ResourceRegistry = registry):
+        # Os recursos pesados vivem no registro do processo: um rerun só busca as referências
+        if resources.check_config():
+            st.toast("config.py alterado: recursos recarregados")
+        self.llm_service = resources.llm_service()
+        self.doc_processor = resources.document_processor()
+        self.retriever_pool = resources.retriever_pool()
+        self.memory_manager = resources.memory_manager()
+        self.workflow = resources.workflow()
+        self.question_bank = resources.question_bank()
 
     def run(self):
         st.title("Agente de Estudos!")
-        upload_file = st.file_uploader("Envie um PDF", type=".pdf", key="pdf_uploader_unique")
-        
-        # Só processa o PDF se for um novo upload
-        if upload_file is not None:
-            if "last_uploaded_filename" not in st.session_state or \
-               st.session_state.last_uploaded_filename != upload_file.name:
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                    tmp.write(upload_file.read())
-                    pdf_path = tmp.name
-                with st.spinner("Carregando e processando documento..."):
-                    chunks = self.doc_processor.load_and_chunk(pdf_path)
-                    retriever = self.doc_processor.create_retriever(chunks)
-                st.session_state.retriever = retriever
-                st.session_state.last_uploaded_filename = upload_file.name
-                st.success("Documento processado com sucesso!")
-        retriever = st.session_state.get("retriever", None)
+        if "corpus" not in st.session_state:
+            st.session_state.corpus = CorpusIndex(self.doc_processor.embedding_model)
+            st.session_state.seen_uploads = set()
+            st.session_state.ingestion_jobs = []
+        corpus = st.session_state.corpus
+        upload_files = st.file_uploader(
+            "Envie um ou mais PDFs", type=".pdf", key="pdf_uploader_unique", accept_multiple_files=True
+        )
+
+        # Só processa os PDFs que ainda não foram adicionados ao corpus
+        current_hashes = set()
+        for upload_file in upload_files or []:
+            pdf_bytes = upload_file.getvalue()
+            pdf_hash = hash_pdf(pdf_bytes)
+            current_hashes.add(pdf_hash)
+            if pdf_hash in st.session_state.seen_uploads:
+                continue
+            st.session_state.seen_uploads.add(pdf_hash)
+            with st.spinner(f"Carregando e processando {upload_file.name}..."):
+                # Lido direto da memória (uploads grandes vão para a área temporária gerenciada)
+                source = self.doc_processor.pdf_source(pdf_bytes, name=upload_file.name)
+                # Índice compartilhado com as outras sessões que enviaram o mesmo PDF
+                lease = self.retriever_pool.acquire(pdf_hash, source)
+                job = lease.job
+                if job is not None and not job.done:
+                    # Libera as perguntas assim que o primeiro lote estiver indexado
+                    job.wait_first_batch()
+                    st.session_state.ingestion_jobs.append((upload_file.name, job))
+            document = corpus.add_document(pdf_hash, upload_file.name, lease=lease,
+                                           metadata={"tamanho_bytes": len(pdf_bytes)})
+            if self.question_bank is not None:
+                # Perguntas prontas para os pedidos de quiz, geradas quando a ingestão terminar
+                self.question_bank.schedule(document)
+            if job is None or job.done:
+                st.success(f"{upload_file.name} processado com sucesso!")
+        # Arquivos retirados do uploader podem ser enviados de novo depois
+        st.session_state.seen_uploads &= current_hashes
+
+        selected_ids = self._document_selector(corpus)
+        retriever = corpus.as_retriever() if len(corpus) else None
 
         user_input = st.text_input("Digite sua pergunta ou peça por uma questão:")
         # Removido campo de resposta opcional
         if st.button("Executar") and user_input and retriever:
-            flow = self.workflow.build_graph()
             initial_state: GraphState = {
                 "pergunta": user_input,
                 "retriever": retriever,
+                "documentos": selected_ids,
                 # "resposta_usuario": user_answere,  # Removido
                 "memoria": [],
                 "resposta": "",
                 # "avaliacao": ""  # Removido
             }
-            resultado = flow.invoke(initial_state)
-            if "resposta" in resultado and resultado["resposta"]:
-                st.subheader("Resposta")
-                st.write(resultado["resposta"])
+            st.subheader("Resposta")
+            answer_stream = self.workflow.stream_answer(initial_state)
+            st.write_stream(answer_stream)
+            if answer_stream.ttft_ms is not None:
+                origem = " · resposta do cache" if answer_stream.result.get("cache_hit") else ""
+                st.caption(
+                    f"⏱️ Primeiro token: {answer_stream.ttft_ms / 1000:.2f} s · "
+                    f"Total: {answer_stream.total_ms / 1000:.2f} s{origem}"
+                )
+            st.session_state.last_trace_id = answer_stream.trace_id
             # Removido bloco de avaliação
         if st.button("🔍 Ver memória"):
-            all_results = self.memory_manager.list_all_memories()
-            if all_results:
-                st.subheader(f"🧠 Conteúdo da memória ({len(all_results)} itens):")
-                for r in all_results:
-                    messages = r.get("messages", [])
-                    if messages:
-                        for msg in messages:
-                            role = msg.get("role", "unknown")
-                            content = msg.get("content", "")
-                            st.markdown(f"- **{r.get('created_at', '')}** [{role}]: {content[:200]}...")
-                    else:
-                        content = r.get('message', r.get('memory', ''))
-                        st.markdown(f"- **{r.get('created_at', '')}** ➜ {content[:200]}...")
+            st.session_state.memory_open = True
+        if st.session_state.get("memory_open"):
+            self._memory_browser()
+        if st.sidebar.checkbox("🔧 Painel de depuração", key="debug_panel"):
+            self._debug_panel()
+        self._follow_ingestion()
+
+    def _debug_panel(self):
+        """Tempo de cada etapa da última pergunta desta sessão e exportação das métricas"""
+        st.subheader("🔧 Última requisição")
+        trace_id = st.session_state.get("last_trace_id")
+        spans = telemetry.get_trace(trace_id) if trace_id else []
+        if not spans:
+            st.info("Faça uma pergunta para ver o detalhamento.")
+        else:
+            depth = {None: -1}
+            for span in spans:  # Ordenados pelo início: o pai sempre vem antes dos filhos
+                depth[span["span_id"]] = depth.get(span["parent_id"], -1) + 1
+            st.dataframe(
+                [
+                    {
+                        "etapa": "\u2003" * depth[span["span_id"]] + span["name"],
+                        "ms": round(span["duration_ms"], 1),
+                        "status": span["status"],
+                        "detalhes": ", ".join(f"{k}={v}" for k, v in span["attributes"].items()),
+                    }
+                    for span in spans
+                ],
+                hide_index=True,
+                use_container_width=True
+            )
+            st.download_button(
+                "Baixar trace (JSONL)", "".join(json.dumps(s, ensure_ascii=False) + "\n" for s in spans),
+                file_name=f"trace_{trace_id}.jsonl"
+            )
+        with st.expander("Métricas (Prometheus)"):
+            st.code(telemetry.prometheus_text(), language="text")
+
+    def _memory_browser(self):
+        """Mostra a memória página a página, com filtros de papel e período"""
+        st.subheader("🧠 Conteúdo da memória")
+        col_role, col_period = st.columns(2)
+        roles = {"Todos": None, "Usuário": "user", "Assistente": "assistant"}
+        role = roles[col_role.selectbox("Papel", list(roles), key="memory_role")]
+        period = col_period.date_input("Período", value=(), key="memory_period")
+        start = end = None
+        if len(period) >= 1:
+            start = datetime.combine(period[0], time.min, tzinfo=timezone.utc)
+        if len(period) == 2:
+            end = datetime.combine(period[1], time.max, tzinfo=timezone.utc)
+
+        # Filtros novos recomeçam a listagem da primeira página
+        filters = (role, start, end)
+        if st.session_state.get("memory_filters") != filters:
+            st.session_state.memory_filters = filters
+            page = self.memory_manager.list_memories(start=start, end=end, role=role)
+            st.session_state.memory_items = page.items
+            st.session_state.memory_cursor = page.next_cursor
+
+        items = st.session_state.memory_items
+        if not items:
+            st.warning("Nenhum item encontrado na memória.")
+            return
+        for r in items:
+            messages = r.get("messages", [])
+            if messages:
+                for msg in messages:
+                    msg_role = msg.get("role", "unknown")
+                    content = msg.get("content", "")
+                    st.markdown(f"- **{r.get('created_at', '')}** [{msg_role}]: {content[:200]}...")
+            else:
+                content = r.get('message', r.get('memory', ''))
+                prefix = f" [{r['role']}]" if r.get("role") else ""
+                st.markdown(f"- **{r.get('created_at', '')}**{prefix} ➜ {content[:200]}...")
+        st.caption(f"{len(items)} itens carregados")
+        if st.session_state.memory_cursor is not None and st.button("Carregar mais"):
+            page = self.memory_manager.list_memories(
+                cursor=st.session_state.memory_cursor, start=start, end=end, role=role
+            )
+            st.session_state.memory_items = items + page.items
+            st.session_state.memory_cursor = page.next_cursor
+            st.rerun()
+
+    def _document_selector(self, corpus: CorpusIndex):
+        """Lista os documentos do corpus, permite removê-los e escolher quais consultar"""
+        documents = corpus.documents()
+        if not documents:
+            return None
+        with st.sidebar:
+            st.subheader(f"📚 Documentos ({len(documents)})")
+            for document in documents:
+                col_name, col_remove = st.columns([4, 1])
+                bank = self.question_bank.status(document.doc_id) if self.question_bank is not None else None
+                col_name.markdown(f"**{document.name}** · {document.chunk_count} chunks"
+                                  + (f" · banco: {bank}" if bank else ""))
+                if col_remove.button("🗑️", key=f"remover_{document.doc_id}"):
+                    corpus.remove_document(document.doc_id)
+                    st.rerun()
+            if self.workflow.response_cache is not None:
+                stats = self.workflow.response_cache.stats()
+                st.caption(
+                    f"Cache de respostas: {stats['taxa_acerto']:.0%} de acerto · "
+                    f"{stats['latencia_economizada_ms'] / 1000:.1f} s economizados"
+                )
+            pool = self.retriever_pool.stats()
+            st.caption(
+                f"Índices em memória: {pool['residentes']}/{pool['indices']} · "
+                f"{pool['memoria_mb']:.0f} de {pool['orcamento_mb']:.0f} MB · {pool['taxa_acerto']:.0%} compartilhados"
+            )
+            persistence = self.memory_manager.persistence_stats()
+            if persistence is not None:
+                st.caption(
+                    f"Memória: {persistence['fila']} na fila · {persistence['falhas']} falhas · "
+                    f"{persistence['no_journal']} no journal · flush médio {persistence['flush_medio_ms']:.0f} ms"
+                )
+        names = {d.doc_id: d.name for d in documents}
+        selected = st.multiselect(
+            "Consultar apenas estes documentos (vazio = todos):",
+            options=list(names),
+            format_func=names.get
+        )
+        return selected or None
+
+    def _follow_ingestion(self):
+        """Acompanha as ingestões em segundo plano; qualquer interação do usuário interrompe a espera"""
+        jobs = st.session_state.get("ingestion_jobs", [])
+        for name, job in jobs:
+            if not job.done:
+                with st.spinner(f"Carregando e processando {name}... (já é possível fazer perguntas)"):
+                    bar = st.progress(job.progress)
+                    while not job.wait(0.5):
+                        bar.progress(job.progress, text=f"{job.pages_done}/{job.total_pages} páginas indexadas")
+                    bar.empty()
+            if job.error is not None:
+                st.error(f"Falha ao processar {name}: {job.error}")
             else:
-                st.warning("Nenhum item encontrado na memória.") 
\ No newline at end of file
+                st.success(f"{name} processado com sucesso!")
+                stats = job.stats()
+                st.caption(
+                    f"Ingestão ({stats['modo']}): {stats['paginas_por_s']} páginas/s · "
+                    f"{stats['chunks_por_s']} chunks/s · {stats['segundos']} s · "
+                    f"primeira página em {(stats['primeira_pagina_ms'] or 0) / 1000:.2f} s"
+                )
+        st.session_state.ingestion_jobs = []
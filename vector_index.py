@@ -0,0 +1,108 @@
+"""
+Índices FAISS comprimidos ou aproximados (IVF, HNSW, PQ, int8) para corpora grandes
+"""
+import math
+from contextlib import nullcontext
+
+import faiss
+import numpy as np
+from config import (
+    VECTOR_INDEX_MODE, VECTOR_INDEX_MIN_VECTORS, VECTOR_INDEX_TRAIN_SAMPLE, VECTOR_INDEX_NLIST,
+    VECTOR_INDEX_NPROBE, VECTOR_INDEX_HNSW_M, VECTOR_INDEX_HNSW_EF_SEARCH, VECTOR_INDEX_PQ_M
+)
+from telemetry import telemetry
+
+INDEX_MODES = ("flat", "ivf", "hnsw", "pq", "int8")
+
+
+def _nlist(n_vectors: int) -> int:
+    nlist = VECTOR_INDEX_NLIST or int(4 * math.sqrt(n_vectors))
+    # O k-means do FAISS pede ~39 pontos de treino por lista
+    return max(1, min(nlist, n_vectors // 39))
+
+
+def _pq_m(dim: int) -> int:
+    return max(m for m in range(1, min(VECTOR_INDEX_PQ_M, dim) + 1) if dim % m == 0)
+
+
+def new_index(mode: str, dim: int, n_vectors: int) -> faiss.Index:
+    """Índice vazio do modo pedido, com a métrica L2 usada pelo vectorstore do LangChain"""
+    if mode == "flat":
+        return faiss.IndexFlatL2(dim)
+    if mode == "ivf":
+        return faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, _nlist(n_vectors))
+    if mode == "hnsw":
+        return faiss.IndexHNSWFlat(dim, VECTOR_INDEX_HNSW_M)
+    if mode == "pq":
+        return faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, _nlist(n_vectors), _pq_m(dim), 8)
+    if mode == "int8":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+    raise ValueError(f"Modo de índice desconhecido: {mode} (use um de {', '.join(INDEX_MODES)})")
+
+
+def configure_search(index: faiss.Index) -> faiss.Index:
+    """Aplica os parâmetros de busca, que o FAISS não grava junto com o índice (nprobe) ou que mudaram no config"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(VECTOR_INDEX_NPROBE, ivf.nlist)
+    hnsw = getattr(faiss.downcast_index(index), "hnsw", None)
+    if hnsw is not None:
+        hnsw.efSearch = VECTOR_INDEX_HNSW_EF_SEARCH
+    return index
+
+
+def restricted_search_params(index: faiss.Index, ids: np.ndarray) -> faiss.SearchParameters:
+    """Parâmetros de busca que limitam o resultado às posições em ids, preservando nprobe/efSearch do índice"""
+    selector = faiss.IDSelectorBatch(ids)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    hnsw = getattr(faiss.downcast_index(index), "hnsw", None)
+    if hnsw is not None:
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+def build_index(vectors: np.ndarray, mode: str = VECTOR_INDEX_MODE, seed: int = 0) -> faiss.Index:
+    """Treina o índice numa amostra dos vetores (quando o modo exige) e adiciona todos na ordem original"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n_vectors, dim = vectors.shape
+    index = new_index(mode, dim, n_vectors)
+    with telemetry.span("indice.construir", modo=mode, vetores=n_vectors) as span:
+        if not index.is_trained:
+            sample = vectors
+            if n_vectors > VECTOR_INDEX_TRAIN_SAMPLE:
+                rows = np.random.default_rng(seed).choice(n_vectors, VECTOR_INDEX_TRAIN_SAMPLE, replace=False)
+                sample = vectors[np.sort(rows)]
+            index.train(sample)
+            span.set(amostra_treino=len(sample))
+        index.add(vectors)
+    return configure_search(index)
+
+
+def compress_vectorstore(vectorstore, mode: str = VECTOR_INDEX_MODE, min_vectors: int = VECTOR_INDEX_MIN_VECTORS,
+                         lock=None):
+    """Troca o índice exato do vectorstore pelo do modo configurado, mantendo as posições (e o docstore)
+
+    Shards abaixo de min_vectors continuam flat: a busca exata neles já leva menos de um milissegundo. O novo
+    índice é treinado fora de `lock` e só a troca da referência acontece dentro dele.
+    """
+    index = vectorstore.index
+    if mode == "flat" or index.ntotal < min_vectors or not isinstance(index, faiss.IndexFlat):
+        return vectorstore
+    try:
+        compressed = build_index(index.reconstruct_n(0, index.ntotal), mode)
+    except RuntimeError as e:
+        # Ex.: poucos vetores para treinar os 256 centróides de cada subvetor do PQ
+        print(f"[ERRO] Falha ao criar o índice {mode}; mantendo o índice exato: {e}")
+        return vectorstore
+    with lock if lock is not None else nullcontext():
+        vectorstore.index = compressed
+    print(f"[DEBUG] Índice {mode} criado com {index.ntotal} vetores")
+    return vectorstore
+
+
+def index_bytes(index: faiss.Index) -> int:
+    """Tamanho serializado do índice, aproximação da memória residente"""
+    return int(faiss.serialize_index(index).size)
+
@@ -1,33 +1,270 @@
 from langgraph.graph import StateGraph, END
-from typing import TypedDict, Any, List, Dict
+from langchain_core.runnables import RunnableLambda
+from langgraph.config import get_stream_writer
+from typing import TypedDict, Any, List, Dict, Optional, Tuple
 from memory_manager import MemoryManager
-from llm_service import LLMService
+from llm_service import LLMService, SIMPLE_RESPONSE, STREAM_INTERRUPTED
 from langdetect import detect
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from telemetry import telemetry
+from context_packer import ContextPacker
+from question_generation import QuestionFanOut, number_questions
+from config import USER_ID, CONTEXT_PACKING_ENABLED, QUESTION_MODE, QUESTION_MAX, RESPONSE_CACHE_ROUTES, CONTEXT_WORKERS, RETRIEVAL_TIMEOUT, MEMORY_TIMEOUT, LANGDETECT_TIMEOUT
+import asyncio
 import re
+import threading
+import time
 
 class GraphState(TypedDict):
     pergunta: str
     retriever: Any
+    documentos: Optional[List[str]]  # IDs dos documentos consultados (None = todos)
     resposta_usuario: str
     memoria: List[Any]
     resposta: str
     avaliacao: str
+    stream: bool  # Quando True, os nós emitem os tokens da resposta conforme chegam
+    cache_hit: bool
+    usuario: str  # ID do usuário dono da memória (ausente = USER_ID do config)
+
+class AnswerStream:
+    """Iterador de tokens de uma execução do grafo; ao final expõe o estado e as latências"""
+
+    def __init__(self, flow, state: GraphState):
+        self.flow = flow
+        self.state = state
+        self.result: Dict = {}
+        self.ttft_ms = None
+        self.total_ms = None
+        self.trace_id = None
+
+    def __iter__(self):
+        start = time.perf_counter()
+        streamed = False
+        with telemetry.trace("pergunta", modo="stream") as span:
+            self.trace_id = span.trace_id
+            for mode, chunk in self.flow.stream({**self.state, "stream": True}, stream_mode=["custom", "values"]):
+                if mode == "custom" and "token" in chunk:
+                    if self.ttft_ms is None:
+                        self.ttft_ms = (time.perf_counter() - start) * 1000
+                    streamed = True
+                    yield chunk["token"]
+                elif mode == "values":
+                    self.result = chunk
+            if not streamed and self.result.get("resposta"):
+                # Nenhum nó transmitiu tokens (ex.: resposta pronta); entrega o texto inteiro de uma vez
+                self.ttft_ms = (time.perf_counter() - start) * 1000
+                yield self.result["resposta"]
+            self.total_ms = (time.perf_counter() - start) * 1000
+            span.set(primeiro_token_ms=round(self.ttft_ms or 0.0, 1), cache_hit=bool(self.result.get("cache_hit")))
+
+
+class AsyncAnswerStream:
+    """Versão assíncrona do AnswerStream, para servidores asyncio"""
+
+    def __init__(self, flow, state: GraphState):
+        self.flow = flow
+        self.state = state
+        self.result: Dict = {}
+        self.ttft_ms = None
+        self.total_ms = None
+        self.trace_id = None
+
+    async def __aiter__(self):
+        start = time.perf_counter()
+        streamed = False
+        with telemetry.trace("pergunta", modo="astream") as span:
+            self.trace_id = span.trace_id
+            async for mode, chunk in self.flow.astream({**self.state, "stream": True}, stream_mode=["custom", "values"]):
+                if mode == "custom" and "token" in chunk:
+                    if self.ttft_ms is None:
+                        self.ttft_ms = (time.perf_counter() - start) * 1000
+                    streamed = True
+                    yield chunk["token"]
+                elif mode == "values":
+                    self.result = chunk
+            if not streamed and self.result.get("resposta"):
+                self.ttft_ms = (time.perf_counter() - start) * 1000
+                yield self.result["resposta"]
+            self.total_ms = (time.perf_counter() - start) * 1000
+            span.set(primeiro_token_ms=round(self.ttft_ms or 0.0, 1), cache_hit=bool(self.result.get("cache_hit")))
+
 
 class WorkflowEngine:
-    def __init__(self, memory_manager: MemoryManager, llm_service: LLMService):
+    def __init__(self, memory_manager: MemoryManager, llm_service: LLMService, router=None, response_cache=None,
+                 context_packer: Optional[ContextPacker] = None, question_bank=None):
         self.memory_manager = memory_manager
         self.llm_service = llm_service
+        self.router = router
+        self.response_cache = response_cache
+        if context_packer is None and CONTEXT_PACKING_ENABLED:
+            context_packer = ContextPacker()
+        self.context_packer = context_packer
+        self.question_fanout = QuestionFanOut(llm_service, self._fanout_prompt) if QUESTION_MODE == "fanout" else None
+        self.question_bank = question_bank
+        self._executor = ThreadPoolExecutor(max_workers=CONTEXT_WORKERS, thread_name_prefix="contexto")
+        self._graph = None
+        self._graph_lock = threading.Lock()
 
     def route_input(self, state: GraphState) -> str:
         question = state["pergunta"]
-        return self.llm_service.classify(question)
+        with telemetry.span("roteamento") as span:
+            if self.router is not None:
+                decision = self.router.route(question)
+                span.set(rota=decision.route, metodo=decision.method, confianca=round(decision.confidence, 3))
+                return decision.route
+            route = self.llm_service.classify(question)
+            span.set(rota=route, metodo="llm")
+            return route
 
-    def explanation_node(self, state: GraphState) -> Dict:
-        question = state["pergunta"]
-        docs = state["retriever"].get_relevant_documents(question)
+    def _cache_scope(self, state: GraphState, personal: bool = False) -> Optional[str]:
+        """Escopo do cache: os documentos consultados e, se o prompt levou o histórico do usuário, o usuário"""
+        if self.response_cache is None:
+            return None
+        scope_key = getattr(self._retriever_for(state), "scope_key", None)
+        scope = scope_key() if scope_key else None
+        if scope is None or not personal:
+            return scope
+        return f"{state.get('usuario') or USER_ID}:{scope}"
+
+    def cache_lookup_node(self, state: GraphState) -> Dict:
+        """Responde do cache quando possível, sem classificação nem chamada ao LLM"""
+        with telemetry.span("no.verificar_cache") as span:
+            scope = self._cache_scope(state)
+            if scope is None:
+                span.set(resultado="sem_escopo")
+                return {"cache_hit": False}
+            # Primeiro a resposta própria do usuário, depois a compartilhada pela turma. Troca aceita: quem tem
+            # histórico recebe a resposta compartilhada (gerada sem histórico) em vez de uma personalizada
+            entry = self.response_cache.lookup((self._cache_scope(state, personal=True), scope), state["pergunta"])
+            span.set(resultado="hit" if entry is not None else "miss")
+            telemetry.count("cache_respostas", resultado="hit" if entry is not None else "miss")
+            if entry is None:
+                return {"cache_hit": False}
+            return {"resposta": entry.answer, "cache_hit": True}
+
+    def _after_cache(self, state: GraphState) -> str:
+        return END if state.get("cache_hit") else self.route_input(state)
+
+    def _remember(self, state: GraphState, route: str, answer: str, started: float, history: str):
+        if route not in RESPONSE_CACHE_ROUTES or not answer or answer == SIMPLE_RESPONSE \
+                or answer.endswith(STREAM_INTERRUPTED):
+            return  # A resposta simples ou interrompida de quando o LLM falha não vai para o cache
+        # Sem histórico no prompt a resposta depende só dos documentos e serve para toda a turma
+        scope = self._cache_scope(state, personal=bool(history and history.strip()))
+        if scope is not None:
+            self.response_cache.store(scope, state["pergunta"], route, answer, (time.perf_counter() - started) * 1000)
+
+    def _generate(self, state: GraphState, prompt: str) -> str:
+        """Chama o LLM; em modo streaming repassa cada token ao consumidor do grafo"""
+        if not state.get("stream"):
+            return self.llm_service.call(prompt)
+        writer = get_stream_writer()
+        tokens = []
+        for token in self.llm_service.stream(prompt):
+            tokens.append(token)
+            writer({"token": token})
+        return "".join(tokens)
+
+    async def _agenerate(self, state: GraphState, prompt: str) -> str:
+        if not state.get("stream"):
+            return await self.llm_service.acall(prompt)
+        writer = get_stream_writer()
+        tokens = []
+        async for token in self.llm_service.astream(prompt):
+            tokens.append(token)
+            writer({"token": token})
+        return "".join(tokens)
+
+    def _context_sources(self, state: GraphState, retrieval_query: str, memory_query: str, language_text: str):
+        """(nome, função, timeout, valor padrão) de cada fonte de contexto independente; sem retrieval_query não busca chunks"""
+        return [
+            ("chunks", lambda: self._retrieve(state, retrieval_query) if retrieval_query else [], RETRIEVAL_TIMEOUT, []),
+            ("memória", lambda: self.memory_manager.search_relevant_memories(memory_query, state.get("usuario")), MEMORY_TIMEOUT, ""),
+            ("idioma", lambda: detect(language_text) if language_text else "pt", LANGDETECT_TIMEOUT, "pt" if not language_text else ""),
+        ]
+
+    @staticmethod
+    def _traced_source(name: str, fn):
+        """Envolve a fonte num span filho do nó atual, mesmo rodando numa thread do pool"""
+        def run():
+            with telemetry.span(f"contexto.{name}") as span:
+                result = fn()
+                if isinstance(result, list):
+                    span.set(itens=len(result))
+                return result
+        return telemetry.wrap(run)
+
+    def _gather_context(self, state: GraphState, retrieval_query: str, memory_query: str, language_text: str):
+        """Busca chunks, histórico e idioma em paralelo; uma fonte lenta ou com erro vira o valor padrão"""
+        sources = self._context_sources(state, retrieval_query, memory_query, language_text)
+        start = time.monotonic()
+        futures = [self._executor.submit(self._traced_source(name, fn)) for name, fn, _, _ in sources]
+        results = []
+        for (name, _, timeout, default), future in zip(sources, futures):
+            try:
+                results.append(future.result(timeout=max(0.0, start + timeout - time.monotonic())))
+            except FutureTimeoutError:
+                print(f"[DEBUG] Timeout de {timeout}s ao buscar {name}; seguindo sem essa fonte")
+                telemetry.count("contexto_timeouts", fonte=name)
+                results.append(default)
+            except Exception as e:
+                print(f"[ERRO] Falha ao buscar {name}: {e}")
+                telemetry.count("contexto_erros", fonte=name)
+                results.append(default)
+        return results
+
+    async def _agather_context(self, state: GraphState, retrieval_query: str, memory_query: str, language_text: str):
+        async def run(name, fn, timeout, default):
+            try:
+                # Usa o pool da engine: uma fonte travada não prende o executor padrão do loop
+                return await asyncio.wait_for(
+                    loop.run_in_executor(self._executor, self._traced_source(name, fn)), timeout
+                )
+            except asyncio.TimeoutError:
+                print(f"[DEBUG] Timeout de {timeout}s ao buscar {name}; seguindo sem essa fonte")
+                telemetry.count("contexto_timeouts", fonte=name)
+            except Exception as e:
+                print(f"[ERRO] Falha ao buscar {name}: {e}")
+                telemetry.count("contexto_erros", fonte=name)
+            return default
+
+        loop = asyncio.get_running_loop()
+        sources = self._context_sources(state, retrieval_query, memory_query, language_text)
+        return await asyncio.gather(*(run(*source) for source in sources))
+
+    def _retriever_for(self, state: GraphState):
+        retriever = state["retriever"]
+        doc_ids = state.get("documentos")
+        if doc_ids and hasattr(retriever, "with_documents"):
+            retriever = retriever.with_documents(doc_ids)
+        return retriever
+
+    def _retrieve(self, state: GraphState, query: str) -> List:
+        return self._retriever_for(state).get_relevant_documents(query)
+
+    def _packed_prompt(self, span, build_prompt, question: str, docs: List, history: str, idioma: str) -> str:
+        """Monta o prompt com o contexto empacotado no orçamento de tokens e registra o antes/depois"""
+        if self.context_packer is None:
+            return build_prompt(question, docs, history, idioma)
+        with telemetry.span("contexto.empacotar") as pack_span:
+            packed = self.context_packer.pack(docs, history)
+            pack_span.set(
+                tokens_antes=packed.tokens_before, tokens_depois=packed.tokens_after,
+                chunks_descartados=packed.dropped_chunks, chunks_truncados=packed.truncated_chunks,
+                linhas_historico_descartadas=packed.dropped_history_lines,
+                tokenizer_exato=self.context_packer.counter.exact
+            )
+        prompt = build_prompt(question, packed.docs, packed.history, idioma)
+        tokens_after = self.context_packer.counter.count(prompt)
+        tokens_before = tokens_after - packed.tokens_after + packed.tokens_before
+        span.set(tokens_prompt_antes=tokens_before, tokens_prompt_depois=tokens_after)
+        telemetry.count("prompt_tokens", tokens_before, fase="antes")
+        telemetry.count("prompt_tokens", tokens_after, fase="depois")
+        return prompt
+
+    def _explanation_prompt(self, question: str, docs: List, history: str, idioma: str) -> str:
         context = "\n".join([doc.page_content for doc in docs])
-        history = self.memory_manager.search_relevant_memories(question)
-        idioma = detect(question)
         if idioma == "en":
             idioma_instrucao = "Please answer in English."
         elif idioma == "pt":
@@ -59,20 +296,43 @@ class WorkflowEngine:
 
 ---
 🔍 Agora, com base no conteúdo e no histórico, explique a resposta à pergunta acima de forma clara, precisa e amigável. Use exemplos se forem úteis."""
+        return prompt
 
-        answer = self.llm_service.call(prompt)
-        self.memory_manager.save_conversation(question, answer)
-        return {"resposta": answer}
+    def explanation_node(self, state: GraphState) -> Dict:
+        with telemetry.span("no.explicar") as span:
+            started = time.perf_counter()
+            question = state["pergunta"]
+            docs, history, idioma = self._gather_context(state, question, question, question)
+            span.set(chunks=len(docs), idioma=idioma)
+            prompt = self._packed_prompt(span, self._explanation_prompt, question, docs, history, idioma)
+            answer = self._generate(state, prompt)
+            self.memory_manager.save_conversation(question, answer, state.get("usuario"))
+            self._remember(state, "explicar", answer, started, history)
+            return {"resposta": answer}
 
-    def question_generation_node(self, state: GraphState) -> Dict:
-        docs = state["retriever"].get_relevant_documents("Conteúdo Importante!")
-        context = "\n".join([doc.page_content for doc in docs])
-        history = self.memory_manager.search_relevant_memories("gerar perguntas")
-        user_question = state["pergunta"] if "pergunta" in state else ""
-        idioma = detect(user_question) if user_question else "pt"
+    async def aexplanation_node(self, state: GraphState) -> Dict:
+        with telemetry.span("no.explicar") as span:
+            started = time.perf_counter()
+            question = state["pergunta"]
+            docs, history, idioma = await self._agather_context(state, question, question, question)
+            span.set(chunks=len(docs), idioma=idioma)
+            prompt = self._packed_prompt(span, self._explanation_prompt, question, docs, history, idioma)
+            answer = await self._agenerate(state, prompt)
+            await asyncio.to_thread(self.memory_manager.save_conversation, question, answer, state.get("usuario"))
+            self._remember(state, "explicar", answer, started, history)
+            return {"resposta": answer}
+
+    @staticmethod
+    def _requested_questions(user_question: str) -> int:
         # Detectar quantidade de perguntas
         match = re.search(r"(\d+)\s+pergunt", user_question.lower())
-        n_perguntas = int(match.group(1)) if match else 1
+        return min(int(match.group(1)), QUESTION_MAX) if match else 1
+
+    def _question_prompt(self, user_question: str, docs: List, history: str, idioma: str,
+                         n_perguntas: Optional[int] = None) -> str:
+        context = "\n".join([doc.page_content for doc in docs])
+        if n_perguntas is None:
+            n_perguntas = self._requested_questions(user_question)
         if idioma == "en":
             idioma_instrucao = f"Please generate {n_perguntas} multiple-choice question(s) and all alternatives in English."
         elif idioma == "pt":
@@ -121,15 +381,163 @@ Gabarito: Letra X - [resposta correta]
 Inclua o gabarito ao final de cada pergunta no formato:  
 **Gabarito: Letra X - [resposta correta]**
 """
-        question = self.llm_service.call(prompt)
-        self.memory_manager.save_conversation("Me pergunte algo", question)
-        return {"resposta": question}
+        return prompt
+
+    def _fanout_prompt(self, user_question: str, docs: List, history: str, idioma: str, n_perguntas: int) -> str:
+        if self.context_packer is not None:
+            packed = self.context_packer.pack(docs, history)
+            docs, history = packed.docs, packed.history
+        return self._question_prompt(user_question, docs, history, idioma, n_perguntas)
+
+    def _question_emitter(self, state: GraphState):
+        """Repassa cada lote de perguntas ao consumidor do stream, já com a numeração final"""
+        writer = get_stream_writer() if state.get("stream") else None
+        emitted = []
+
+        def emit(blocks: List[str]):
+            text = number_questions(blocks, start=len(emitted) + 1)
+            if writer is not None:
+                writer({"token": ("\n\n" if emitted else "") + text})
+            emitted.extend(blocks)
+        return emit
+
+    def _banked_questions(self, state: GraphState, span, retriever, user_question: str, n: int) -> Optional[str]:
+        if self.question_bank is None or not hasattr(retriever, "document_ids"):
+            return None
+        try:
+            idioma = detect(user_question) if user_question else "pt"
+        except Exception:
+            idioma = "pt"
+        questions = self.question_bank.take(retriever.document_ids(), n, idioma)
+        if questions is None:
+            return None
+        span.set(origem="banco", perguntas=n)
+        answer = number_questions(questions)
+        if state.get("stream"):
+            get_stream_writer()({"token": answer})
+        return answer
+
+    def _fanout_questions(self, state: GraphState, span, retriever, user_question: str) -> Tuple[Optional[str], str]:
+        """(N perguntas em chamadas paralelas sobre grupos de chunks de todo o material ou None para usar o modo
+        único, histórico usado no prompt)"""
+        n = self._requested_questions(user_question)
+        banked = self._banked_questions(state, span, retriever, user_question, n)
+        if banked is not None:
+            return banked, ""
+        chunks = retriever.all_chunks()
+        if not chunks:
+            return None, ""
+        _, history, idioma = self._gather_context(state, None, "gerar perguntas", user_question)
+        blocks = self.question_fanout.generate(user_question, n, chunks, history, idioma,
+                                               on_blocks=self._question_emitter(state))
+        span.set(origem="fanout", perguntas=len(blocks), chunks_disponiveis=len(chunks), idioma=idioma)
+        return (number_questions(blocks) if blocks else None), history
+
+    async def _afanout_questions(self, state: GraphState, span, retriever,
+                                 user_question: str) -> Tuple[Optional[str], str]:
+        n = self._requested_questions(user_question)
+        banked = self._banked_questions(state, span, retriever, user_question, n)
+        if banked is not None:
+            return banked, ""
+        chunks = await asyncio.to_thread(retriever.all_chunks)
+        if not chunks:
+            return None, ""
+        _, history, idioma = await self._agather_context(state, None, "gerar perguntas", user_question)
+        blocks = await self.question_fanout.agenerate(user_question, n, chunks, history, idioma,
+                                                      on_blocks=self._question_emitter(state))
+        span.set(origem="fanout", perguntas=len(blocks), chunks_disponiveis=len(chunks), idioma=idioma)
+        return (number_questions(blocks) if blocks else None), history
+
+    def question_generation_node(self, state: GraphState) -> Dict:
+        with telemetry.span("no.gerar_pergunta") as span:
+            started = time.perf_counter()
+            user_question = state["pergunta"] if "pergunta" in state else ""
+            retriever = self._retriever_for(state)
+            question, history = None, ""
+            if self.question_fanout is not None and hasattr(retriever, "all_chunks"):
+                question, history = self._fanout_questions(state, span, retriever, user_question)
+            if question is None:
+                docs, history, idioma = self._gather_context(state, "Conteúdo Importante!", "gerar perguntas", user_question)
+                span.set(origem="unica", chunks=len(docs), idioma=idioma)
+                prompt = self._packed_prompt(span, self._question_prompt, user_question, docs, history, idioma)
+                question = self._generate(state, prompt)
+            self.memory_manager.save_conversation("Me pergunte algo", question, state.get("usuario"))
+            self._remember(state, "gerar_pergunta", question, started, history)
+            return {"resposta": question}
+
+    async def aquestion_generation_node(self, state: GraphState) -> Dict:
+        with telemetry.span("no.gerar_pergunta") as span:
+            started = time.perf_counter()
+            user_question = state["pergunta"] if "pergunta" in state else ""
+            retriever = self._retriever_for(state)
+            question, history = None, ""
+            if self.question_fanout is not None and hasattr(retriever, "all_chunks"):
+                question, history = await self._afanout_questions(state, span, retriever, user_question)
+            if question is None:
+                docs, history, idioma = await self._agather_context(state, "Conteúdo Importante!", "gerar perguntas", user_question)
+                span.set(origem="unica", chunks=len(docs), idioma=idioma)
+                prompt = self._packed_prompt(span, self._question_prompt, user_question, docs, history, idioma)
+                question = await self._agenerate(state, prompt)
+            await asyncio.to_thread(self.memory_manager.save_conversation, "Me pergunte algo", question,
+                                    state.get("usuario"))
+            self._remember(state, "gerar_pergunta", question, started, history)
+            return {"resposta": question}
 
     def build_graph(self):
         graph = StateGraph(GraphState)
-        graph.add_node("explicar", self.explanation_node)
-        graph.add_node("gerar_pergunta", self.question_generation_node)
-        graph.set_conditional_entry_point(self.route_input)
+        # Cada nó tem versão síncrona (invoke/stream) e assíncrona (ainvoke/astream)
+        graph.add_node("explicar", RunnableLambda(self.explanation_node, afunc=self.aexplanation_node))
+        graph.add_node("gerar_pergunta", RunnableLambda(self.question_generation_node, afunc=self.aquestion_generation_node))
+        graph.add_node("verificar_cache", self.cache_lookup_node)
+        graph.set_entry_point("verificar_cache")
+        graph.add_conditional_edges("verificar_cache", self._after_cache)
         graph.add_edge("explicar", END)
         graph.add_edge("gerar_pergunta", END)
-        return graph.compile() 
\ No newline at end of file
+        return graph.compile()
+
+    @property
+    def graph(self):
+        """Grafo compilado uma única vez e reaproveitado em todas as perguntas"""
+        if self._graph is None:
+            with self._graph_lock:
+                if self._graph is None:
+                    self._graph = self.build_graph()
+        return self._graph
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        if self.question_fanout is not None:
+            self.question_fanout.close()
+
+    def stream_answer(self, state: GraphState) -> AnswerStream:
+        """Executa o grafo em modo streaming; a memória é salva pelos nós quando o stream termina"""
+        return AnswerStream(self.graph, state)
+
+    def astream_answer(self, state: GraphState) -> AsyncAnswerStream:
+        return AsyncAnswerStream(self.graph, state)
+
+    async def ainvoke(self, state: GraphState) -> Dict:
+        """Ponto de entrada assíncrono: executa todo o fluxo do grafo com await"""
+        with telemetry.trace("pergunta", modo="async"):
+            return await self.graph.ainvoke(state)
+
+    async def arun(self, state: GraphState, modo: str = "async") -> Dict:
+        """Como ainvoke, mas devolve também a rota seguida, o tempo de cada nó e o ID do trace"""
+        start = last = time.perf_counter()
+        route, node_ms, result = None, {}, dict(state)
+        with telemetry.trace("pergunta", modo=modo) as span:
+            async for update in self.graph.astream(state, stream_mode="updates"):
+                now = time.perf_counter()
+                for node, values in update.items():
+                    node_ms[node] = round((now - last) * 1000, 1)
+                    result.update(values or {})
+                    if node != "verificar_cache":
+                        route = node
+                last = now
+        return {
+            "resultado": result,
+            "rota": "cache" if result.get("cache_hit") else route,
+            "ms_por_no": node_ms,
+            "ms_total": round((time.perf_counter() - start) * 1000, 1),
+            "trace_id": span.trace_id,
+        } 
\ No newline at end of file